@@ -0,0 +1,136 @@
+"""Controle de admissão das rotas que usam o banco: limita quantas requisições por worker estão com
+uma sessão aberta ao mesmo tempo, e ajusta esse limite pela latência observada.
+
+Quem chega com o limite cheio espera numa fila de no máximo ADMISSAO_FILA requisições, por até
+ADMISSAO_ESPERA segundos; o resto recebe 503 com Retry-After na hora, em vez de todos esperarem
+juntos no pool de conexões e no MySQL. O limite começa na capacidade do pool (DB_POOL_SIZE +
+DB_MAX_OVERFLOW) e segue a razão entre a latência de cada requisição e a latência de base da sua rota
+(a menor observada, que sobe devagar para acompanhar mudanças), assim uma rota naturalmente lenta não
+conta como sobrecarga: enquanto a razão recente fica dentro de ADMISSAO_TOLERANCIA, o limite cresce até
+o máximo; quando o banco satura e as latências sobem, ele encolhe até ADMISSAO_LIMITE_MIN.
+
+As rotas entram no controle pela dependência get_db de main.py, e a exportação, o relatório de coortes
+e a expiração e o arquivamento disparados pelo admin, que abrem as próprias sessões, pedem a vaga na
+própria rota; as que não usam sessão (/, /metrics e as demais rotas de admin), ou usam get_db_isento
+(leituras de planos servidas do cache), ficam de fora.
+"""
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+import asyncio
+import collections
+import math
+import os
+import time
+
+import database
+
+ATIVO = os.getenv("ADMISSAO", "1") == "1"
+LIMITE_MAXIMO = int(os.getenv("ADMISSAO_LIMITE_MAX", str(database.POOL_SIZE + database.MAX_OVERFLOW)))
+LIMITE_MINIMO = int(os.getenv("ADMISSAO_LIMITE_MIN", "2"))
+TAMANHO_FILA = int(os.getenv("ADMISSAO_FILA", "100"))
+ESPERA_MAXIMA = float(os.getenv("ADMISSAO_ESPERA", "1"))
+TOLERANCIA = float(os.getenv("ADMISSAO_TOLERANCIA", "2"))
+
+#Peso de cada amostra na latência recente e no limite, e quanto a latência de base sobe por amostra
+SUAVIZACAO = 0.1
+DERIVA_BASE = 0.001
+
+
+#Usado só no event loop: contadores e fila não precisam de lock
+class ControleAdmissao:
+    def __init__(self, limite_maximo : int = LIMITE_MAXIMO, limite_minimo : int = LIMITE_MINIMO,
+                 tamanho_fila : int = TAMANHO_FILA, espera_maxima : float = ESPERA_MAXIMA,
+                 tolerancia : float = TOLERANCIA, ativo : bool = ATIVO):
+        self.limite_maximo = max(1, limite_maximo)
+        self.limite_minimo = max(1, min(limite_minimo, self.limite_maximo))
+        self.tamanho_fila = tamanho_fila
+        self.espera_maxima = espera_maxima
+        self.tolerancia = tolerancia
+        self.ativo = ativo
+        self.limite = float(self.limite_maximo)
+        self.em_andamento = 0
+        self.admitidas = 0
+        self.enfileiradas = 0
+        self.rejeitadas_fila_cheia = 0
+        self.rejeitadas_espera = 0
+        self.razao_recente = 1.0
+        self.latencia_recente = 0.0
+        self._bases = {}
+        self._fila = collections.deque()
+
+    def _rejeitar(self):
+        #Uma estimativa de quando a fila atual terá sido atendida, em segundos inteiros
+        atendimento = self.latencia_recente * (len(self._fila) + 1) / max(1.0, self.limite)
+        raise HTTPException(status_code=503, detail="Servidor sobrecarregado, tente novamente",
+                            headers={"Retry-After": str(max(1, math.ceil(atendimento)))})
+
+    async def _entrar(self):
+        if self.em_andamento < self.limite and not self._fila:
+            self.em_andamento += 1
+            return
+        if len(self._fila) >= self.tamanho_fila:
+            self.rejeitadas_fila_cheia += 1
+            self._rejeitar()
+        self.enfileiradas += 1
+        vaga = asyncio.get_running_loop().create_future()
+        self._fila.append(vaga)
+        try:
+            await asyncio.wait({vaga}, timeout=self.espera_maxima)
+        except asyncio.CancelledError:
+            #O cliente desistiu: devolve a vaga se ela já tinha sido passada para esta requisição
+            if vaga.done():
+                self._sair()
+            else:
+                self._fila.remove(vaga)
+            raise
+        if not vaga.done():
+            self._fila.remove(vaga)
+            self.rejeitadas_espera += 1
+            self._rejeitar()
+
+    #A vaga de quem sai passa direto para o primeiro da fila que ainda está esperando
+    def _sair(self):
+        self.em_andamento -= 1
+        while self._fila and self.em_andamento < self.limite:
+            self.em_andamento += 1
+            self._fila.popleft().set_result(None)
+
+    #Ajuste por gradiente: limite * tolerância / razão recente (entre 0.5 e 1) mais uma folga de sqrt(limite)
+    #para crescer. Com menos da metade do limite em uso a latência não diz nada sobre ele, e o limite fica como está
+    def _observar(self, rota : str, latencia : float):
+        self.latencia_recente += SUAVIZACAO * (latencia - self.latencia_recente)
+        base = self._bases.get(rota)
+        if base is None:
+            self._bases[rota] = latencia
+            return
+        base = self._bases[rota] = max(1e-6, min(base * (1 + DERIVA_BASE), latencia))
+        self.razao_recente += SUAVIZACAO * (latencia / base - self.razao_recente)
+        if self.em_andamento < self.limite / 2:
+            return
+        gradiente = max(0.5, min(1.0, self.tolerancia / self.razao_recente))
+        alvo = self.limite * gradiente + math.sqrt(self.limite)
+        self.limite = max(self.limite_minimo, min(self.limite_maximo, self.limite + SUAVIZACAO * (alvo - self.limite)))
+
+    @asynccontextmanager
+    async def admitir(self, rota : str):
+        if not self.ativo:
+            yield
+            return
+        await self._entrar()
+        self.admitidas += 1
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observar(rota, time.perf_counter() - inicio)
+            self._sair()
+
+    def estatisticas(self):
+        return {'ativo': self.ativo, 'limite': round(self.limite, 2), 'limite_minimo': self.limite_minimo,
+                'limite_maximo': self.limite_maximo, 'em_andamento': self.em_andamento, 'na_fila': len(self._fila),
+                'admitidas': self.admitidas, 'enfileiradas': self.enfileiradas,
+                'rejeitadas_fila_cheia': self.rejeitadas_fila_cheia, 'rejeitadas_espera': self.rejeitadas_espera,
+                'latencia_recente_s': round(self.latencia_recente, 6), 'razao_latencia_base': round(self.razao_recente, 3)}
+
+
+controle = ControleAdmissao()
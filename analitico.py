@@ -0,0 +1,232 @@
+"""Snapshot colunar das assinaturas para os relatórios de coortes, churn e troca de planos.
+
+As assinaturas, da tabela principal e do arquivo, ficam em memória como arrays NumPy (id, membro,
+plano, data de ativação, ativo, versão), e os relatórios são calculados sobre eles com operações
+vetorizadas, sem agregar sobre o banco a cada requisição. O snapshot é atualizado por chave primária:
+
+- a cada ANALITICO_TTL segundos, lê só as linhas com id maior que o maior id já carregado
+- a cada ANALITICO_RECONCILIAR segundos, compara a contagem e a soma das versões por bloco de
+  ANALITICO_BLOCO ids (agregadas no banco) com as do snapshot, e relê só os blocos que mudaram, o que
+  traz as alterações, exclusões e arquivamentos de linhas antigas
+
+As leituras vão para as réplicas quando configuradas. Cada worker tem o seu snapshot.
+"""
+from datetime import datetime
+import os
+import threading
+import time
+
+import numpy as np
+
+import crud
+import database
+from database import SessionLocal
+
+TTL = float(os.getenv("ANALITICO_TTL", "60"))
+RECONCILIAR = float(os.getenv("ANALITICO_RECONCILIAR", "600"))
+BLOCO = int(os.getenv("ANALITICO_BLOCO", "4096"))
+TAMANHO_LOTE = int(os.getenv("ANALITICO_LOTE", "50000"))
+
+#Colunas do snapshot na ordem de crud.linhas_analiticas; membro e plano ausentes viram 0
+COLUNAS = [('id_assinatura', np.int64), ('id_membro', np.int64), ('id_plano', np.int64),
+           ('ativacao', 'datetime64[s]'), ('ativo', np.bool_), ('versao', np.int64), ('arquivada', np.bool_)]
+
+
+def vazias():
+    return {nome: np.empty(0, dtype=tipo) for nome, tipo in COLUNAS}
+
+def para_colunas(linhas : list):
+    if not linhas:
+        return vazias()
+    valores = list(zip(*linhas))
+    colunas = {}
+    for (nome, tipo), coluna in zip(COLUNAS, valores):
+        if nome == 'ativacao':
+            colunas[nome] = np.array(coluna, dtype=tipo)
+        else:
+            colunas[nome] = np.fromiter((valor or 0 for valor in coluna), dtype=tipo, count=len(coluna))
+    return colunas
+
+def juntar(*partes):
+    return {nome: np.concatenate([parte[nome] for parte in partes]) for nome, _ in COLUNAS}
+
+def filtrar(colunas : dict, mascara):
+    return {nome: valores[mascara] for nome, valores in colunas.items()}
+
+#Mesmo resumo de crud.resumo_blocos_analiticos, calculado sobre o snapshot: {início do bloco: (contagem, soma das versões)},
+#ou só (contagem,) sem versões
+def resumo_blocos(blocos, versoes):
+    inicios, indices = np.unique(blocos, return_inverse=True)
+    contagens = np.bincount(indices, minlength=len(inicios)).tolist()
+    if versoes is None:
+        return {inicio: (contagem,) for inicio, contagem in zip(inicios.tolist(), contagens)}
+    somas = np.bincount(indices, weights=versoes, minlength=len(inicios)).astype(np.int64).tolist()
+    return {inicio: (contagem, soma) for inicio, contagem, soma in zip(inicios.tolist(), contagens, somas)}
+
+def mes_rotulo(mes : int):
+    return f"{1970 + mes // 12:04d}-{mes % 12 + 1:02d}"
+
+
+class SnapshotAssinaturas:
+    def __init__(self, ttl : float = TTL, reconciliar : float = RECONCILIAR, bloco : int = BLOCO, tamanho_lote : int = TAMANHO_LOTE):
+        self.ttl = ttl
+        self.reconciliar = reconciliar
+        self.bloco = bloco
+        self.tamanho_lote = tamanho_lote
+        self.colunas = vazias()
+        self.atualizado_em = None
+        self.atualizacoes = 0
+        self.linhas_lidas = 0
+        self.blocos_relidos = 0
+        self.segundos_ultima_atualizacao = 0.0
+        self._atualizado = None
+        self._reconciliado = None
+        self._calculados = None
+        self._lock = threading.Lock()
+
+    #Linhas com id maior que o último carregado, em lotes pela chave primária
+    def _novas(self, db, colunas : dict):
+        ids = colunas['id_assinatura']
+        after = int(ids[-1]) if len(ids) else 0
+        partes = [colunas]
+        while True:
+            linhas = crud.linhas_analiticas(db, after=after, limit=self.tamanho_lote)
+            self.linhas_lidas += len(linhas)
+            if linhas:
+                partes.append(para_colunas(linhas))
+                after = linhas[-1][0]
+            if len(linhas) < self.tamanho_lote:
+                break
+        return juntar(*partes) if len(partes) > 1 else colunas
+
+    #Relê os blocos de ids cujo resumo (contagem e soma das versões) no banco difere do snapshot
+    def _reconciliar(self, db, colunas : dict):
+        principal, arquivo = crud.resumo_blocos_analiticos(db, self.bloco)
+        blocos = colunas['id_assinatura'] - colunas['id_assinatura'] % self.bloco
+        arquivada = colunas['arquivada']
+        locais_principal = resumo_blocos(blocos[~arquivada], colunas['versao'][~arquivada])
+        locais_arquivo = resumo_blocos(blocos[arquivada], None)
+        mudaram = {inicio for inicio in principal.keys() | locais_principal.keys()
+                   if tuple(principal.get(inicio, (0, 0))) != locais_principal.get(inicio, (0, 0))}
+        mudaram |= {inicio for inicio in arquivo.keys() | locais_arquivo.keys()
+                    if tuple(arquivo.get(inicio, (0,))) != locais_arquivo.get(inicio, (0,))}
+        #Blocos acima do maior id carregado ficam para _novas
+        ids = colunas['id_assinatura']
+        mudaram = sorted(inicio for inicio in mudaram if len(ids) and inicio <= ids[-1])
+        if not mudaram:
+            return colunas
+        partes = [filtrar(colunas, ~np.isin(blocos, mudaram))]
+        for inicio in mudaram:
+            linhas = crud.linhas_analiticas(db, after=inicio - 1, ate=inicio + self.bloco, limit=2 * self.bloco)
+            self.linhas_lidas += len(linhas)
+            partes.append(para_colunas(linhas))
+        self.blocos_relidos += len(mudaram)
+        colunas = juntar(*partes)
+        return filtrar(colunas, np.argsort(colunas['id_assinatura'], kind='stable'))
+
+    def atualizar(self, forcar : bool = False):
+        with self._lock:
+            agora = time.monotonic()
+            if not forcar and self._atualizado is not None and agora - self._atualizado < self.ttl:
+                return
+            token = database.ler_da_replica.set(True)
+            db = SessionLocal()
+            try:
+                colunas = self.colunas
+                if len(colunas['id_assinatura']) == 0:
+                    self._reconciliado = agora
+                elif forcar or agora - self._reconciliado >= self.reconciliar:
+                    colunas = self._reconciliar(db, colunas)
+                    self._reconciliado = agora
+                colunas = self._novas(db, colunas)
+            finally:
+                db.close()
+                database.ler_da_replica.reset(token)
+            self.colunas = colunas
+            self._atualizado = time.monotonic()
+            self.atualizacoes += 1
+            self.segundos_ultima_atualizacao = round(self._atualizado - agora, 4)
+            self.atualizado_em = datetime.now().replace(microsecond=0)
+
+    def estatisticas(self):
+        return {'linhas': len(self.colunas['id_assinatura']), 'atualizado_em': self.atualizado_em,
+                'atualizacoes': self.atualizacoes, 'linhas_lidas': self.linhas_lidas,
+                'blocos_relidos': self.blocos_relidos, 'segundos_ultima_atualizacao': self.segundos_ultima_atualizacao}
+
+    #Os relatórios só mudam quando o snapshot muda: uma atualização sem linhas novas nem blocos alterados
+    #mantém o mesmo dicionário de colunas, e o resultado calculado para ele é reaproveitado
+    def relatorio(self, meses : int = 12):
+        self.atualizar()
+        colunas = self.colunas
+        calculados = self._calculados
+        if calculados is None or calculados[0] is not colunas:
+            calculados = self._calculados = (colunas, {})
+        if meses not in calculados[1]:
+            inicio = time.perf_counter()
+            calculados[1][meses] = {'coortes': coortes(colunas, meses), 'churn': churn_por_plano(colunas),
+                                    'trocas_de_plano': trocas_de_plano(colunas),
+                                    'segundos_calculo': round(time.perf_counter() - inicio, 4)}
+        return {**calculados[1][meses], 'snapshot': self.estatisticas()}
+
+
+#Coorte de um membro é o mês da sua primeira ativação; a retenção no mês k é a fração dos membros da
+#coorte que ativaram alguma assinatura k meses depois dela (k = 0 é sempre 1). Os arrays por membro são
+#indexados direto pelo id_membro, o que evita ordenar para agrupar. Uma assinatura arquivada não conta
+#como ativa, ainda que tenha sido arquivada com ativo=1 (a cascata de exclusão arquiva as ativas também)
+def coortes(colunas : dict, meses : int):
+    validas = colunas['id_membro'] > 0
+    if not validas.any():
+        return []
+    membro = colunas['id_membro'][validas]
+    mes = colunas['ativacao'][validas].astype('datetime64[M]').astype(np.int64)
+    sem_ativacao = np.iinfo(np.int64).max
+    primeiro = np.full(int(membro.max()) + 1, sem_ativacao)
+    np.minimum.at(primeiro, membro, mes)
+    presentes = primeiro != sem_ativacao
+    inicios, coorte_presentes = np.unique(primeiro[presentes], return_inverse=True)
+    coorte = np.full(len(primeiro), -1)
+    coorte[presentes] = coorte_presentes
+    membros = np.bincount(coorte_presentes, minlength=len(inicios))
+    vigentes = (colunas['ativo'] & ~colunas['arquivada'])[validas]
+    com_ativa = np.bincount(membro, weights=vigentes, minlength=len(primeiro)) > 0
+    ativos = np.bincount(coorte[com_ativa], minlength=len(inicios))
+    deslocamento = mes - primeiro[membro]
+    dentro = deslocamento < meses
+    pares = np.unique(membro[dentro] * meses + deslocamento[dentro])
+    retidos = np.bincount(coorte[pares // meses] * meses + pares % meses,
+                          minlength=len(inicios) * meses).reshape(len(inicios), meses)
+    mes_atual = int(np.datetime64(datetime.now(), 'M').astype(np.int64))
+    return [{'coorte': mes_rotulo(inicio), 'membros': int(total), 'ativos': int(ativos_coorte),
+             'retencao': np.round(linha[:max(1, min(meses, mes_atual - inicio + 1))] / total, 4).tolist()}
+            for inicio, total, ativos_coorte, linha in zip(inicios.tolist(), membros, ativos, retidos)]
+
+def churn_por_plano(colunas : dict):
+    validas = colunas['id_plano'] > 0
+    planos, plano = np.unique(colunas['id_plano'][validas], return_inverse=True)
+    total = np.bincount(plano, minlength=len(planos))
+    vigentes = (colunas['ativo'] & ~colunas['arquivada'])[validas]
+    ativas = np.bincount(plano, weights=vigentes, minlength=len(planos)).astype(np.int64)
+    arquivadas = np.bincount(plano, weights=colunas['arquivada'][validas], minlength=len(planos)).astype(np.int64)
+    return [{'id_plano': id_plano, 'assinaturas': int(t), 'ativas': int(a), 'arquivadas': int(arq), 'churn': round(1 - a / t, 4)}
+            for id_plano, t, a, arq in zip(planos.tolist(), total, ativas, arquivadas)]
+
+#Matriz de transições entre assinaturas consecutivas (pela data de ativação) de um mesmo membro:
+#matriz[i][j] conta as trocas de planos[i] para planos[j]; a diagonal são renovações no mesmo plano
+def trocas_de_plano(colunas : dict):
+    validas = (colunas['id_membro'] > 0) & (colunas['id_plano'] > 0)
+    membro, plano = colunas['id_membro'][validas], colunas['id_plano'][validas]
+    #Uma única chave (membro, ativação) ordenada de forma estável: empates na data ficam na ordem de id
+    ativacao = colunas['ativacao'][validas].astype(np.int64)
+    if len(ativacao):
+        ativacao = ativacao - ativacao.min()
+    ordem = np.argsort(membro * (1 << 32) + ativacao, kind='stable')
+    membro, plano = membro[ordem], plano[ordem]
+    planos = np.unique(plano)
+    mesmo_membro = membro[1:] == membro[:-1]
+    de = np.searchsorted(planos, plano[:-1][mesmo_membro])
+    para = np.searchsorted(planos, plano[1:][mesmo_membro])
+    matriz = np.bincount(de * len(planos) + para, minlength=len(planos) ** 2).reshape(len(planos), len(planos))
+    return {'planos': planos.tolist(), 'matriz': matriz.tolist()}
+
+
+snapshot = SnapshotAssinaturas()
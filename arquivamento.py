@@ -0,0 +1,61 @@
+"""Arquivamento de assinaturas: move as inativas (ativo = 0) ativadas há mais de ARQUIVO_DIAS dias da
+tabela assinaturas para assinaturas_arquivadas, que só é lida com include_archived=true.
+
+Move até ARQUIVO_LOTE linhas por transação (copia e apaga no mesmo commit), para manter a tabela
+principal e seus índices só com os dados que as rotas usam no dia a dia. Pode ser executado pela
+linha de comando, por exemplo num cron depois da expiração:
+
+    python arquivamento.py --lote 1000 --dias 30
+
+ou periodicamente dentro do app, com ARQUIVO_INTERVALO (segundos) maior que zero. Como na
+expiração, rodar em vários workers é seguro, mas com vários workers prefira o cron.
+"""
+from datetime import datetime, timedelta
+from starlette.concurrency import run_in_threadpool
+import argparse
+import asyncio
+import logging
+import os
+
+import crud
+from database import SessionLocal
+
+TAMANHO_LOTE = int(os.getenv("ARQUIVO_LOTE", "1000"))
+INTERVALO = float(os.getenv("ARQUIVO_INTERVALO", "0"))
+#Carência antes de arquivar: uma assinatura inativa recente ainda pode ser reativada por PATCH
+DIAS = float(os.getenv("ARQUIVO_DIAS", "30"))
+
+logger = logging.getLogger(__name__)
+
+#Resultado da última execução neste processo, exposto em GET /admin/arquivo
+ultima_execucao = None
+
+
+def arquivar(tamanho_lote : int = TAMANHO_LOTE, dias : float = DIAS):
+    global ultima_execucao
+    db = SessionLocal()
+    try:
+        resultado = crud.arquivar_assinaturas(db, antes_de=datetime.now() - timedelta(days=dias), tamanho_lote=tamanho_lote)
+    finally:
+        db.close()
+    resultado['em'] = datetime.now().replace(microsecond=0)
+    ultima_execucao = resultado
+    return resultado
+
+#Tarefa do lifespan: arquiva no threadpool a cada intervalo; uma falha é registrada e a próxima rodada tenta de novo
+async def executar_periodicamente(intervalo : float = INTERVALO):
+    while True:
+        try:
+            await run_in_threadpool(arquivar)
+        except Exception:
+            logger.exception("Falha ao arquivar assinaturas")
+        await asyncio.sleep(intervalo)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="linhas movidas por transação")
+    parser.add_argument("--dias", type=float, default=DIAS, help="arquiva as inativas ativadas há mais de tantos dias")
+    args = parser.parse_args()
+    for nome, valor in arquivar(args.lote, args.dias).items():
+        print(nome, valor)
@@ -7,13 +7,21 @@ CREATE TABLE membros (
     nome VARCHAR(30) NOT NULL,
     sobrenome VARCHAR(30) NOT NULL,
     celular BIGINT,
-    PRIMARY KEY (id_membro)
+    nome_busca VARCHAR(255),
+    sobrenome_busca VARCHAR(255),
+    versao INT NOT NULL DEFAULT 1,
+    PRIMARY KEY (id_membro),
+    UNIQUE INDEX ix_membros_celular (celular),
+    INDEX ix_membros_nome_busca (nome_busca),
+    INDEX ix_membros_sobrenome_busca (sobrenome_busca)
 );
 
 CREATE TABLE planos (
     id_plano INT NOT NULL AUTO_INCREMENT,
     nome VARCHAR(30) NOT NULL,
-    preco VARCHAR(30) NOT NULL,
+    preco DECIMAL(10,2) NOT NULL,
+    duracao_dias INT,
+    versao INT NOT NULL DEFAULT 1,
     PRIMARY KEY (id_plano)
 );
 
@@ -23,13 +31,57 @@ CREATE TABLE assinaturas (
     id_plano INT NOT NULL,
     data_ativacao DATETIME NOT NULL,
     ativo TINYINT NOT NULL,
+    versao INT NOT NULL DEFAULT 1,
     PRIMARY KEY (id_assinatura),
+    INDEX ix_assinaturas_data_ativacao (data_ativacao),
+    INDEX ix_assinaturas_ativo_plano_data (ativo, id_plano, data_ativacao),
     FOREIGN KEY (id_membro) REFERENCES membros(id_membro),
     FOREIGN KEY (id_plano) REFERENCES planos(id_plano)
 );
 
+CREATE TABLE checkins (
+    id_checkin INT NOT NULL AUTO_INCREMENT,
+    id_membro INT NOT NULL,
+    id_assinatura INT,
+    data_hora DATETIME NOT NULL,
+    PRIMARY KEY (id_checkin),
+    INDEX ix_checkins_id_membro (id_membro),
+    INDEX ix_checkins_data_hora (data_hora),
+    FOREIGN KEY (id_membro) REFERENCES membros(id_membro)
+);
+
+CREATE TABLE assinaturas_arquivadas (
+    id_assinatura INT NOT NULL,
+    id_membro INT,
+    id_plano INT,
+    data_ativacao DATETIME NOT NULL,
+    ativo TINYINT NOT NULL,
+    arquivada_em DATETIME NOT NULL,
+    PRIMARY KEY (id_assinatura),
+    INDEX ix_assinaturas_arquivadas_id_membro (id_membro),
+    INDEX ix_assinaturas_arquivadas_id_plano (id_plano),
+    INDEX ix_assinaturas_arquivadas_data_ativacao (data_ativacao)
+);
+
+CREATE TABLE jobs (
+    id_job VARCHAR(32) NOT NULL,
+    relatorio VARCHAR(64) NOT NULL,
+    parametros VARCHAR(1024) NOT NULL,
+    estado VARCHAR(16) NOT NULL,
+    progresso FLOAT NOT NULL DEFAULT 0,
+    linhas INT NOT NULL DEFAULT 0,
+    arquivo VARCHAR(255),
+    erro VARCHAR(1024),
+    criado_em DATETIME NOT NULL,
+    iniciado_em DATETIME,
+    concluido_em DATETIME,
+    PRIMARY KEY (id_job),
+    INDEX ix_jobs_estado (estado),
+    INDEX ix_jobs_criado_em (criado_em)
+);
+
 
-INSERT INTO membros(nome, sobrenome,celular) VALUES ('Micah','Zassim', 55554433), ('Flip','Liporg', 6942314), ('Adin', 'Samura', 119926183);
-INSERT INTO planos(nome, preco) VALUES ('diario',50), ('mensal',150), ('semestral', 600);
+INSERT INTO membros(nome, sobrenome,celular, nome_busca, sobrenome_busca) VALUES ('Micah','Zassim', 55554433, 'micah', 'zassim'), ('Flip','Liporg', 6942314, 'flip', 'liporg'), ('Adin', 'Samura', 119926183, 'adin', 'samura');
+INSERT INTO planos(nome, preco, duracao_dias) VALUES ('diario',50,1), ('mensal',150,30), ('semestral',600,180);
 INSERT INTO assinaturas(id_membro, id_plano,data_ativacao, ativo) VALUES (1,2,'2001-12-12 00:00:00',1),(2,1,'2001-12-12 00:00:00',1),(3,3,'2001-12-12 00:00:00',0);
 Select * from planos;
\ No newline at end of file
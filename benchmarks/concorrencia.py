@@ -0,0 +1,90 @@
+"""Throughput de requisições concorrentes nos três modos de acesso ao banco.
+
+- bloqueante: crud.py chamado direto dentro das rotas async (comportamento antigo)
+- threadpool: crud.py rodando no threadpool (ASYNC_DB=0)
+- async: crud_async.py sobre o engine assíncrono (ASYNC_DB=1)
+
+Usa o banco configurado no .env. Cada modo roda em um subprocesso próprio, já que
+ASYNC_DB é lido na importação de database.py.
+
+    python benchmarks/concorrencia.py --requisicoes 2000 --concorrencia 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODOS = ["bloqueante", "threadpool", "async"]
+
+
+class Bloqueante:
+    def __init__(self, modulo):
+        self.modulo = modulo
+
+    def __getattr__(self, nome):
+        func = getattr(self.modulo, nome)
+        async def inline(*args, **kwargs):
+            return func(*args, **kwargs)
+        return inline
+
+
+async def medir(modo, requisicoes, concorrencia, rota):
+    import httpx
+    import crud
+    import main
+    if modo == "bloqueante":
+        main.dados = Bloqueante(crud)
+
+    fila = asyncio.Queue()
+    for _ in range(requisicoes):
+        fila.put_nowait(rota)
+    erros = 0
+
+    async def cliente(http):
+        nonlocal erros
+        while not fila.empty():
+            url = fila.get_nowait()
+            resposta = await http.get(url)
+            if resposta.status_code >= 400:
+                erros += 1
+
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as http:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(http) for _ in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+    return {"modo": modo, "rota": rota, "requisicoes": requisicoes, "concorrencia": concorrencia,
+            "erros": erros, "segundos": round(duracao, 4), "req_por_segundo": round(requisicoes / duracao, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requisicoes", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=64)
+    parser.add_argument("--rota", default="/membros/?limit=50")
+    parser.add_argument("--modo", choices=MODOS, help="roda um único modo no processo atual")
+    args = parser.parse_args()
+
+    if args.modo:
+        sys.path.insert(0, RAIZ)
+        os.chdir(RAIZ)
+        resultado = asyncio.run(medir(args.modo, args.requisicoes, args.concorrencia, args.rota))
+        print(json.dumps(resultado))
+        return
+
+    resultados = []
+    for modo in MODOS:
+        env = dict(os.environ, ASYNC_DB="1" if modo == "async" else "0")
+        saida = subprocess.run([sys.executable, __file__, "--modo", modo, "--requisicoes", str(args.requisicoes),
+                                "--concorrencia", str(args.concorrencia), "--rota", args.rota],
+                               env=env, check=True, capture_output=True, text=True).stdout
+        resultados.append(json.loads(saida.strip().splitlines()[-1]))
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""CPU por linha das listagens, no caminho padrão e no modo RESPOSTA_RAPIDA.
+
+Para cada rota pede páginas de --limit linhas ao app no próprio processo, primeiro com o
+caminho padrão (entidades ORM, validação pelo response_model, jsonable_encoder) e depois com
+colunas simples serializadas pelo orjson, e compara o tempo de CPU por linha e as respostas.
+Usa o mesmo banco e a mesma população de benchmarks/rotas.py:
+
+    python benchmarks/serializacao.py --membros 10000 --limit 500 --paginas 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import rotas
+
+ROTAS = ["/membros/", "/assinaturas/"]
+
+
+async def medir(app, rota, limit, paginas, membros):
+    import httpx
+
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as http:
+        linhas = 0
+        corpos = []
+        inicio = time.process_time()
+        for pagina in range(paginas):
+            after = (pagina * limit) % max(1, membros - limit)
+            resposta = await http.get(f"{rota}?limit={limit}&after={after}")
+            itens = resposta.json()["items"]
+            linhas += len(itens)
+            corpos.append(itens)
+        cpu = time.process_time() - inicio
+    return linhas, cpu, corpos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=rotas.BANCO_PADRAO)
+    parser.add_argument("--membros", type=int, default=10000)
+    parser.add_argument("--planos", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--paginas", type=int, default=40)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+    args.assinaturas = args.membros
+
+    os.environ["DATABASE_URL"] = args.url
+    sys.path.insert(0, rotas.RAIZ)
+    os.chdir(rotas.RAIZ)
+    import main as app_main
+    import migracoes
+
+    migracoes.preparar()
+    rotas.popular(args)
+
+    async def rodar_todos():
+        resultados = []
+        for rota in ROTAS:
+            medidas = {}
+            for modo, rapida in (("padrao", False), ("rapida", True)):
+                app_main.RESPOSTA_RAPIDA = rapida
+                await medir(app_main.app, rota, args.limit, 2, args.membros)
+                medidas[modo] = await medir(app_main.app, rota, args.limit, args.paginas, args.membros)
+            (linhas, cpu_padrao, corpos_padrao), (_, cpu_rapida, corpos_rapida) = medidas["padrao"], medidas["rapida"]
+            resultados.append({
+                "rota": rota,
+                "linhas": linhas,
+                "cpu_us_por_linha_padrao": round(cpu_padrao / linhas * 1e6, 2),
+                "cpu_us_por_linha_rapida": round(cpu_rapida / linhas * 1e6, 2),
+                "reducao": round(1 - cpu_rapida / cpu_padrao, 3),
+                "respostas_iguais": corpos_padrao == corpos_rapida,
+            })
+        return resultados
+
+    print(json.dumps({"limit": args.limit, "paginas": args.paginas, "resultados": asyncio.run(rodar_todos())}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+#Cache em memória com TTL e limite de tamanho (LRU), seguro para o threadpool.
+#Para invalidar entre workers, cada cache acompanha um contador de versão guardado no banco:
+#quem escreve incrementa o contador e, no máximo a cada intervalo_versao segundos,
+#quem lê compara o contador com o que viu por último e esvazia o cache se ele mudou.
+class CacheTTL:
+    def __init__(self, nome : str, ttl : float, maxsize : int, intervalo_versao : float):
+        self.nome = nome
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.intervalo_versao = intervalo_versao
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+        self._versao = None
+        self._versao_checada_em = 0.0
+
+    def get(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None or item[0] < agora:
+                if item is not None:
+                    del self._dados[chave]
+                self.misses += 1
+                return False, None
+            self._dados.move_to_end(chave)
+            self.hits += 1
+            return True, item[1]
+
+    def put(self, chave, valor):
+        with self._lock:
+            self._dados[chave] = (time.monotonic() + self.ttl, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.maxsize:
+                self._dados.popitem(last=False)
+
+    #Esvazia o cache e força a próxima leitura a conferir a versão no banco
+    def invalidar(self):
+        with self._lock:
+            self._dados.clear()
+            self._versao_checada_em = 0.0
+            self.invalidacoes += 1
+
+    def precisa_checar_versao(self):
+        return time.monotonic() - self._versao_checada_em > self.intervalo_versao
+
+    def sincronizar_versao(self, versao : int):
+        with self._lock:
+            if versao != self._versao:
+                self._dados.clear()
+                if self._versao is not None:
+                    self.invalidacoes += 1
+                self._versao = versao
+            self._versao_checada_em = time.monotonic()
+
+    def estatisticas(self):
+        with self._lock:
+            return {'nome': self.nome, 'itens': len(self._dados), 'hits': self.hits, 'misses': self.misses,
+                    'invalidacoes': self.invalidacoes, 'versao': self._versao}
@@ -0,0 +1,124 @@
+"""Buffer de checkins: POST /checkins só enfileira o evento, e uma tarefa do lifespan grava a fila
+em INSERTs de várias linhas quando ela chega a CHECKINS_LOTE eventos ou a cada CHECKINS_INTERVALO
+segundos, o que vier primeiro.
+
+A fila tem no máximo CHECKINS_CAPACIDADE eventos, contando os que estão sendo gravados; cheia, a
+rota responde 503 com Retry-After em vez de crescer sem limite. Na saída do app a fila é gravada
+antes de fechar os pools. Se o banco falhar, os eventos ainda não gravados voltam para o início da
+fila e a gravação é tentada de novo no próximo ciclo; os lotes já confirmados não são gravados de novo.
+"""
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import logging
+import os
+
+import crud
+from database import SessionLocal
+
+TAMANHO_LOTE = int(os.getenv("CHECKINS_LOTE", "500"))
+INTERVALO = float(os.getenv("CHECKINS_INTERVALO", "1"))
+CAPACIDADE = int(os.getenv("CHECKINS_CAPACIDADE", "20000"))
+
+logger = logging.getLogger(__name__)
+
+
+def gravar(linhas : list):
+    db = SessionLocal()
+    try:
+        return crud.inserir_checkins(db, linhas)
+    finally:
+        db.close()
+
+
+#Usado só no event loop: adicionar e a troca da fila não precisam de lock
+class BufferCheckins:
+    def __init__(self, tamanho_lote : int = TAMANHO_LOTE, intervalo : float = INTERVALO, capacidade : int = CAPACIDADE):
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.capacidade = capacidade
+        self.recebidos = 0
+        self.rejeitados = 0
+        self.gravados = 0
+        self.descartados = 0
+        self.flushes = 0
+        self.falhas = 0
+        self._fila = []
+        self._gravando = 0
+        self._cheio = None
+        self._tarefa = None
+        self._parando = False
+
+    def pendentes(self):
+        return len(self._fila) + self._gravando
+
+    #Devolve False quando a fila está cheia; o evento não é aceito
+    def adicionar(self, evento : dict):
+        if self.pendentes() >= self.capacidade:
+            self.rejeitados += 1
+            return False
+        self._fila.append(evento)
+        self.recebidos += 1
+        if len(self._fila) >= self.tamanho_lote and self._cheio is not None:
+            self._cheio.set()
+        return True
+
+    async def flush(self):
+        if not self._fila:
+            return
+        linhas, self._fila = self._fila, []
+        self._gravando = len(linhas)
+        try:
+            resultado = await run_in_threadpool(gravar, linhas)
+        except crud.GravacaoParcial as erro:
+            #Só volta para a fila o que não foi gravado nem descartado; o resto já está no banco
+            self.falhas += 1
+            self.gravados += erro.gravados
+            self.descartados += erro.descartados
+            self._fila[:0] = linhas[erro.processadas:]
+            raise
+        except Exception:
+            self.falhas += 1
+            self._fila[:0] = linhas
+            raise
+        finally:
+            self._gravando = 0
+        self.flushes += 1
+        self.gravados += resultado['gravados']
+        self.descartados += resultado['descartados']
+
+    async def _executar(self):
+        while not self._parando:
+            try:
+                await asyncio.wait_for(self._cheio.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._cheio.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Falha ao gravar checkins; %d eventos voltaram para a fila", len(self._fila))
+
+    def iniciar(self):
+        self._parando = False
+        self._cheio = asyncio.Event()
+        self._tarefa = asyncio.create_task(self._executar())
+
+    #Espera a gravação em andamento terminar (sem cancelá-la no meio) e grava o que restou na fila
+    async def parar(self):
+        if self._tarefa is not None:
+            self._parando = True
+            self._cheio.set()
+            await self._tarefa
+            self._tarefa = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Falha ao gravar checkins na saída; %d eventos não foram gravados", len(self._fila))
+
+    def estatisticas(self):
+        return {'pendentes': self.pendentes(), 'capacidade': self.capacidade, 'recebidos': self.recebidos,
+                'rejeitados': self.rejeitados, 'gravados': self.gravados, 'descartados': self.descartados,
+                'flushes': self.flushes, 'falhas': self.falhas}
+
+
+buffer = BufferCheckins()
@@ -1,14 +1,172 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, delete, insert, or_, func, and_, case, type_coerce, null, literal, union_all, bindparam, Boolean, DateTime
+from sqlalchemy.orm import Session, joinedload, noload
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from typing import Optional, List
+import csv
+import io
+import json
+import os
+import time
+import unicodedata
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
 
+import cache
 import models
 import schemas
 
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+TAMANHO_LOTE = 1000
+
+#O If-Match de uma atualização não confere com a versão atual da linha
+class ConflitoVersao(Exception):
+    pass
+
+#A gravação dos checkins parou no meio: as primeiras "processadas" linhas já foram gravadas ou descartadas
+class GravacaoParcial(Exception):
+    def __init__(self, processadas : int, gravados : int, descartados : int):
+        super().__init__(f"{processadas} checkins processados antes da falha")
+        self.processadas = processadas
+        self.gravados = gravados
+        self.descartados = descartados
+
+#Paginação por keyset na chave primária: o custo de uma página não depende de quão fundo o cliente está
+def paginar(query, coluna, limit : int, after : Optional[int] = None):
+    limit = max(1, min(limit, LIMITE_MAXIMO))
+    if after is not None:
+        query = query.filter(coluna > after)
+    itens = query.order_by(coluna).limit(limit + 1).all()
+    return montar_pagina(itens, coluna, limit)
+
+def montar_pagina(itens : list, coluna, limit : int):
+    next_cursor = None
+    if len(itens) > limit:
+        itens = itens[:limit]
+        next_cursor = getattr(itens[-1], coluna.key)
+    return {'items': itens, 'next_cursor': next_cursor}
+
+#Listagens no modo RESPOSTA_RAPIDA: seleciona só as colunas do schema de resposta, como linhas simples,
+#e devolve dicts prontos para o orjson, sem montar entidades ORM nem validar com Pydantic.
+#tipos converte colunas cujo tipo no banco difere do schema (ativo é Integer no banco e bool na resposta)
+def colunas_schema(modelo, schema, tipos : dict = {}):
+    return [type_coerce(getattr(modelo, campo), tipos[campo]).label(campo) if campo in tipos else getattr(modelo, campo)
+            for campo in schema.model_fields]
+
+def pagina_linhas(pagina : dict):
+    return {'items': [linha._asdict() for linha in pagina['items']], 'next_cursor': pagina['next_cursor']}
+
+def lotes(itens : list, tamanho : int = TAMANHO_LOTE):
+    for inicio in range(0, len(itens), tamanho):
+        yield itens[inicio:inicio + tamanho]
+
+#Busca de uma vez (em lotes de IN) quais valores já existem na coluna
+def valores_existentes(db : Session, coluna, valores : set):
+    existentes = set()
+    for lote in lotes(list(valores)):
+        existentes.update(valor for (valor,) in db.query(coluna).filter(coluna.in_(lote)))
+    return existentes
+
+#Insere as linhas em INSERTs de várias linhas, uma transação por lote.
+#linhas é uma lista de (indice, valores); resultados já traz os itens rejeitados antes da inserção.
+#antes_do_commit roda na transação de cada lote inserido, antes do commit dele
+def inserir_em_lotes(db : Session, tabela, linhas : list, resultados : list, antes_do_commit = None):
+    for lote in lotes(linhas):
+        try:
+            db.execute(tabela.insert().values([valores for _, valores in lote]))
+            if antes_do_commit is not None:
+                antes_do_commit(db)
+            db.commit()
+            status, detalhe = 'criado', None
+        except SQLAlchemyError as exc:
+            db.rollback()
+            status, detalhe = 'erro', str(getattr(exc, 'orig', None) or exc)
+        for indice, _ in lote:
+            resultados[indice] = {'indice': indice, 'status': status, 'detalhe': detalhe}
+    return {'criados': sum(1 for r in resultados if r['status'] == 'criado'), 'itens': resultados}
+
+#Atualização parcial em um único UPDATE ... WHERE, sem SELECT antes nem refresh depois.
+#Com ids, o filtro vira IN em lotes de TAMANHO_LOTE (um statement por lote, na mesma transação).
+#Devolve quantas linhas casaram com o filtro; o commit fica com quem chama
+def atualizar(db : Session, modelo, condicoes : list, campos : dict, coluna_id = None, ids : Optional[List[int]] = None):
+    if 'versao' in modelo.__table__.c:
+        campos = {**campos, 'versao': modelo.versao + 1}
+    stmt = update(modelo).where(*condicoes).values(**campos).execution_options(synchronize_session=False)
+    if ids is None:
+        return db.execute(stmt).rowcount
+    return sum(db.execute(stmt.where(coluna_id.in_(lote))).rowcount for lote in lotes(sorted(set(ids))))
+
+#Com versao_esperada (vinda do If-Match), o UPDATE só casa se a linha ainda estiver nessa versão
+def condicoes_versao(modelo, coluna_id, id : int, versao_esperada : Optional[int] = None):
+    condicoes = [coluna_id == id]
+    if versao_esperada is not None:
+        condicoes.append(modelo.versao == versao_esperada)
+    return condicoes
+
+#Um UPDATE com versão esperada que não casou nada: se a linha existe, a versão mudou
+def conferir_versao(db : Session, atualizados : int, modelo, coluna_id, id : int, versao_esperada : Optional[int] = None):
+    if not atualizados and versao_esperada is not None and db.query(modelo.versao).filter(coluna_id == id).scalar() is not None:
+        raise ConflitoVersao()
+    return atualizados
+
+#Versões para o ETag, lidas sem carregar as linhas: a da entidade e, com expand, as das relações incluídas.
+#versoes_entidade devolve a tupla de versões de uma linha; versoes_pagina, as tuplas (id, versões...) da página e o cursor
+def versoes_entidade(db : Session, stmt):
+    linha = db.execute(stmt.limit(1)).first()
+    return tuple(linha[1:]) if linha is not None else None
+
+def versoes_pagina(db : Session, stmt, coluna, limit : int, after : Optional[int] = None):
+    limit = max(1, min(limit, LIMITE_MAXIMO))
+    if after is not None:
+        stmt = stmt.where(coluna > after)
+    pagina = montar_pagina(db.execute(stmt.order_by(coluna).limit(limit + 1)).all(), coluna, limit)
+    return [tuple(linha) for linha in pagina['items']], pagina['next_cursor']
+
+#DELETE ... WHERE id IN (...) em lotes de TAMANHO_LOTE; cada item é (conta, statement), e conta diz
+#se o rowcount entra no total devolvido. Executados em ordem, na transação de quem chama
+def statements_delete(modelo, coluna_id, ids : List[int]):
+    for lote in lotes(sorted(set(ids))):
+        yield True, delete(modelo).where(coluna_id.in_(lote))
+
+def executar_deletes(db : Session, statements):
+    apagados = 0
+    for conta, stmt in statements:
+        rowcount = db.execute(stmt).rowcount
+        if conta:
+            apagados += rowcount
+    return apagados
+
 ###############
 #MEMBROS
 ###############
 
-def get_membros(db: Session):
-    return db.query(models.Membros)
+#Forma usada nas colunas nome_busca/sobrenome_busca: minúsculas, sem acentos e com espaços simples
+def normalizar_busca(texto : Optional[str]):
+    if texto is None:
+        return None
+    sem_acentos = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sem_acentos.lower().split())
+
+def campos_busca(nome : Optional[str], sobrenome : Optional[str]):
+    return {'nome_busca': normalizar_busca(nome), 'sobrenome_busca': normalizar_busca(sobrenome)}
+
+def get_membros(db: Session, limit : int = LIMITE_PADRAO, after : Optional[int] = None):
+    return paginar(db.query(models.Membros), models.Membros.id_membro, limit, after)
+
+COLUNAS_MEMBROS = colunas_schema(models.Membros, schemas.MembrosBase)
+
+def get_membros_linhas(db: Session, limit : int = LIMITE_PADRAO, after : Optional[int] = None):
+    return pagina_linhas(paginar(db.query(*COLUNAS_MEMBROS), models.Membros.id_membro, limit, after))
+
+def select_versoes_membros():
+    return select(models.Membros.id_membro, models.Membros.versao)
+
+def get_versoes_membro(db : Session, id_membro : int):
+    return versoes_entidade(db, select_versoes_membros().where(models.Membros.id_membro == id_membro))
+
+def get_versoes_membros(db : Session, limit : int = LIMITE_PADRAO, after : Optional[int] = None):
+    return versoes_pagina(db, select_versoes_membros(), models.Membros.id_membro, limit, after)
 
 def get_membro_id(db : Session, id_membro : int):
     return db.query(models.Membros).filter(models.Membros.id_membro == id_membro).first()
@@ -16,78 +174,366 @@ def get_membro_id(db : Session, id_membro : int):
 def get_membro_celular(db : Session, celular : int):
     return db.query(models.Membros).filter(models.Membros.celular == celular).first()
 
+#Prefixo como intervalo semiaberto [prefixo, prefixo + DEL), que o banco resolve com uma busca no índice
+#da coluna (um LIKE 'prefixo%' com ESCAPE vira varredura do índice inteiro). Sem LIKE, '%' e '_' valem literalmente.
+#normalizar_busca deixa colunas e termo em ASCII minúsculo, e DEL (0x7f) vem depois de todo ASCII imprimível
+#em qualquer charset do MySQL, ao contrário de um caractere fora do BMP, que num banco latin1 ou utf8mb3 vira '?'.
+#O limite é montado aqui, e não com ||, que no MySQL é OR
+def prefixo(coluna, termo : str):
+    return and_(coluna >= termo, coluna < termo + '\x7f')
+
+#Busca por prefixo nas colunas normalizadas e indexadas. Com mais de uma palavra, a primeira
+#é prefixo do nome e o resto do sobrenome; com uma só, vale prefixo de qualquer um dos dois
+def search_membros(db : Session, q : Optional[str] = None, celular : Optional[int] = None, limit : int = LIMITE_PADRAO):
+    limit = max(1, min(limit, LIMITE_MAXIMO))
+    query = db.query(models.Membros)
+    if celular is not None:
+        query = query.filter(models.Membros.celular == celular)
+    termos = normalizar_busca(q).split(' ', 1) if q else []
+    if q and not termos[0]:
+        #Um termo que some na normalização (só espaços, um acento solto) não casa com ninguém
+        return []
+    if len(termos) == 2:
+        query = query.filter(prefixo(models.Membros.nome_busca, termos[0]),
+                             prefixo(models.Membros.sobrenome_busca, termos[1]))
+        ordem = models.Membros.nome_busca
+    elif len(termos) == 1:
+        query = query.filter(or_(prefixo(models.Membros.nome_busca, termos[0]),
+                                 prefixo(models.Membros.sobrenome_busca, termos[0])))
+        ordem = models.Membros.nome_busca
+    else:
+        ordem = models.Membros.id_membro
+    return query.order_by(ordem, models.Membros.id_membro).limit(limit).all()
+
 def crate_membro(db : Session, membro: schemas.MembrosCreate):
-    db_membro = models.Membros(nome = membro.nome, sobrenome = membro.sobrenome, celular = membro.celular)
+    db_membro = models.Membros(nome = membro.nome, sobrenome = membro.sobrenome, celular = membro.celular,
+                               **campos_busca(membro.nome, membro.sobrenome))
     db.add(db_membro)
     db.commit()
     db.refresh(db_membro)
     return db_membro
 
-def update_membro (db : Session, membro: schemas.MembrosBase):
+def create_membros_bulk(db : Session, membros: List[schemas.MembrosCreate]):
+    resultados = [None] * len(membros)
+    existentes = valores_existentes(db, models.Membros.celular, {m.celular for m in membros if m.celular is not None})
+    linhas = []
+    for indice, membro in enumerate(membros):
+        if membro.celular is not None and membro.celular in existentes:
+            resultados[indice] = {'indice': indice, 'status': 'duplicado', 'detalhe': 'Membro ja registrado'}
+            continue
+        if membro.celular is not None:
+            existentes.add(membro.celular)
+        linhas.append((indice, {'nome': membro.nome, 'sobrenome': membro.sobrenome, 'celular': membro.celular,
+                                **campos_busca(membro.nome, membro.sobrenome)}))
+    return inserir_em_lotes(db, models.Membros.__table__, linhas, resultados)
+
+def update_membro (db : Session, membro: schemas.MembrosBase, versao_esperada : Optional[int] = None):
     db_membro = db.query(models.Membros).filter(models.Membros.id_membro == membro.id_membro).first()
+    if db_membro is None:
+        return None
+    if versao_esperada is not None and db_membro.versao != versao_esperada:
+        raise ConflitoVersao()
     if membro.nome:
         db_membro.nome = membro.nome
     if membro.sobrenome:
         db_membro.sobrenome = membro.sobrenome
     if membro.celular:
         db_membro.celular = membro.celular
+    db_membro.nome_busca = normalizar_busca(db_membro.nome)
+    db_membro.sobrenome_busca = normalizar_busca(db_membro.sobrenome)
     db.commit()
     db.refresh(db_membro)
     return db_membro
 
-def delete_membro (db : Session, id_membro: int):
-    db_membro = db.query(models.Membros).filter(models.Membros.id_membro == id_membro).first()
-    db.delete(db_membro)
+#Mantém as colunas de busca em dia quando nome ou sobrenome mudam
+def campos_membro(campos : dict):
+    campos = dict(campos)
+    if 'nome' in campos:
+        campos['nome_busca'] = normalizar_busca(campos['nome'])
+    if 'sobrenome' in campos:
+        campos['sobrenome_busca'] = normalizar_busca(campos['sobrenome'])
+    return campos
+
+def patch_membro(db : Session, id_membro : int, campos : dict, versao_esperada : Optional[int] = None):
+    condicoes = condicoes_versao(models.Membros, models.Membros.id_membro, id_membro, versao_esperada)
+    atualizados = atualizar(db, models.Membros, condicoes, campos_membro(campos))
+    conferir_versao(db, atualizados, models.Membros, models.Membros.id_membro, id_membro, versao_esperada)
+    db.commit()
+    return atualizados
+
+def patch_membros_bulk(db : Session, ids : List[int], campos : dict):
+    atualizados = atualizar(db, models.Membros, [], campos_membro(campos), models.Membros.id_membro, ids)
     db.commit()
-    return {'Deletado': db_membro}
+    return atualizados
+
+COLUNAS_ARQUIVO = ['id_assinatura', 'data_ativacao', 'ativo', 'id_membro', 'id_plano']
+
+#INSERT ... SELECT que copia para assinaturas_arquivadas as assinaturas que satisfazem a condição.
+#arquivada_em vem do relógio local, como as demais datas gravadas pelo app: o now() do SQLite é em UTC
+def insert_arquivo(condicao):
+    origem = select(*[getattr(models.Assinaturas, nome) for nome in COLUNAS_ARQUIVO],
+                    literal(datetime.now(), DateTime)).where(condicao)
+    return insert(models.AssinaturasArquivadas).from_select(COLUNAS_ARQUIVO + ['arquivada_em'], origem)
+
+#Com cascata, as assinaturas e os checkins dos membros saem antes deles, no mesmo lote: 'arquivar' copia
+#as assinaturas para assinaturas_arquivadas com INSERT ... SELECT e então apaga; 'apagar' só apaga. Os checkins
+#não têm tabela de arquivo e são apagados nos dois modos. Sem cascata, um membro com assinaturas ou checkins
+#faz o DELETE falhar na chave estrangeira e nada é apagado
+def statements_delete_membros(ids : List[int], cascata : Optional[str] = None):
+    for lote in lotes(sorted(set(ids))):
+        do_lote = models.Assinaturas.id_membro.in_(lote)
+        if cascata == 'arquivar':
+            yield False, insert_arquivo(do_lote)
+        if cascata:
+            yield False, delete(models.Assinaturas).where(do_lote)
+            yield False, delete(models.Checkins).where(models.Checkins.id_membro.in_(lote))
+        yield True, delete(models.Membros).where(models.Membros.id_membro.in_(lote))
+
+def delete_membros(db : Session, ids : List[int], cascata : Optional[str] = None):
+    apagados = executar_deletes(db, statements_delete_membros(ids, cascata))
+    db.commit()
+    return apagados
+
+def delete_membro (db : Session, id_membro: int, cascata : Optional[str] = None):
+    return delete_membros(db, [id_membro], cascata)
+
+
+#Preenche as colunas de busca de membros antigos, em lotes pela chave primária. O UPDATE é feito na tabela,
+#e não pelo mapper: bulk_update_mappings exige a coluna versao (version_id_col), que a migração pode ainda não ter criado
+def preencher_busca_membros(db : Session):
+    tabela = models.Membros.__table__
+    stmt = (update(tabela).where(tabela.c.id_membro == bindparam('b_id_membro'))
+            .values(nome_busca=bindparam('b_nome_busca'), sobrenome_busca=bindparam('b_sobrenome_busca')))
+    atualizados = 0
+    ultimo = 0
+    while True:
+        linhas = (db.query(models.Membros.id_membro, models.Membros.nome, models.Membros.sobrenome)
+                  .filter(models.Membros.id_membro > ultimo).order_by(models.Membros.id_membro).limit(TAMANHO_LOTE).all())
+        if not linhas:
+            return atualizados
+        db.execute(stmt, [{'b_id_membro': id_membro, 'b_nome_busca': normalizar_busca(nome),
+                           'b_sobrenome_busca': normalizar_busca(sobrenome)} for id_membro, nome, sobrenome in linhas])
+        db.commit()
+        atualizados += len(linhas)
+        ultimo = linhas[-1].id_membro
+
+
+###############
+#CACHE
+###############
+
+#Os valores guardados são schemas Pydantic, e não objetos ORM, para não ficarem presos a uma sessão
+cache_planos = cache.CacheTTL('planos', ttl=float(os.getenv("CACHE_PLANOS_TTL", "60")),
+                              maxsize=int(os.getenv("CACHE_PLANOS_MAX", "1024")),
+                              intervalo_versao=float(os.getenv("CACHE_VERSAO_INTERVALO", "1")))
+
+def select_versao_cache(nome : str):
+    return select(models.VersoesCache.versao).where(models.VersoesCache.nome == nome)
+
+def update_versao_cache(nome : str):
+    return (update(models.VersoesCache).where(models.VersoesCache.nome == nome)
+            .values(versao=models.VersoesCache.versao + 1))
+
+def ler_cache(db : Session, cache_db : cache.CacheTTL, chave, carregar):
+    if cache_db.precisa_checar_versao():
+        cache_db.sincronizar_versao(db.execute(select_versao_cache(cache_db.nome)).scalar() or 0)
+    encontrado, valor = cache_db.get(chave)
+    if not encontrado:
+        valor = carregar()
+        cache_db.put(chave, valor)
+    return valor
+
+#Chamado dentro da transação da escrita, antes do commit, para que os outros workers vejam a nova versão junto com os dados
+def incrementar_versao_cache(db : Session, nome : str):
+    if db.execute(update_versao_cache(nome)).rowcount == 0:
+        db.add(models.VersoesCache(nome=nome, versao=1))
+
+def plano_schema(db_plano):
+    return schemas.PlanosBase.model_validate(db_plano, from_attributes=True) if db_plano is not None else None
 
 
 ###############
 #PLANOS
 ###############
 
-def get_planos(db: Session):
-    return db.query(models.Planos)
+def get_planos(db: Session, limit : int = LIMITE_PADRAO, after : Optional[int] = None):
+    def carregar():
+        pagina = paginar(db.query(models.Planos), models.Planos.id_plano, limit, after)
+        return {'items': [plano_schema(p) for p in pagina['items']], 'next_cursor': pagina['next_cursor']}
+    return ler_cache(db, cache_planos, ('pagina', limit, after), carregar)
 
 def get_planos_id(db : Session, id_plano : int):
-    return db.query(models.Planos).filter(models.Planos.id_plano == id_plano).first()
+    return ler_cache(db, cache_planos, ('id', id_plano),
+                     lambda: plano_schema(db.query(models.Planos).filter(models.Planos.id_plano == id_plano).first()))
 
 def get_planos_nome(db : Session, nome : str):
-    return db.query(models.Planos).filter(models.Planos.nome == nome).first()
+    return ler_cache(db, cache_planos, ('nome', nome),
+                     lambda: plano_schema(db.query(models.Planos).filter(models.Planos.nome == nome).first()))
 
 def create_plano(db :Session, plano: schemas.PlanosCreate):
-    db_plano = models.Planos(nome = plano.nome, preco = plano.preco )
+    db_plano = models.Planos(nome = plano.nome, preco = plano.preco, duracao_dias = plano.duracao_dias )
     db.add(db_plano)
+    incrementar_versao_cache(db, 'planos')
     db.commit()
+    cache_planos.invalidar()
     db.refresh(db_plano)
     return db_plano
 
-def update_plano (db : Session, plano: schemas.PlanosBase):
+#Escritas em planos sobem a versão do cache na mesma transação e esvaziam o cache local depois do commit
+def commit_planos(db : Session, alterados : int):
+    if alterados:
+        incrementar_versao_cache(db, 'planos')
+    db.commit()
+    if alterados:
+        cache_planos.invalidar()
+    return alterados
+
+def create_planos_bulk(db : Session, planos: List[schemas.PlanosCreate]):
+    resultados = [None] * len(planos)
+    existentes = valores_existentes(db, models.Planos.nome, {p.nome for p in planos})
+    linhas = []
+    for indice, plano in enumerate(planos):
+        if plano.nome in existentes:
+            resultados[indice] = {'indice': indice, 'status': 'duplicado', 'detalhe': 'Plano ja registrado'}
+            continue
+        existentes.add(plano.nome)
+        linhas.append((indice, {'nome': plano.nome, 'preco': plano.preco, 'duracao_dias': plano.duracao_dias}))
+    #A versão do cache sobe junto com cada lote inserido; sem nenhum plano criado, o cache fica como está
+    resultado = inserir_em_lotes(db, models.Planos.__table__, linhas, resultados,
+                                 antes_do_commit=lambda db: incrementar_versao_cache(db, 'planos'))
+    if resultado['criados']:
+        cache_planos.invalidar()
+    return resultado
+
+def update_plano (db : Session, plano: schemas.PlanosBase, versao_esperada : Optional[int] = None):
     db_plano = db.query(models.Planos).filter(models.Planos.id_plano == plano.id_plano).first()
+    if db_plano is None:
+        return None
+    if versao_esperada is not None and db_plano.versao != versao_esperada:
+        raise ConflitoVersao()
     if plano.nome:
         db_plano.nome = plano.nome
     if plano.preco:
         db_plano.preco = plano.preco
+    if plano.duracao_dias:
+        db_plano.duracao_dias = plano.duracao_dias
+    incrementar_versao_cache(db, 'planos')
     db.commit()
+    cache_planos.invalidar()
     db.refresh(db_plano)
     return db_plano
 
+def patch_plano(db : Session, id_plano : int, campos : dict, versao_esperada : Optional[int] = None):
+    condicoes = condicoes_versao(models.Planos, models.Planos.id_plano, id_plano, versao_esperada)
+    atualizados = atualizar(db, models.Planos, condicoes, campos)
+    conferir_versao(db, atualizados, models.Planos, models.Planos.id_plano, id_plano, versao_esperada)
+    return commit_planos(db, atualizados)
+
+def patch_planos_bulk(db : Session, ids : List[int], campos : dict):
+    return commit_planos(db, atualizar(db, models.Planos, [], campos, models.Planos.id_plano, ids))
+
 def delete_plano (db : Session, id_plano: int):
-    db_plano= db.query(models.Planos).filter(models.Planos.id_plano == id_plano).first()
-    db.delete(db_plano)
-    db.commit()
-    return {'Deletado': db_plano}
+    return commit_planos(db, executar_deletes(db, statements_delete(models.Planos, models.Planos.id_plano, [id_plano])))
 
 
 ###############
 #ASSINATURAS (MEMBRO-PLANO)
 ###############
 
-def get_assinaturas(db: Session):
-    return db.query(models.Assinaturas)
+EXPANSOES_ASSINATURA = {'membro': models.Assinaturas.membro, 'plano': models.Assinaturas.plano}
+
+#Relações pedidas em expand vêm no mesmo SELECT (joinedload, ambas são many-to-one);
+#as demais ficam com noload, para que serializar a resposta nunca dispare uma query por linha
+def opcoes_expand(expand : set = frozenset()):
+    return [joinedload(relacao) if nome in expand else noload(relacao) for nome, relacao in EXPANSOES_ASSINATURA.items()]
+
+#As versões das relações expandidas entram no ETag, na ordem alfabética do nome da relação
+JOINS_VERSAO_ASSINATURA = {
+    'membro': (models.Membros, models.Assinaturas.id_membro == models.Membros.id_membro),
+    'plano': (models.Planos, models.Assinaturas.id_plano == models.Planos.id_plano),
+}
+
+def select_versoes_assinaturas(expand : set = frozenset()):
+    stmt = select(models.Assinaturas.id_assinatura, models.Assinaturas.versao)
+    for nome in sorted(expand):
+        modelo, condicao = JOINS_VERSAO_ASSINATURA[nome]
+        stmt = stmt.add_columns(modelo.versao.label(f'versao_{nome}')).outerjoin(modelo, condicao)
+    return stmt
+
+def get_versoes_assinatura(db : Session, id_assinatura : int, expand : set = frozenset()):
+    stmt = select_versoes_assinaturas(expand).where(models.Assinaturas.id_assinatura == id_assinatura)
+    return versoes_entidade(db, stmt)
+
+def get_versoes_assinaturas(db : Session, limit : int = LIMITE_PADRAO, after : Optional[int] = None, expand : set = frozenset()):
+    return versoes_pagina(db, select_versoes_assinaturas(expand), models.Assinaturas.id_assinatura, limit, after)
+
+def get_assinaturas(db: Session, limit : int = LIMITE_PADRAO, after : Optional[int] = None, expand : set = frozenset()):
+    query = db.query(models.Assinaturas).options(*opcoes_expand(expand))
+    return paginar(query, models.Assinaturas.id_assinatura, limit, after)
 
-def get_assinatura_id(db : Session, id_assinatura : int):
-    return db.query(models.Assinaturas).filter(models.Assinaturas.id_assinatura == id_assinatura).first()
+#As relações não expandidas saem como null, como no AssinaturasExpandida do caminho padrão;
+#arquivada_em é sempre null na tabela principal
+COLUNAS_ASSINATURAS = (colunas_schema(models.Assinaturas, schemas.Assinaturas, {'ativo': Boolean})
+                       + [null().label(nome) for nome in EXPANSOES_ASSINATURA]
+                       + [type_coerce(null(), DateTime).label('arquivada_em')])
+
+#As mesmas colunas lidas de assinaturas_arquivadas, que não tem versao
+COLUNAS_ASSINATURAS_ARQUIVADAS = ([type_coerce(models.AssinaturasArquivadas.ativo, Boolean).label(campo) if campo == 'ativo'
+                                   else getattr(models.AssinaturasArquivadas, campo, null().label(campo))
+                                   for campo in schemas.Assinaturas.model_fields]
+                                  + [null().label(nome) for nome in EXPANSOES_ASSINATURA]
+                                  + [models.AssinaturasArquivadas.arquivada_em])
+
+def get_assinaturas_linhas(db: Session, limit : int = LIMITE_PADRAO, after : Optional[int] = None):
+    return pagina_linhas(paginar(db.query(*COLUNAS_ASSINATURAS), models.Assinaturas.id_assinatura, limit, after))
+
+#Primeiras limit + 1 linhas depois de after de uma das tabelas, como subquery para entrar no UNION
+def trecho_historico(colunas : list, coluna_id, limit : int, after : Optional[int] = None):
+    stmt = select(*colunas)
+    if after is not None:
+        stmt = stmt.where(coluna_id > after)
+    return select(stmt.order_by(coluna_id).limit(limit + 1).subquery())
+
+#Página de assinaturas e assinaturas_arquivadas juntas (include_archived): cada tabela contribui no máximo
+#limit + 1 linhas pelo próprio índice da chave, e o UNION ALL delas é ordenado e cortado no limit
+def select_historico(limit : int, after : Optional[int] = None):
+    limit = max(1, min(limit, LIMITE_MAXIMO))
+    uniao = union_all(
+        trecho_historico(COLUNAS_ASSINATURAS, models.Assinaturas.id_assinatura, limit, after),
+        trecho_historico(COLUNAS_ASSINATURAS_ARQUIVADAS, models.AssinaturasArquivadas.id_assinatura, limit, after),
+    ).subquery()
+    #Rótulos refeitos como str: os nomes das colunas de um UNION vêm como uma subclasse que o orjson recusa
+    stmt = select(*[coluna.label(str(coluna.key)) for coluna in uniao.c])
+    return stmt.order_by(uniao.c.id_assinatura).limit(limit + 1), uniao.c.id_assinatura, limit
+
+#Carrega as relações pedidas em expand das linhas do histórico, com uma query IN por relação;
+#assinaturas arquivadas podem apontar para membros ou planos que não existem mais, e ficam com null
+def expandir_linhas(db : Session, linhas : List[dict], expand : set = frozenset()):
+    for nome in sorted(expand):
+        modelo, condicao = JOINS_VERSAO_ASSINATURA[nome]
+        coluna_id = condicao.right
+        ids = {linha[coluna_id.key] for linha in linhas if linha[coluna_id.key] is not None}
+        encontrados = {getattr(obj, coluna_id.key): obj for lote in lotes(list(ids))
+                       for obj in db.query(modelo).filter(coluna_id.in_(lote))}
+        for linha in linhas:
+            linha[nome] = encontrados.get(linha[coluna_id.key])
+    return linhas
+
+def get_assinaturas_historico(db : Session, limit : int = LIMITE_PADRAO, after : Optional[int] = None, expand : set = frozenset()):
+    stmt, coluna, limit = select_historico(limit, after)
+    pagina = pagina_linhas(montar_pagina(db.execute(stmt).all(), coluna, limit))
+    expandir_linhas(db, pagina['items'], expand)
+    return pagina
+
+def get_assinatura_arquivada(db : Session, id_assinatura : int, expand : set = frozenset()):
+    linha = db.execute(select(*COLUNAS_ASSINATURAS_ARQUIVADAS)
+                       .where(models.AssinaturasArquivadas.id_assinatura == id_assinatura)).first()
+    if linha is None:
+        return None
+    return expandir_linhas(db, [linha._asdict()], expand)[0]
+
+def get_assinatura_id(db : Session, id_assinatura : int, expand : set = frozenset()):
+    return db.query(models.Assinaturas).options(*opcoes_expand(expand)).filter(models.Assinaturas.id_assinatura == id_assinatura).first()
 
 def create_assinatura(db :Session, assinatura: schemas.AssinaturasCreate):
     db_assinatura = models.Assinaturas(ativo = assinatura.ativo, data_ativacao = assinatura.data_ativacao, id_membro = assinatura.id_membro, id_plano = assinatura.id_plano )
@@ -96,8 +542,64 @@ def create_assinatura(db :Session, assinatura: schemas.AssinaturasCreate):
     db.refresh(db_assinatura)
     return db_assinatura
 
-def update_assinatura (db : Session, assinatura: schemas.Assinaturas):
+def create_assinaturas_bulk(db : Session, assinaturas: List[schemas.Assinaturas]):
+    resultados = [None] * len(assinaturas)
+    membros = valores_existentes(db, models.Membros.id_membro, {a.id_membro for a in assinaturas})
+    planos = valores_existentes(db, models.Planos.id_plano, {a.id_plano for a in assinaturas})
+    linhas = []
+    for indice, assinatura in enumerate(assinaturas):
+        if assinatura.id_membro not in membros:
+            resultados[indice] = {'indice': indice, 'status': 'invalido', 'detalhe': 'Membro não encontrado'}
+        elif assinatura.id_plano not in planos:
+            resultados[indice] = {'indice': indice, 'status': 'invalido', 'detalhe': 'Plano não encontrado'}
+        else:
+            linhas.append((indice, {'ativo': assinatura.ativo, 'data_ativacao': assinatura.data_ativacao,
+                                    'id_membro': assinatura.id_membro, 'id_plano': assinatura.id_plano}))
+    return inserir_em_lotes(db, models.Assinaturas.__table__, linhas, resultados)
+
+COLUNAS_EXPORT = [
+    models.Assinaturas.id_assinatura, models.Assinaturas.ativo, models.Assinaturas.data_ativacao,
+    models.Membros.id_membro, models.Membros.nome.label('nome_membro'), models.Membros.sobrenome, models.Membros.celular,
+    models.Planos.id_plano, models.Planos.nome.label('nome_plano'), models.Planos.preco,
+]
+
+def select_export_assinaturas():
+    return (select(*COLUNAS_EXPORT)
+            .join(models.Membros, models.Assinaturas.id_membro == models.Membros.id_membro)
+            .join(models.Planos, models.Assinaturas.id_plano == models.Planos.id_plano)
+            .order_by(models.Assinaturas.id_assinatura))
+
+def formatar_export(linhas, formato : str, cabecalho : bool = False, colunas : list = COLUNAS_EXPORT):
+    buffer = io.StringIO()
+    if formato == 'csv':
+        writer = csv.writer(buffer)
+        if cabecalho:
+            writer.writerow([coluna.key for coluna in colunas])
+        writer.writerows(linhas)
+    else:
+        for linha in linhas:
+            buffer.write(json.dumps(dict(linha._mapping), default=str))
+            buffer.write('\n')
+    return buffer.getvalue()
+
+#Gerador que lê as assinaturas por cursor no servidor em blocos de TAMANHO_LOTE: a memória não cresce com a tabela.
+#Fecha a sessão ao terminar, pois roda depois que a rota já retornou
+def exportar_assinaturas(db : Session, formato : str):
+    try:
+        resultado = db.execute(select_export_assinaturas(), execution_options={'stream_results': True})
+        if formato == 'csv':
+            yield formatar_export([], formato, cabecalho=True)
+        for linhas in resultado.partitions(TAMANHO_LOTE):
+            yield formatar_export(linhas, formato)
+    finally:
+        db.close()
+
+def update_assinatura (db : Session, assinatura: schemas.Assinaturas, versao_esperada : Optional[int] = None):
     db_assinatura = db.query(models.Assinaturas).filter(models.Assinaturas.id_assinatura == assinatura.id_assinatura).first()
+    if db_assinatura is None:
+        return None
+    if versao_esperada is not None and db_assinatura.versao != versao_esperada:
+        raise ConflitoVersao()
     if assinatura.ativo is not None:
         db_assinatura.ativo = assinatura.ativo
     if assinatura.data_ativacao:
@@ -110,8 +612,265 @@ def update_assinatura (db : Session, assinatura: schemas.Assinaturas):
     db.refresh(db_assinatura)
     return db_assinatura
 
+def patch_assinatura(db : Session, id_assinatura : int, campos : dict, versao_esperada : Optional[int] = None):
+    condicoes = condicoes_versao(models.Assinaturas, models.Assinaturas.id_assinatura, id_assinatura, versao_esperada)
+    atualizados = atualizar(db, models.Assinaturas, condicoes, campos)
+    conferir_versao(db, atualizados, models.Assinaturas, models.Assinaturas.id_assinatura, id_assinatura, versao_esperada)
+    db.commit()
+    return atualizados
+
+#Ex.: mover todos os membros do plano X para o Y é id_plano_atual=X com campos={'id_plano': Y}
+def patch_assinaturas_bulk(db : Session, campos : dict, ids : Optional[List[int]] = None, id_plano_atual : Optional[int] = None):
+    condicoes = [models.Assinaturas.id_plano == id_plano_atual] if id_plano_atual is not None else []
+    atualizados = atualizar(db, models.Assinaturas, condicoes, campos, models.Assinaturas.id_assinatura, ids)
+    db.commit()
+    return atualizados
+
+#Desativa as assinaturas vencidas (data_ativacao + duracao_dias do plano antes de agora), plano a plano.
+#Cada lote seleciona até tamanho_lote ids pelo índice (ativo, id_plano, data_ativacao) e os desativa num UPDATE com commit próprio,
+#então nenhum lock fica preso por mais que um lote; as linhas desativadas saem do filtro, e o lote seguinte continua dali
+def expirar_assinaturas(db : Session, agora : Optional[datetime] = None, tamanho_lote : int = TAMANHO_LOTE):
+    inicio = time.perf_counter()
+    agora = agora or datetime.now()
+    planos = db.query(models.Planos.id_plano, models.Planos.duracao_dias).filter(models.Planos.duracao_dias.isnot(None)).all()
+    expiradas = executados = 0
+    for id_plano, duracao_dias in planos:
+        vencidas = (db.query(models.Assinaturas.id_assinatura)
+                    .filter(models.Assinaturas.ativo == 1, models.Assinaturas.id_plano == id_plano,
+                            models.Assinaturas.data_ativacao < agora - timedelta(days=duracao_dias))
+                    .order_by(models.Assinaturas.data_ativacao).limit(tamanho_lote))
+        while True:
+            ids = [id_assinatura for (id_assinatura,) in vencidas]
+            if not ids:
+                break
+            expiradas += atualizar(db, models.Assinaturas, [models.Assinaturas.ativo == 1], {'ativo': 0},
+                                   models.Assinaturas.id_assinatura, ids)
+            db.commit()
+            executados += 1
+            if len(ids) < tamanho_lote:
+                break
+    return {'expiradas': expiradas, 'lotes': executados, 'planos': len(planos),
+            'segundos': round(time.perf_counter() - inicio, 3)}
+
+#Move para assinaturas_arquivadas as assinaturas inativas ativadas antes de antes_de (todas as inativas, se None).
+#Cada lote trava suas linhas (SELECT ... FOR UPDATE), copia com INSERT ... SELECT e apaga na mesma
+#transação, então uma assinatura nunca fica nas duas tabelas nem em nenhuma
+def arquivar_assinaturas(db : Session, antes_de : Optional[datetime] = None, tamanho_lote : int = TAMANHO_LOTE):
+    inicio = time.perf_counter()
+    condicoes = [models.Assinaturas.ativo == 0]
+    if antes_de is not None:
+        condicoes.append(models.Assinaturas.data_ativacao < antes_de)
+    inativas = (db.query(models.Assinaturas.id_assinatura).filter(*condicoes)
+                .order_by(models.Assinaturas.id_assinatura).limit(tamanho_lote).with_for_update())
+    arquivadas = executados = 0
+    while True:
+        ids = [id_assinatura for (id_assinatura,) in inativas]
+        if not ids:
+            break
+        do_lote = models.Assinaturas.id_assinatura.in_(ids)
+        db.execute(insert_arquivo(do_lote))
+        arquivadas += db.execute(delete(models.Assinaturas).where(do_lote)).rowcount
+        db.commit()
+        executados += 1
+        if len(ids) < tamanho_lote:
+            break
+    return {'arquivadas': arquivadas, 'lotes': executados, 'segundos': round(time.perf_counter() - inicio, 3)}
+
 def delete_assinaturas (db : Session, id_assinatura: int):
-    db_assinaturas= db.query(models.Assinaturas).filter(models.Assinaturas.id_assinatura == id_assinatura).first()
-    db.delete(db_assinaturas)
+    apagados = executar_deletes(db, statements_delete(models.Assinaturas, models.Assinaturas.id_assinatura, [id_assinatura]))
+    db.commit()
+    return apagados
+
+
+###############
+#CHECKINS
+###############
+
+#Assinatura ativa de cada membro, consultada a cada passagem pela catraca. Só o resultado positivo
+#fica em cache, por CACHE_ATIVOS_TTL segundos: um membro que acabou de assinar entra na hora, e uma
+#assinatura desativada ainda libera a catraca por no máximo esse tempo
+cache_ativos = cache.CacheTTL('assinaturas_ativas', ttl=float(os.getenv("CACHE_ATIVOS_TTL", "30")),
+                              maxsize=int(os.getenv("CACHE_ATIVOS_MAX", "100000")), intervalo_versao=0)
+
+def get_assinatura_ativa(db : Session, id_membro : int):
+    encontrado, id_assinatura = cache_ativos.get(id_membro)
+    if encontrado:
+        return id_assinatura
+    id_assinatura = (db.query(models.Assinaturas.id_assinatura)
+                     .filter(models.Assinaturas.id_membro == id_membro, models.Assinaturas.ativo == 1)
+                     .order_by(models.Assinaturas.data_ativacao.desc()).limit(1).scalar())
+    if id_assinatura is not None:
+        cache_ativos.put(id_membro, id_assinatura)
+    return id_assinatura
+
+#Grava os checkins em INSERTs de várias linhas. Se um lote viola uma restrição (membro apagado
+#depois da passagem), ele é refeito linha a linha e só as linhas inválidas são descartadas.
+#Outros erros, como o banco fora do ar, sobem como GravacaoParcial, com quantas linhas já foram
+#confirmadas, para o buffer tentar de novo só as restantes: os checkins não têm chave única que barre cópias
+def inserir_checkins(db : Session, linhas : List[dict]):
+    tabela = models.Checkins.__table__
+    gravados = descartados = 0
+    try:
+        for lote in lotes(linhas):
+            try:
+                db.execute(tabela.insert().values(lote))
+                db.commit()
+                gravados += len(lote)
+                continue
+            except IntegrityError:
+                db.rollback()
+            for linha in lote:
+                try:
+                    db.execute(tabela.insert().values(linha))
+                    db.commit()
+                    gravados += 1
+                except IntegrityError:
+                    db.rollback()
+                    descartados += 1
+    except SQLAlchemyError as erro:
+        db.rollback()
+        raise GravacaoParcial(gravados + descartados, gravados, descartados) from erro
+    return {'gravados': gravados, 'descartados': descartados}
+
+
+###############
+#RELATORIOS
+###############
+
+#Agregações feitas no banco: uma linha por plano, com LEFT JOIN para listar também os planos sem assinaturas ativas
+def relatorio_ativos(db : Session):
+    join_ativas = and_(models.Assinaturas.id_plano == models.Planos.id_plano, models.Assinaturas.ativo == 1)
+    linhas = (db.query(models.Planos.id_plano, models.Planos.nome,
+                       func.count(func.distinct(models.Assinaturas.id_membro)).label('membros_ativos'),
+                       func.count(models.Assinaturas.id_assinatura).label('assinaturas_ativas'))
+              .outerjoin(models.Assinaturas, join_ativas)
+              .group_by(models.Planos.id_plano, models.Planos.nome)
+              .order_by(models.Planos.id_plano).all())
+    total = (db.query(func.count(func.distinct(models.Assinaturas.id_membro)))
+             .filter(models.Assinaturas.ativo == 1).scalar())
+    return {'membros_ativos': total, 'planos': [linha._asdict() for linha in linhas]}
+
+def relatorio_receita(db : Session):
+    join_ativas = and_(models.Assinaturas.id_plano == models.Planos.id_plano, models.Assinaturas.ativo == 1)
+    ativas = func.count(models.Assinaturas.id_assinatura)
+    linhas = (db.query(models.Planos.id_plano, models.Planos.nome, models.Planos.preco,
+                       ativas.label('assinaturas_ativas'), (ativas * models.Planos.preco).label('receita_mensal'))
+              .outerjoin(models.Assinaturas, join_ativas)
+              .group_by(models.Planos.id_plano, models.Planos.nome, models.Planos.preco)
+              .order_by(models.Planos.id_plano).all())
+    planos = [linha._asdict() for linha in linhas]
+    return {'receita_mensal': sum((p['receita_mensal'] for p in planos), Decimal(0)), 'planos': planos}
+
+#Uma linha por membro com suas assinaturas (total e ativas), a receita mensal das ativas e a última ativação
+ASSINATURA_ATIVA = models.Assinaturas.ativo == 1
+COLUNAS_RELATORIO_MEMBROS = [
+    models.Membros.id_membro, models.Membros.nome, models.Membros.sobrenome, models.Membros.celular,
+    func.count(models.Assinaturas.id_assinatura).label('assinaturas'),
+    func.count(case((ASSINATURA_ATIVA, 1))).label('assinaturas_ativas'),
+    func.coalesce(func.sum(case((ASSINATURA_ATIVA, models.Planos.preco))), 0).label('receita_mensal'),
+    func.max(models.Assinaturas.data_ativacao).label('ultima_ativacao'),
+]
+
+def select_relatorio_membros():
+    return (select(*COLUNAS_RELATORIO_MEMBROS)
+            .outerjoin(models.Assinaturas, models.Assinaturas.id_membro == models.Membros.id_membro)
+            .outerjoin(models.Planos, models.Assinaturas.id_plano == models.Planos.id_plano)
+            .group_by(models.Membros.id_membro, models.Membros.nome, models.Membros.sobrenome, models.Membros.celular)
+            .order_by(models.Membros.id_membro))
+
+#Agrega por faixas de tamanho_lote ids de membro: cada statement é curto, em vez de um GROUP BY sobre a tabela inteira
+def relatorio_membros_lotes(db : Session, tamanho_lote : int = TAMANHO_LOTE):
+    after = 0
+    while True:
+        ate = db.execute(select(models.Membros.id_membro).where(models.Membros.id_membro > after)
+                         .order_by(models.Membros.id_membro).offset(tamanho_lote - 1).limit(1)).scalar()
+        stmt = select_relatorio_membros().where(models.Membros.id_membro > after)
+        if ate is not None:
+            stmt = stmt.where(models.Membros.id_membro <= ate)
+        linhas = db.execute(stmt).all()
+        if linhas:
+            yield linhas
+        if ate is None:
+            break
+        after = ate
+
+def contar(db : Session, modelo):
+    return db.execute(select(func.count()).select_from(modelo)).scalar()
+
+
+#Linhas de assinaturas e assinaturas_arquivadas com id em (after, ate), em ordem de id, para o snapshot de analitico.py.
+#As arquivadas vêm com versao 0 e arquivada 1
+def linhas_analiticas(db : Session, after : int = 0, ate : Optional[int] = None, limit : int = TAMANHO_LOTE):
+    def trecho(modelo, versao, arquivada):
+        stmt = (select(modelo.id_assinatura, modelo.id_membro, modelo.id_plano, modelo.data_ativacao, modelo.ativo,
+                       versao.label('versao'), literal(arquivada).label('arquivada'))
+                .where(modelo.id_assinatura > after))
+        if ate is not None:
+            stmt = stmt.where(modelo.id_assinatura < ate)
+        return select(stmt.order_by(modelo.id_assinatura).limit(limit).subquery())
+    uniao = union_all(trecho(models.Assinaturas, models.Assinaturas.versao, 0),
+                      trecho(models.AssinaturasArquivadas, literal(0), 1)).subquery()
+    return db.execute(select(uniao).order_by(uniao.c.id_assinatura).limit(limit)).all()
+
+#Contagem e soma das versões por bloco de ids de tamanho `bloco`, agregadas no banco; como toda escrita
+#incrementa versao, um bloco cujo resumo mudou teve linhas inseridas, alteradas, apagadas ou arquivadas
+def resumo_blocos_analiticos(db : Session, bloco : int):
+    def por_bloco(modelo, *agregados):
+        inicio = (modelo.id_assinatura - modelo.id_assinatura % bloco).label('bloco')
+        return {linha[0]: tuple(linha[1:]) for linha in db.execute(select(inicio, func.count(), *agregados).group_by(inicio))}
+    return por_bloco(models.Assinaturas, func.sum(models.Assinaturas.versao)), por_bloco(models.AssinaturasArquivadas)
+
+
+###############
+#JOBS
+###############
+
+ESTADOS_JOB_ABERTOS = ('pendente', 'executando')
+
+def create_job(db : Session, relatorio : str, parametros : dict):
+    db_job = models.Jobs(id_job=uuid.uuid4().hex, relatorio=relatorio, parametros=json.dumps(parametros),
+                         estado='pendente', progresso=0, linhas=0, criado_em=datetime.now())
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_job(db : Session, id_job : str):
+    return db.query(models.Jobs).filter(models.Jobs.id_job == id_job).first()
+
+def contar_jobs_abertos(db : Session):
+    return db.query(func.count(models.Jobs.id_job)).filter(models.Jobs.estado.in_(ESTADOS_JOB_ABERTOS)).scalar()
+
+def get_jobs_pendentes(db : Session):
+    return [id_job for (id_job,) in db.query(models.Jobs.id_job).filter(models.Jobs.estado == 'pendente')
+            .order_by(models.Jobs.criado_em)]
+
+#Passa o job de pendente para executando num UPDATE condicional: se dois processos recebem o mesmo job
+#(por exemplo, reenfileirado por dois workers ao subir), só um deles o executa
+def iniciar_job(db : Session, id_job : str):
+    iniciados = atualizar(db, models.Jobs, [models.Jobs.id_job == id_job, models.Jobs.estado == 'pendente'],
+                          {'estado': 'executando', 'iniciado_em': datetime.now()})
+    db.commit()
+    return get_job(db, id_job) if iniciados else None
+
+def progresso_job(db : Session, id_job : str, progresso : float, linhas : int):
+    atualizar(db, models.Jobs, [models.Jobs.id_job == id_job], {'progresso': progresso, 'linhas': linhas})
+    db.commit()
+
+def concluir_job(db : Session, id_job : str, arquivo : str, linhas : int):
+    atualizar(db, models.Jobs, [models.Jobs.id_job == id_job],
+              {'estado': 'concluido', 'progresso': 1, 'linhas': linhas, 'arquivo': arquivo, 'concluido_em': datetime.now()})
+    db.commit()
+
+def falhar_job(db : Session, id_job : str, erro : str):
+    atualizar(db, models.Jobs, [models.Jobs.id_job == id_job],
+              {'estado': 'falhou', 'erro': erro[:1024], 'concluido_em': datetime.now()})
+    db.commit()
+
+#Jobs que passaram do prazo executando: o processo que os rodava morreu no meio
+def expirar_jobs(db : Session, antes_de : datetime):
+    expirados = atualizar(db, models.Jobs, [models.Jobs.estado == 'executando', models.Jobs.iniciado_em < antes_de],
+                          {'estado': 'falhou', 'erro': 'Interrompido: passou de JOBS_TIMEOUT executando',
+                           'concluido_em': datetime.now()})
     db.commit()
-    return {'Deletado': db_assinaturas}
+    return expirados
@@ -0,0 +1,235 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+
+import crud
+import models
+import schemas
+
+#Versões assíncronas das funções de crud.py, usadas quando ASYNC_DB=1.
+#Qualquer função de crud.py sem versão nativa aqui é executada via AsyncSession.run_sync,
+#que roda o código síncrono sobre a conexão assíncrona sem bloquear o event loop.
+
+def __getattr__(nome):
+    func = getattr(crud, nome)
+    if not callable(func):
+        return func
+    async def via_run_sync(db : AsyncSession, *args, **kwargs):
+        return await db.run_sync(func, *args, **kwargs)
+    return via_run_sync
+
+#Adaptador para o modo síncrono: expõe crud.py com a mesma interface awaitable, rodando no threadpool
+class EmThreadpool:
+    def __init__(self, modulo):
+        self.modulo = modulo
+
+    def __getattr__(self, nome):
+        func = getattr(self.modulo, nome)
+        if not callable(func):
+            return func
+        async def via_threadpool(*args, **kwargs):
+            return await run_in_threadpool(func, *args, **kwargs)
+        return via_threadpool
+
+async def paginar(db : AsyncSession, stmt, coluna, limit : int, after : Optional[int] = None):
+    limit = max(1, min(limit, crud.LIMITE_MAXIMO))
+    if after is not None:
+        stmt = stmt.where(coluna > after)
+    itens = (await db.execute(stmt.order_by(coluna).limit(limit + 1))).scalars().all()
+    return crud.montar_pagina(itens, coluna, limit)
+
+async def paginar_linhas(db : AsyncSession, stmt, coluna, limit : int, after : Optional[int] = None):
+    limit = max(1, min(limit, crud.LIMITE_MAXIMO))
+    if after is not None:
+        stmt = stmt.where(coluna > after)
+    linhas = (await db.execute(stmt.order_by(coluna).limit(limit + 1))).all()
+    return crud.pagina_linhas(crud.montar_pagina(linhas, coluna, limit))
+
+async def primeiro(db : AsyncSession, stmt):
+    return (await db.execute(stmt.limit(1))).scalars().first()
+
+async def ler_cache(db : AsyncSession, cache_db, chave, carregar):
+    if cache_db.precisa_checar_versao():
+        cache_db.sincronizar_versao((await db.execute(crud.select_versao_cache(cache_db.nome))).scalar() or 0)
+    encontrado, valor = cache_db.get(chave)
+    if not encontrado:
+        valor = await carregar()
+        cache_db.put(chave, valor)
+    return valor
+
+async def incrementar_versao_cache(db : AsyncSession, nome : str):
+    if (await db.execute(crud.update_versao_cache(nome))).rowcount == 0:
+        db.add(models.VersoesCache(nome=nome, versao=1))
+
+###############
+#MEMBROS
+###############
+
+async def get_membros(db: AsyncSession, limit : int = crud.LIMITE_PADRAO, after : Optional[int] = None):
+    return await paginar(db, select(models.Membros), models.Membros.id_membro, limit, after)
+
+async def get_membros_linhas(db: AsyncSession, limit : int = crud.LIMITE_PADRAO, after : Optional[int] = None):
+    return await paginar_linhas(db, select(*crud.COLUNAS_MEMBROS), models.Membros.id_membro, limit, after)
+
+async def get_membro_id(db : AsyncSession, id_membro : int):
+    return await primeiro(db, select(models.Membros).where(models.Membros.id_membro == id_membro))
+
+async def get_membro_celular(db : AsyncSession, celular : int):
+    return await primeiro(db, select(models.Membros).where(models.Membros.celular == celular))
+
+async def crate_membro(db : AsyncSession, membro: schemas.MembrosCreate):
+    db_membro = models.Membros(nome = membro.nome, sobrenome = membro.sobrenome, celular = membro.celular,
+                               **crud.campos_busca(membro.nome, membro.sobrenome))
+    db.add(db_membro)
+    await db.commit()
+    await db.refresh(db_membro)
+    return db_membro
+
+async def update_membro (db : AsyncSession, membro: schemas.MembrosBase, versao_esperada : Optional[int] = None):
+    db_membro = await get_membro_id(db, id_membro=membro.id_membro)
+    if db_membro is None:
+        return None
+    if versao_esperada is not None and db_membro.versao != versao_esperada:
+        raise crud.ConflitoVersao()
+    if membro.nome:
+        db_membro.nome = membro.nome
+    if membro.sobrenome:
+        db_membro.sobrenome = membro.sobrenome
+    if membro.celular:
+        db_membro.celular = membro.celular
+    db_membro.nome_busca = crud.normalizar_busca(db_membro.nome)
+    db_membro.sobrenome_busca = crud.normalizar_busca(db_membro.sobrenome)
+    await db.commit()
+    await db.refresh(db_membro)
+    return db_membro
+
+async def executar_deletes(db : AsyncSession, statements):
+    apagados = 0
+    for conta, stmt in statements:
+        rowcount = (await db.execute(stmt)).rowcount
+        if conta:
+            apagados += rowcount
+    return apagados
+
+async def delete_membros(db : AsyncSession, ids, cascata : Optional[str] = None):
+    apagados = await executar_deletes(db, crud.statements_delete_membros(ids, cascata))
+    await db.commit()
+    return apagados
+
+async def delete_membro (db : AsyncSession, id_membro: int, cascata : Optional[str] = None):
+    return await delete_membros(db, [id_membro], cascata)
+
+
+###############
+#PLANOS
+###############
+
+async def get_planos(db: AsyncSession, limit : int = crud.LIMITE_PADRAO, after : Optional[int] = None):
+    async def carregar():
+        pagina = await paginar(db, select(models.Planos), models.Planos.id_plano, limit, after)
+        return {'items': [crud.plano_schema(p) for p in pagina['items']], 'next_cursor': pagina['next_cursor']}
+    return await ler_cache(db, crud.cache_planos, ('pagina', limit, after), carregar)
+
+async def get_planos_id(db : AsyncSession, id_plano : int):
+    async def carregar():
+        return crud.plano_schema(await primeiro(db, select(models.Planos).where(models.Planos.id_plano == id_plano)))
+    return await ler_cache(db, crud.cache_planos, ('id', id_plano), carregar)
+
+async def get_planos_nome(db : AsyncSession, nome : str):
+    async def carregar():
+        return crud.plano_schema(await primeiro(db, select(models.Planos).where(models.Planos.nome == nome)))
+    return await ler_cache(db, crud.cache_planos, ('nome', nome), carregar)
+
+async def create_plano(db : AsyncSession, plano: schemas.PlanosCreate):
+    db_plano = models.Planos(nome = plano.nome, preco = plano.preco, duracao_dias = plano.duracao_dias )
+    db.add(db_plano)
+    await incrementar_versao_cache(db, 'planos')
+    await db.commit()
+    crud.cache_planos.invalidar()
+    await db.refresh(db_plano)
+    return db_plano
+
+async def update_plano (db : AsyncSession, plano: schemas.PlanosBase, versao_esperada : Optional[int] = None):
+    db_plano = await primeiro(db, select(models.Planos).where(models.Planos.id_plano == plano.id_plano))
+    if db_plano is None:
+        return None
+    if versao_esperada is not None and db_plano.versao != versao_esperada:
+        raise crud.ConflitoVersao()
+    if plano.nome:
+        db_plano.nome = plano.nome
+    if plano.preco:
+        db_plano.preco = plano.preco
+    if plano.duracao_dias:
+        db_plano.duracao_dias = plano.duracao_dias
+    await incrementar_versao_cache(db, 'planos')
+    await db.commit()
+    crud.cache_planos.invalidar()
+    await db.refresh(db_plano)
+    return db_plano
+
+async def delete_plano (db : AsyncSession, id_plano: int):
+    apagados = await executar_deletes(db, crud.statements_delete(models.Planos, models.Planos.id_plano, [id_plano]))
+    if apagados:
+        await incrementar_versao_cache(db, 'planos')
+    await db.commit()
+    if apagados:
+        crud.cache_planos.invalidar()
+    return apagados
+
+
+###############
+#ASSINATURAS (MEMBRO-PLANO)
+###############
+
+async def get_assinaturas(db: AsyncSession, limit : int = crud.LIMITE_PADRAO, after : Optional[int] = None, expand : set = frozenset()):
+    stmt = select(models.Assinaturas).options(*crud.opcoes_expand(expand))
+    return await paginar(db, stmt, models.Assinaturas.id_assinatura, limit, after)
+
+async def get_assinaturas_linhas(db: AsyncSession, limit : int = crud.LIMITE_PADRAO, after : Optional[int] = None):
+    return await paginar_linhas(db, select(*crud.COLUNAS_ASSINATURAS), models.Assinaturas.id_assinatura, limit, after)
+
+async def get_assinatura_id(db : AsyncSession, id_assinatura : int, expand : set = frozenset()):
+    stmt = select(models.Assinaturas).options(*crud.opcoes_expand(expand))
+    return await primeiro(db, stmt.where(models.Assinaturas.id_assinatura == id_assinatura))
+
+async def create_assinatura(db : AsyncSession, assinatura: schemas.AssinaturasCreate):
+    db_assinatura = models.Assinaturas(ativo = assinatura.ativo, data_ativacao = assinatura.data_ativacao, id_membro = assinatura.id_membro, id_plano = assinatura.id_plano )
+    db.add(db_assinatura)
+    await db.commit()
+    await db.refresh(db_assinatura)
+    return db_assinatura
+
+async def exportar_assinaturas(db : AsyncSession, formato : str):
+    try:
+        resultado = await db.stream(crud.select_export_assinaturas())
+        if formato == 'csv':
+            yield crud.formatar_export([], formato, cabecalho=True)
+        async for linhas in resultado.partitions(crud.TAMANHO_LOTE):
+            yield crud.formatar_export(linhas, formato)
+    finally:
+        await db.close()
+
+async def update_assinatura (db : AsyncSession, assinatura: schemas.Assinaturas, versao_esperada : Optional[int] = None):
+    db_assinatura = await get_assinatura_id(db, id_assinatura=assinatura.id_assinatura)
+    if db_assinatura is None:
+        return None
+    if versao_esperada is not None and db_assinatura.versao != versao_esperada:
+        raise crud.ConflitoVersao()
+    if assinatura.ativo is not None:
+        db_assinatura.ativo = assinatura.ativo
+    if assinatura.data_ativacao:
+        db_assinatura.data_ativacao = assinatura.data_ativacao
+    if assinatura.id_membro:
+        db_assinatura.id_membro = assinatura.id_membro
+    if assinatura.id_plano:
+        db_assinatura.id_plano = assinatura.id_plano
+    await db.commit()
+    await db.refresh(db_assinatura)
+    return db_assinatura
+
+async def delete_assinaturas (db : AsyncSession, id_assinatura: int):
+    stmts = crud.statements_delete(models.Assinaturas, models.Assinaturas.id_assinatura, [id_assinatura])
+    apagados = await executar_deletes(db, stmts)
+    await db.commit()
+    return apagados
@@ -1,29 +1,427 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy_utils import database_exists, create_database
-from dotenv import load_dotenv
-import os
-
-load_dotenv('.env')
-
-SERVER = os.getenv("SERVER")
-USERNAME = os.getenv("USERNAME")
-PASSWORD = os.getenv("PASSWORD")
-DB = os.getenv("DB")
-
-SQLALCHEMY_DATABASE_URL = f"mysql://{USERNAME}:{PASSWORD}@{SERVER}/{DB}"
-sql_script_path = 'assets/db_script.sql'
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-
-if not database_exists(SQLALCHEMY_DATABASE_URL):
-    create_database(SQLALCHEMY_DATABASE_URL)
-    with open(sql_script_path, 'r') as f:
-        sql_script = f.read()
-    with engine.connect() as con:
-        con.execute(sql_script)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base = declarative_base()
\ No newline at end of file
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.sql.dml import UpdateBase
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from datetime import datetime, date
+from decimal import Decimal
+from dotenv import load_dotenv
+import hashlib
+import itertools
+import os
+import re
+import threading
+import time
+
+load_dotenv('.env')
+
+SERVER = os.getenv("SERVER")
+USERNAME = os.getenv("USERNAME")
+PASSWORD = os.getenv("PASSWORD")
+DB = os.getenv("DB")
+#Com ASYNC_DB=1 as rotas usam o engine assíncrono (aiomysql) em vez do síncrono no threadpool
+ASYNC_DB = os.getenv("ASYNC_DB", "0") == "1"
+#Com DB_BOOTSTRAP=1 cada worker prepara o schema ao subir; o padrão é rodar python migracoes.py uma vez por deploy
+DB_BOOTSTRAP = os.getenv("DB_BOOTSTRAP", "0") == "1"
+
+#Pool de conexões, por worker. Veja no README como dimensionar para N workers
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+#Recicla conexões antes do wait_timeout do MySQL (28800s por padrão) derrubá-las
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+#Com DB_SQLITE=caminho/do/arquivo.sqlite o app usa um SQLite embutido nesse arquivo em vez do MySQL,
+#para unidades que rodam a API numa única máquina
+SQLITE_ARQUIVO = os.getenv("DB_SQLITE")
+
+#DATABASE_URL e ASYNC_DATABASE_URL, se definidas, substituem a URL do MySQL montada acima ou a de DB_SQLITE
+#(os benchmarks usam isso para rodar contra um arquivo SQLite local)
+if SQLITE_ARQUIVO:
+    URL_PADRAO, ASYNC_URL_PADRAO = f"sqlite:///{SQLITE_ARQUIVO}", f"sqlite+aiosqlite:///{SQLITE_ARQUIVO}"
+else:
+    URL_PADRAO, ASYNC_URL_PADRAO = f"mysql://{USERNAME}:{PASSWORD}@{SERVER}/{DB}", f"mysql+aiomysql://{USERNAME}:{PASSWORD}@{SERVER}/{DB}"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL") or URL_PADRAO
+SQLALCHEMY_ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or ASYNC_URL_PADRAO
+
+#Ajustes de um banco SQLite em arquivo (veja configurar_sqlite); DB_SQLITE_AJUSTES=0 usa o SQLite como vem
+SQLITE_AJUSTES = os.getenv("DB_SQLITE_AJUSTES", "1") == "1"
+SQLITE_SYNCHRONOUS = os.getenv("DB_SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_MS = int(os.getenv("DB_SQLITE_BUSY_MS", "5000"))
+SQLITE_CACHE_MB = int(os.getenv("DB_SQLITE_CACHE_MB", "64"))
+SQLITE_MMAP_MB = int(os.getenv("DB_SQLITE_MMAP_MB", "256"))
+
+#Log de consultas lentas, desligado por padrão: com DB_LENTA_MS > 0, todo statement que levar mais que isso
+#entra num anel em memória de DB_LENTAS_MAX itens, exposto em GET /admin/consultas-lentas
+LENTA_MS = float(os.getenv("DB_LENTA_MS", "0"))
+LENTAS_MAX = int(os.getenv("DB_LENTAS_MAX", "200"))
+#Formas distintas guardadas, com o plano de cada uma; acima disso sai a usada há mais tempo
+LENTAS_FORMAS_MAX = int(os.getenv("DB_LENTAS_FORMAS_MAX", "500"))
+
+#Réplicas de leitura, URLs separadas por vírgula. As rotas GET leem delas (em rodízio) e as escritas
+#ficam no primário; sem réplicas configuradas, tudo vai para o primário
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+ASYNC_REPLICA_URLS = [url.strip() for url in os.getenv("ASYNC_DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+def sqlite_em_arquivo(url : str):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+#No SQLite em arquivo com os ajustes, as leituras sem réplicas configuradas vão para um engine de leitura
+#no mesmo arquivo: com WAL elas não esperam pelo escritor e enxergam cada commit na hora
+SQLITE_LEITORES = SQLITE_AJUSTES and sqlite_em_arquivo(SQLALCHEMY_DATABASE_URL)
+
+#Por quantos segundos depois de uma escrita as leituras do mesmo cliente continuam no primário,
+#para que ele veja o que acabou de escrever mesmo com atraso de replicação (que o SQLite local não tem)
+JANELA_PRIMARIO = float(os.getenv("DB_JANELA_PRIMARIO", "0" if SQLITE_LEITORES and not REPLICA_URLS else "5"))
+
+
+#Métricas do pool: tempo esperando por uma conexão livre e quantos checkouts estouraram o timeout
+class MetricasPool:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self._lock = threading.Lock()
+
+    def registrar(self, espera : float, timeout : bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timeout
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+
+class PoolMedido(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metricas = MetricasPool()
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexao = super()._do_get()
+        except PoolTimeoutError:
+            self.metricas.registrar(time.perf_counter() - inicio, timeout=True)
+            raise
+        self.metricas.registrar(time.perf_counter() - inicio)
+        return conexao
+
+class PoolAsyncMedido(AsyncAdaptedQueuePool, PoolMedido):
+    pass
+
+def opcoes_pool(poolclass, url):
+    opcoes = dict(poolclass=poolclass, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT,
+                  pool_recycle=POOL_RECYCLE, pool_pre_ping=POOL_PRE_PING)
+    if url.startswith("sqlite"):
+        #As conexões do pool passam entre as threads do threadpool
+        opcoes["connect_args"] = {"check_same_thread": False}
+    return opcoes
+
+#SQLite em arquivo, com DB_SQLITE_AJUSTES=1:
+#- WAL: leitores e o escritor não se bloqueiam, e um commit é um append no arquivo -wal
+#- synchronous NORMAL: com WAL, um commit não faz fsync; uma queda de energia perde no máximo as últimas
+#  transações, sem corromper o arquivo
+#- foreign_keys: as chaves estrangeiras valem como no MySQL
+#- busy_timeout: um escritor de outro processo (outro worker, um job, o cron) é esperado em vez de
+#  falhar na hora com "database is locked"
+#- cache de páginas, mmap e tabelas temporárias em memória
+#O engine de escrita tem uma única conexão, que serializa as escritas do worker no próprio pool, e abre as
+#transações com BEGIN IMMEDIATE: o lock de escrita é pego no início, e não na primeira escrita, onde uma
+#transação que já leu não pode mais esperar e falharia. Os leitores abrem com BEGIN e são somente leitura
+def pragmas_sqlite(escritor : bool):
+    pragmas = ["PRAGMA journal_mode=WAL", f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}", "PRAGMA foreign_keys=ON",
+               f"PRAGMA busy_timeout={SQLITE_BUSY_MS}", f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}",
+               "PRAGMA temp_store=MEMORY", f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}"]
+    if not escritor:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+def configurar_sqlite(engine, escritor : bool):
+    pragmas = pragmas_sqlite(escritor)
+
+    #O driver abre transações por conta própria, só antes de um INSERT/UPDATE/DELETE; sem isolation_level
+    #quem abre é o evento begin abaixo
+    @event.listens_for(engine, "connect")
+    def conectar(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    #BEGIN direto no cursor do driver, fora dos eventos de cursor do SQLAlchemy: não conta como query
+    #nas métricas por requisição nem entra no log de consultas lentas
+    @event.listens_for(engine, "begin")
+    def iniciar(conn):
+        cursor = conn.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE" if escritor else "BEGIN")
+        cursor.close()
+
+def criar_engine(url : str, assincrono : bool = False, escritor : bool = True):
+    opcoes = opcoes_pool(PoolAsyncMedido if assincrono else PoolMedido, url)
+    ajustar = SQLITE_AJUSTES and sqlite_em_arquivo(url)
+    if ajustar and escritor:
+        opcoes.update(pool_size=1, max_overflow=0)
+    engine = create_async_engine(url, **opcoes) if assincrono else create_engine(url, **opcoes)
+    if ajustar:
+        configurar_sqlite(getattr(engine, 'sync_engine', engine), escritor)
+    return engine
+
+def estatisticas_pool(engine):
+    pool = engine.pool
+    metricas = pool.metricas
+    return {'tamanho': pool.size(), 'em_uso': pool.checkedout(), 'livres': pool.checkedin(),
+            'overflow': pool.overflow(), 'checkouts': metricas.checkouts, 'timeouts': metricas.timeouts,
+            'espera_total_s': round(metricas.espera_total, 6), 'espera_maxima_s': round(metricas.espera_maxima, 6)}
+
+
+#Os engines são criados no primeiro uso, e não na importação: importar este módulo (ou main.py)
+#não abre conexões nem exige que o banco esteja no ar. O schema é preparado por migracoes.py
+_engines = {}
+_lock_engines = threading.Lock()
+_proxima_replica = itertools.count()
+
+def _engine(nome, criar):
+    with _lock_engines:
+        if nome not in _engines:
+            _engines[nome] = criar()
+        return _engines[nome]
+
+def get_engine():
+    return _engine('sync', lambda: criar_engine(SQLALCHEMY_DATABASE_URL))
+
+def get_async_engine():
+    return _engine('async', lambda: criar_engine(SQLALCHEMY_ASYNC_DATABASE_URL, assincrono=True))
+
+def get_engine_replica():
+    if not REPLICA_URLS:
+        if SQLITE_LEITORES:
+            return _engine('leitura', lambda: criar_engine(SQLALCHEMY_DATABASE_URL, escritor=False))
+        return get_engine()
+    indice = next(_proxima_replica) % len(REPLICA_URLS)
+    url = REPLICA_URLS[indice]
+    return _engine(f'replica_{indice}', lambda: criar_engine(url, escritor=False))
+
+def get_async_engine_replica():
+    if not ASYNC_REPLICA_URLS:
+        if SQLITE_LEITORES and sqlite_em_arquivo(SQLALCHEMY_ASYNC_DATABASE_URL):
+            return _engine('async_leitura', lambda: criar_engine(SQLALCHEMY_ASYNC_DATABASE_URL, assincrono=True, escritor=False))
+        return get_async_engine()
+    indice = next(_proxima_replica) % len(ASYNC_REPLICA_URLS)
+    url = ASYNC_REPLICA_URLS[indice]
+    return _engine(f'async_replica_{indice}', lambda: criar_engine(url, assincrono=True, escritor=False))
+
+def engines_criados():
+    with _lock_engines:
+        return dict(_engines)
+
+def estatisticas_pools():
+    return {nome: estatisticas_pool(getattr(engine, 'sync_engine', engine)) for nome, engine in engines_criados().items()}
+
+async def fechar_engines():
+    with _lock_engines:
+        engines = dict(_engines)
+        _engines.clear()
+    for engine in engines.values():
+        if hasattr(engine, 'sync_engine'):
+            await engine.dispose()
+        else:
+            engine.dispose()
+
+#Compatibilidade com "database.engine" / "database.async_engine": criam o engine no primeiro acesso
+def __getattr__(nome):
+    if nome == 'engine':
+        return get_engine()
+    if nome == 'async_engine':
+        return get_async_engine()
+    raise AttributeError(nome)
+
+
+#Ligada pelo middleware de main.py nas requisições de leitura. Fora de uma requisição
+#(migrações, expiração, jobs) fica desligada e tudo vai para o primário
+ler_da_replica = ContextVar('ler_da_replica', default=False)
+
+#Clientes que escreveram há menos de JANELA_PRIMARIO segundos, neste worker
+class JanelaPrimario:
+    def __init__(self, segundos : float, maxsize : int = 100000):
+        self.segundos = segundos
+        self.maxsize = maxsize
+        self._escritas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def registrar(self, cliente : str):
+        with self._lock:
+            self._escritas[cliente] = time.monotonic()
+            self._escritas.move_to_end(cliente)
+            while len(self._escritas) > self.maxsize:
+                self._escritas.popitem(last=False)
+
+    def ativa(self, cliente : str):
+        with self._lock:
+            escrita = self._escritas.get(cliente)
+        return escrita is not None and time.monotonic() - escrita < self.segundos
+
+janela_primario = JanelaPrimario(JANELA_PRIMARIO)
+
+#As sessões resolvem o engine na hora de executar, não na criação. Numa leitura, a sessão escolhe
+#uma réplica no primeiro statement e fica nela; flush e INSERT/UPDATE/DELETE vão sempre para o primário
+class Sessao(Session):
+    _replica = None
+
+    def usa_replica(self, clause):
+        return ler_da_replica.get() and not self._flushing and not isinstance(clause, UpdateBase)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.usa_replica(clause):
+            if self._replica is None:
+                self._replica = get_engine_replica()
+            return self._replica
+        return get_engine()
+
+class SessaoAsync(Sessao):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.usa_replica(clause):
+            if self._replica is None:
+                self._replica = get_async_engine_replica().sync_engine
+            return self._replica
+        return get_async_engine().sync_engine
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=Sessao)
+
+AsyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False,
+                                 class_=AsyncSession, sync_session_class=SessaoAsync)
+
+Base = declarative_base()
+
+###############
+#CONSULTAS LENTAS
+###############
+
+#Scope ASGI da requisição em andamento, ligado pelo middleware de main.py; dá a rota que disparou a consulta
+requisicao_atual = ContextVar('requisicao_atual', default=None)
+
+#Listas de placeholders de um IN expandido ("?, ?, ?" ou "%s, %s"), tuplas repetidas de um INSERT de várias
+#linhas ("VALUES (?, ?), (?, ?)") e espaços viram uma forma só, para que o mesmo statement com listas
+#ou lotes de tamanhos diferentes conte como a mesma forma. Os nomes dos parâmetros (%(nome_m0)s) mudam
+#de linha para linha, por isso viram %s antes
+_PARAMETRO_NOMEADO = re.compile(r"%\(\w+\)s")
+_LISTA_PLACEHOLDERS = re.compile(r"(\?|%s)(\s*,\s*(\?|%s))+")
+_TUPLAS_REPETIDAS = re.compile(r"(\([^()]*\))(\s*,\s*\1)+")
+_ESPACOS = re.compile(r"\s+")
+_EXPLICAVEIS = ("select", "update", "delete", "with")
+PREFIXO_EXPLAIN = {"sqlite": "EXPLAIN QUERY PLAN ", "mysql": "EXPLAIN ", "postgresql": "EXPLAIN "}
+
+def forma_statement(statement : str):
+    forma = _LISTA_PLACEHOLDERS.sub(r"\1, ...", _PARAMETRO_NOMEADO.sub("%s", statement))
+    return _ESPACOS.sub(" ", _TUPLAS_REPETIDAS.sub(r"\1, ...", forma)).strip()
+
+#Os valores nunca vão para o log (nomes e celulares são dados pessoais), só o tipo e o tamanho
+def mascarar(valor):
+    if isinstance(valor, dict):
+        return {chave: mascarar(item) for chave, item in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [mascarar(item) for item in valor]
+    if valor is None or isinstance(valor, bool):
+        return valor
+    if isinstance(valor, (int, float, Decimal)):
+        return "<número>"
+    if isinstance(valor, (str, bytes)):
+        return f"<texto:{len(valor)}>"
+    if isinstance(valor, (datetime, date)):
+        return "<data>"
+    return f"<{type(valor).__name__}>"
+
+def rota_requisicao():
+    escopo = requisicao_atual.get()
+    if escopo is None:
+        return None
+    rota = escopo.get("route")
+    return f"{escopo.get('method')} {rota.path if rota is not None else escopo.get('path')}"
+
+class ConsultasLentas:
+    def __init__(self, limite_ms : float, maximo : int, maximo_formas : int = LENTAS_FORMAS_MAX):
+        self.limite_ms = limite_ms
+        self.registradas = 0
+        self.maximo_formas = maximo_formas
+        self._anel = deque(maxlen=maximo)
+        self._formas = OrderedDict()
+        self._lock = threading.Lock()
+
+    #O EXPLAIN roda num cursor novo da mesma conexão (que vê a mesma transação), uma vez por forma;
+    #uma falha fica registrada no lugar do plano e não afeta a consulta original
+    def explicar(self, conn, statement : str, parameters):
+        prefixo = PREFIXO_EXPLAIN.get(conn.dialect.name)
+        if prefixo is None or not statement.lstrip().lower().startswith(_EXPLICAVEIS):
+            return None
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute(prefixo + statement, parameters)
+                return [list(linha) for linha in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception as erro:
+            return f"EXPLAIN falhou: {erro}"
+
+    #Com stream_results o resultado da consulta original continua aberto na conexão (no MySQL, sem buffer),
+    #e um EXPLAIN na mesma conexão antes do fim da leitura falharia com "Commands out of sync"
+    def registrar(self, conn, statement : str, parameters, executemany : bool, duracao_ms : float, streaming : bool = False):
+        forma = forma_statement(statement)
+        chave = hashlib.blake2b(forma.encode(), digest_size=6).hexdigest()
+        with self._lock:
+            resumo = self._formas.get(chave)
+            nova = resumo is None
+            if nova:
+                resumo = self._formas[chave] = {'forma': chave, 'sql': forma, 'plano': None, 'ocorrencias': 0, 'ms_maximo': 0.0}
+                if len(self._formas) > self.maximo_formas:
+                    self._formas.popitem(last=False)
+            else:
+                self._formas.move_to_end(chave)
+        if nova:
+            plano = None if executemany or streaming else self.explicar(conn, statement, parameters)
+            with self._lock:
+                resumo['plano'] = plano
+        entrada = {'em': datetime.now(), 'ms': round(duracao_ms, 3), 'rota': rota_requisicao(), 'forma': chave,
+                   'banco': conn.dialect.name, 'sql': statement,
+                   'parametros': f"<executemany: {len(parameters)} linhas>" if executemany else mascarar(parameters)}
+        with self._lock:
+            resumo['ocorrencias'] += 1
+            resumo['ms_maximo'] = max(resumo['ms_maximo'], entrada['ms'])
+            self._anel.append(entrada)
+            self.registradas += 1
+
+    def instrumentar(self, engine):
+        @event.listens_for(engine, "before_cursor_execute")
+        def antes(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('inicio_lenta', []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def depois(conn, cursor, statement, parameters, context, executemany):
+            duracao_ms = (time.perf_counter() - conn.info['inicio_lenta'].pop()) * 1000
+            if duracao_ms >= self.limite_ms:
+                streaming = context is not None and bool(context.execution_options.get("stream_results"))
+                self.registrar(conn, statement, parameters, executemany, duracao_ms, streaming)
+
+    #Mais recentes primeiro; as formas vêm ordenadas pelo pior tempo
+    def listar(self, limite : int = None):
+        with self._lock:
+            consultas = list(self._anel)[::-1][:limite]
+            formas = sorted((dict(resumo) for resumo in self._formas.values()), key=lambda resumo: -resumo['ms_maximo'])
+            return {'limite_ms': self.limite_ms, 'registradas': self.registradas, 'consultas': consultas, 'formas': formas}
+
+    def limpar(self):
+        with self._lock:
+            self._anel.clear()
+            self._formas.clear()
+
+consultas_lentas = ConsultasLentas(LENTA_MS, LENTAS_MAX)
+#Ligado na classe Engine, vale para todos os engines, inclusive réplicas e os assíncronos
+if LENTA_MS > 0:
+    consultas_lentas.instrumentar(Engine)
@@ -0,0 +1,57 @@
+"""Expiração de assinaturas: desativa (ativo = 0) as que passaram de data_ativacao + duracao_dias do plano.
+
+Roda em UPDATEs de até EXPIRACAO_LOTE linhas, com um commit por lote, para não segurar locks
+longos na tabela de assinaturas. Pode ser executada pela linha de comando, por exemplo num cron:
+
+    python expiracao.py --lote 1000
+
+ou periodicamente dentro do app, com EXPIRACAO_INTERVALO (segundos) maior que zero. Cada worker
+roda sua própria tarefa; como a expiração é idempotente isso é seguro, mas com vários workers
+prefira o cron ou habilite o intervalo em um só deles.
+"""
+from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+import argparse
+import asyncio
+import logging
+import os
+
+import crud
+from database import SessionLocal
+
+TAMANHO_LOTE = int(os.getenv("EXPIRACAO_LOTE", "1000"))
+INTERVALO = float(os.getenv("EXPIRACAO_INTERVALO", "0"))
+
+logger = logging.getLogger(__name__)
+
+#Resultado da última execução neste processo, exposto em GET /admin/expiracao
+ultima_execucao = None
+
+
+def expirar(tamanho_lote : int = TAMANHO_LOTE):
+    global ultima_execucao
+    db = SessionLocal()
+    try:
+        resultado = crud.expirar_assinaturas(db, tamanho_lote=tamanho_lote)
+    finally:
+        db.close()
+    resultado['em'] = datetime.now().replace(microsecond=0)
+    ultima_execucao = resultado
+    return resultado
+
+#Tarefa do lifespan: expira no threadpool a cada intervalo; uma falha é registrada e a próxima rodada tenta de novo
+async def executar_periodicamente(intervalo : float = INTERVALO):
+    while True:
+        try:
+            await run_in_threadpool(expirar)
+        except Exception:
+            logger.exception("Falha ao expirar assinaturas")
+        await asyncio.sleep(intervalo)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="linhas por UPDATE")
+    args = parser.parse_args()
+    for nome, valor in expirar(args.lote).items():
+        print(nome, valor)
@@ -0,0 +1,254 @@
+"""Jobs de relatório: POST /jobs/{relatorio} grava um job pendente na tabela jobs e o entrega a um pool
+de processos separado dos workers da API. O processo do job escreve o resultado num arquivo em JOBS_DIR
+e o progresso na própria tabela, então GET /jobs/{id_job} responde de qualquer worker, e
+GET /jobs/{id_job}/resultado serve o arquivo quando o job termina.
+
+Relatórios:
+
+- assinaturas: exportação completa, com os dados do membro e do plano, em NDJSON ou CSV
+- membros: por membro, total de assinaturas, ativas, receita mensal das ativas e última ativação, em NDJSON ou CSV
+- coortes: o relatório de /relatorios/coortes, calculado num snapshot próprio do processo do job, em JSON
+
+Para que os relatórios não tirem recursos da API:
+
+- cada worker executa no máximo JOBS_PROCESSOS jobs ao mesmo tempo; os demais esperam na fila do pool
+- com JOBS_MAX_ABERTOS jobs pendentes ou executando na tabela, somando todos os workers, POST /jobs
+  responde 429 com Retry-After
+- os processos rodam com prioridade menor (nice JOBS_NICE), leem das réplicas quando configuradas e
+  abrem no máximo duas conexões com o banco
+
+Os processos são criados com spawn no primeiro job, sem herdar as conexões e as threads do worker.
+Na saída do app, os jobs que ainda esperavam no pool continuam pendentes e são reenfileirados quando um
+worker sobe; o UPDATE condicional de crud.iniciar_job garante que cada job rode uma vez. Um job
+executando há mais de JOBS_TIMEOUT segundos (o processo morreu no meio) é marcado como falhou. Com
+mais de uma máquina, JOBS_DIR precisa ser um diretório compartilhado.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import analitico
+import crud
+import database
+import models
+from database import SessionLocal
+
+PROCESSOS = int(os.getenv("JOBS_PROCESSOS", "1"))
+MAX_ABERTOS = int(os.getenv("JOBS_MAX_ABERTOS", "20"))
+DIRETORIO = os.getenv("JOBS_DIR", "jobs_resultados")
+NICE = int(os.getenv("JOBS_NICE", "10"))
+TIMEOUT = float(os.getenv("JOBS_TIMEOUT", "3600"))
+#Intervalo mínimo entre duas gravações do progresso de um job na tabela
+INTERVALO_PROGRESSO = float(os.getenv("JOBS_INTERVALO_PROGRESSO", "1"))
+#Retry-After de POST /jobs quando o limite de jobs abertos foi atingido
+ESPERA_LIMITE = 30
+
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv', 'json': 'application/json'}
+
+logger = logging.getLogger(__name__)
+
+
+###############
+#RELATORIOS
+###############
+
+#Cada relatório recebe a sessão de leitura, o arquivo aberto, os parâmetros do job e a função de
+#progresso, e devolve quantas linhas escreveu
+
+def escrever_lotes(arquivo, formato : str, colunas : list, lotes, total : int, progresso):
+    if formato == 'csv':
+        arquivo.write(crud.formatar_export([], formato, cabecalho=True, colunas=colunas))
+    linhas = 0
+    for lote in lotes:
+        arquivo.write(crud.formatar_export(lote, formato))
+        linhas += len(lote)
+        progresso(linhas, total)
+    return linhas
+
+def exportar_assinaturas(db, arquivo, parametros : dict, progresso):
+    total = crud.contar(db, models.Assinaturas)
+    resultado = db.execute(crud.select_export_assinaturas(), execution_options={'stream_results': True})
+    return escrever_lotes(arquivo, parametros['formato'], crud.COLUNAS_EXPORT, resultado.partitions(crud.TAMANHO_LOTE),
+                          total, progresso)
+
+def relatorio_membros(db, arquivo, parametros : dict, progresso):
+    total = crud.contar(db, models.Membros)
+    return escrever_lotes(arquivo, parametros['formato'], crud.COLUNAS_RELATORIO_MEMBROS,
+                          crud.relatorio_membros_lotes(db), total, progresso)
+
+#O snapshot é montado do zero no processo do job, e a memória dele é devolvida quando o job termina
+def relatorio_coortes(db, arquivo, parametros : dict, progresso):
+    resultado = analitico.SnapshotAssinaturas().relatorio(parametros['meses'])
+    arquivo.write(json.dumps(resultado, default=str))
+    return resultado['snapshot']['linhas']
+
+RELATORIOS = {'assinaturas': exportar_assinaturas, 'membros': relatorio_membros, 'coortes': relatorio_coortes}
+
+def parametros(relatorio : str, formato : str, meses : int):
+    if relatorio == 'coortes':
+        return {'formato': 'json', 'meses': meses}
+    return {'formato': formato}
+
+def descrever(db_job):
+    return {'id_job': db_job.id_job, 'relatorio': db_job.relatorio, 'parametros': json.loads(db_job.parametros),
+            'estado': db_job.estado, 'progresso': db_job.progresso, 'linhas': db_job.linhas, 'erro': db_job.erro,
+            'criado_em': db_job.criado_em, 'iniciado_em': db_job.iniciado_em, 'concluido_em': db_job.concluido_em,
+            'resultado': f"/jobs/{db_job.id_job}/resultado" if db_job.estado == 'concluido' else None}
+
+def caminho_resultado(db_job):
+    return os.path.join(DIRETORIO, db_job.arquivo)
+
+
+###############
+#PROCESSO DO JOB
+###############
+
+#Roda uma vez em cada processo do pool, antes do primeiro job
+def iniciar_processo():
+    database.POOL_SIZE, database.MAX_OVERFLOW = 2, 0
+    if NICE and hasattr(os, 'nice'):
+        os.nice(NICE)
+
+#O progresso e o estado vão para o primário numa sessão própria; o relatório lê em outra, pelas réplicas.
+#O resultado é escrito num arquivo .parcial e renomeado no fim, então um arquivo com o nome final está completo
+def executar(id_job : str):
+    db = SessionLocal()
+    parcial = None
+    try:
+        db_job = crud.iniciar_job(db, id_job)
+        if db_job is None:
+            return None
+        parametros = json.loads(db_job.parametros)
+        nome = f"{id_job}.{parametros['formato']}"
+        caminho = os.path.join(DIRETORIO, nome)
+        parcial = caminho + '.parcial'
+        gravado = [time.monotonic()]
+
+        def progresso(linhas : int, total : int):
+            agora = time.monotonic()
+            if agora - gravado[0] >= INTERVALO_PROGRESSO:
+                gravado[0] = agora
+                crud.progresso_job(db, id_job, min(0.99, linhas / total) if total else 0, linhas)
+
+        token = database.ler_da_replica.set(True)
+        leitura = SessionLocal()
+        try:
+            with open(parcial, 'w', newline='', encoding='utf-8') as arquivo:
+                linhas = RELATORIOS[db_job.relatorio](leitura, arquivo, parametros, progresso)
+        finally:
+            leitura.close()
+            database.ler_da_replica.reset(token)
+        os.replace(parcial, caminho)
+        crud.concluir_job(db, id_job, nome, linhas)
+        return 'concluido'
+    except Exception as erro:
+        logger.exception("Falha no job %s", id_job)
+        db.rollback()
+        crud.falhar_job(db, id_job, f"{type(erro).__name__}: {erro}")
+        if parcial is not None and os.path.exists(parcial):
+            os.remove(parcial)
+        return 'falhou'
+    finally:
+        db.close()
+
+
+###############
+#POOL
+###############
+
+def marcar_falha(id_job : str, erro : str):
+    db = SessionLocal()
+    try:
+        crud.falhar_job(db, id_job, erro)
+    finally:
+        db.close()
+
+#Jobs pendentes reenfileirados na subida, depois de marcar como falhou os que passaram de TIMEOUT executando
+def pendentes(timeout : float = TIMEOUT):
+    db = SessionLocal()
+    try:
+        crud.expirar_jobs(db, antes_de=datetime.now() - timedelta(seconds=timeout))
+        return crud.get_jobs_pendentes(db)
+    finally:
+        db.close()
+
+
+#enviar roda no event loop e o callback de término na thread do executor: os contadores ficam sob lock
+class PoolJobs:
+    def __init__(self, processos : int = PROCESSOS, diretorio : str = DIRETORIO):
+        self.processos = max(1, processos)
+        self.diretorio = diretorio
+        self.enviados = 0
+        self.concluidos = 0
+        self.falhas = 0
+        self._em_andamento = set()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                os.makedirs(self.diretorio, exist_ok=True)
+                self._executor = ProcessPoolExecutor(self.processos, mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=iniciar_processo)
+            return self._executor
+
+    def enviar(self, id_job : str):
+        futuro = self._pool().submit(executar, id_job)
+        with self._lock:
+            self.enviados += 1
+            self._em_andamento.add(id_job)
+        futuro.add_done_callback(lambda futuro: self._terminou(id_job, futuro))
+
+    #Um processo que morre quebra o pool inteiro: o job dele é marcado como falhou e o próximo envio cria outro pool
+    def _terminou(self, id_job : str, futuro):
+        with self._lock:
+            self._em_andamento.discard(id_job)
+            if futuro.cancelled():
+                return
+            erro = futuro.exception()
+            if erro is None:
+                self.concluidos += futuro.result() == 'concluido'
+                self.falhas += futuro.result() == 'falhou'
+                return
+            self.falhas += 1
+            if isinstance(erro, BrokenProcessPool):
+                self._executor = None
+        logger.error("Job %s interrompido: %r", id_job, erro)
+        try:
+            marcar_falha(id_job, f"{type(erro).__name__}: {erro}")
+        except Exception:
+            logger.exception("Falha ao marcar o job %s como falhou", id_job)
+
+    #Com o banco fora do ar na subida, os pendentes ficam para a próxima subida de um worker
+    def reenfileirar(self):
+        try:
+            ids = pendentes()
+        except Exception:
+            logger.exception("Falha ao reenfileirar os jobs pendentes")
+            return 0
+        for id_job in ids:
+            self.enviar(id_job)
+        return len(ids)
+
+    #Cancela os jobs que ainda esperavam no pool (continuam pendentes na tabela); os que estão executando terminam
+    def encerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def estatisticas(self):
+        with self._lock:
+            return {'processos': self.processos, 'iniciado': self._executor is not None,
+                    'em_andamento': len(self._em_andamento), 'enviados': self.enviados,
+                    'concluidos': self.concluidos, 'falhas': self.falhas}
+
+
+pool = PoolJobs()
@@ -1,164 +1,765 @@
-from fastapi import Depends,FastAPI, Request, status, HTTPException, Path
-from fastapi.encoders import jsonable_encoder
-from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from database import SessionLocal, engine
-from typing import List
-import crud
-import schemas
-import models
-from sqlalchemy.orm import Session
-
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-@app.get("/", tags=["Página Inicial"])
-async def projeto_descricao():
-    return {"message": "Bem-vindo ao projeto da academia. Este é um sistema de gerenciamento de membros, planos e assinaturas."}
-
-
-###############
-#MEMBROS
-###############
-
-@app.get("/membros/", response_model=List[schemas.MembrosBase], status_code=200, tags=["Membros"], 
-         description="Retorna a lista de todos os membros, com seus respectivos atributos")
-async def get_membros(db : Session = Depends(get_db)):
-    membros = crud.get_membros(db)
-    return membros
-
-@app.get("/membros/{id_membro}", response_model=schemas.MembrosBase, status_code=200, tags=["Membros"], 
-         description="Retorna um membro pelo seu ID")
-async def get_membro_id(id_membro: int = Path(..., title="ID do membro"), db : Session = Depends(get_db)):
-    db_membro = crud.get_membro_id(db, id_membro=id_membro)
-    if db_membro is None:
-        raise HTTPException(status_code=422, detail="Membro não encontrado")
-    return db_membro
-
-@app.post("/membros/create", response_model=schemas.MembrosBase, status_code=201, tags=["Membros"],
-          description="Adiciona mais um membro novo na base")
-async def create_membros(membro: schemas.MembrosCreate, db : Session = Depends(get_db)):
-    db_membro = crud.get_membro_celular(db, celular=membro.celular)
-    if db_membro:
-        raise HTTPException(status_code=400, detail="Membro ja registrado")
-    return crud.crate_membro(db=db, membro=membro)
-
-@app.put("/membros/update/{id_membro}", status_code=200, tags=["Membros"],
-         description="Atualiza um membro existente na base")
-async def update_membros(membro: schemas.MembrosBase, db : Session = Depends(get_db)):
-    db_membro = crud.update_membro(db, membro = membro)
-    return db_membro
-
-@app.delete("/membros/delete/{id_membro}", status_code=202, tags=["Membros"],
-            description="Deleta um membro existente na base")
-async def delete_membros(id_membro : int , db: Session = Depends(get_db) ):
-    db_membro = crud.get_membro_id(db, id_membro= id_membro)
-    if db_membro is None:
-        raise HTTPException(status_code=422, detail="Membro não encontrado")
-    return crud.delete_membro(db, id_membro=id_membro)
-
-
-###############
-#PLANOS
-###############
-
-@app.get("/planos/", response_model=List[schemas.PlanosBase], status_code=200, tags=["Planos"],
-         description="Retorna a lista de todos os planos, com seus respectivos atributos")
-async def get_planos(db : Session = Depends(get_db)):
-    planos = crud.get_planos(db)
-    return planos
-
-@app.get("/planos/{id_plano}", response_model=schemas.PlanosBase, status_code=200, tags=["Planos"],
-         description="Retorna um plano pelo seu ID")
-async def get_plano_id(id_plano: int = Path(..., title="ID do plano"), db : Session = Depends(get_db)):
-    db_plano = crud.get_planos_id(db, id_plano=id_plano)
-    if db_plano is None:
-        raise HTTPException(status_code=422, detail="Plano não encontrado")
-    return db_plano
-
-@app.post("/planos/create", response_model=schemas.PlanosCreate, status_code=201, tags=["Planos"],
-          description="Adiciona mais um plano novo na base")
-async def create_planos(plano: schemas.PlanosCreate, db: Session = Depends(get_db)):
-    db_plano = crud.get_planos_nome (db, nome = plano.nome)
-    if db_plano:
-        raise HTTPException(status_code=400, detail="Plano ja registrado")    
-    return crud.create_plano(db, plano=plano)
-
-@app.put("/planos/update/{id_plano}", status_code=200, tags=["Planos"],
-         description="Atualiza um plano existente na base")
-async def update_planos(plano : schemas.PlanosBase, db : Session = Depends(get_db)):
-    db_plano = crud.update_plano(db, plano=plano)
-    return db_plano
-
-@app.delete("/planos/delete/{id_plano}", status_code=202, tags=["Planos"],
-            description="Deleta um plano existente na base")
-async def delete_planos(id_plano: int, db: Session = Depends(get_db)):
-    db_plano = crud.get_planos_id(db, id_plano = id_plano)
-    if db_plano is None:
-        raise HTTPException(status_code=422, detail="Plano não encontrado")
-    return crud.delete_plano(db , id_plano=id_plano)
-
-
-###############
-#ASSINATURAS (MEMBRO-PLANO)
-###############
-
-@app.get("/assinaturas/", response_model=List[schemas.AssinaturasBase], status_code=200, tags=["Assinaturas"],
-         description="Retorna a lista de todas as assinaturas, com seus respectivos atributos")
-async def get_assinaturas(db : Session = Depends(get_db)):
-    assinaturas = crud.get_assinaturas(db)
-    return assinaturas
-
-
-@app.get("/assinaturas/{id_assinatura}", response_model=schemas.Assinaturas, status_code=200, tags=["Assinaturas"],
-         description="Retorna uma assinatura pelo seu ID")
-async def get_assinatura_id(id_assinatura: int = Path(..., title="ID da assinatura"), db : Session = Depends(get_db)):
-    db_assinatura = crud.get_assinatura_id(db , id_assinatura=id_assinatura)
-    if db_assinatura is None:
-        raise HTTPException(status_code=422, detail="Assinatura não encontrada")
-    return db_assinatura
-
-@app.post("/assinaturas/create", response_model=schemas.Assinaturas, status_code=201, tags=["Assinaturas"],
-          description="Adiciona mais uma assinatura nova na base")
-async def create_assinaturas(assinatura: schemas.Assinaturas, db : Session = Depends(get_db)):
-    db_assinaturas = crud.get_assinatura_id (db, id_assinatura=assinatura.id_assinatura)
-    if db_assinaturas:
-        raise HTTPException(status_code=400, detail="Assinatura ja registrado")
-    return crud.create_assinatura(db, assinatura=assinatura)
-
-@app.put("/assinaturas/update/{id_assinatura}", status_code=200, tags=["Assinaturas"],
-         description="Atualiza uma assinatura existente na base")
-async def update_assinatura( assinatura: schemas.Assinaturas, db : Session = Depends(get_db)):
-    db_assinaturas = crud.update_assinatura(db, assinatura=assinatura)
-    return db_assinaturas
-
-
-@app.delete("/assinaturas/delete/{id_assinatura}", status_code=202, tags=["Assinaturas"],
-            description="Deleta uma assinatura existente na base")
-async def delete_assinatura(id_assinatura: int, db : Session = Depends(get_db)):
-    db_assinaturas = crud.get_assinatura_id(db, id_assinatura= id_assinatura)
-    if db_assinaturas is None:
-        raise HTTPException(status_code=422, detail="Assinatura não encontrado")
-    return crud.delete_assinaturas(db, id_assinatura=id_assinatura)
-
-
-###############
-#EXCEPTIONS
-###############
-
-#Exception para quando o cliente manda um body preenchido de forma errada
-@app.exception_handler(RequestValidationError)
-async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    return JSONResponse(
-        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-        content=jsonable_encoder({"detail": exc.errors(), "body": exc.body}),
-    )
+from fastapi import Depends,FastAPI, Request, status, HTTPException, Path, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response, FileResponse
+from contextlib import asynccontextmanager, AsyncExitStack
+from database import SessionLocal, AsyncSessionLocal, ASYNC_DB, DB_BOOTSTRAP, estatisticas_pools, fechar_engines
+import database
+from typing import List, Optional
+import asyncio
+import hashlib
+import orjson
+import os
+import checkins
+import crud
+import crud_async
+import expiracao
+import arquivamento
+import analitico
+import admissao
+import jobs
+import schemas
+import time
+from datetime import datetime, timedelta
+from metricas import metricas
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+
+metricas.instrumentar_engine(Engine)
+
+#Importar este módulo não toca no banco. O schema é preparado por "python migracoes.py" uma vez por deploy,
+#ou aqui na subida do worker se DB_BOOTSTRAP=1; com EXPIRACAO_INTERVALO > 0 a expiração de assinaturas, e com
+#ARQUIVO_INTERVALO > 0 o arquivamento, rodam em segundo plano, e os jobs de relatório pendentes voltam para o pool
+#de processos. Na saída, as tarefas são canceladas, o pool de jobs para de aceitar jobs, o buffer de checkins é
+#gravado e os pools de conexão são fechados
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_BOOTSTRAP:
+        import migracoes
+        await run_in_threadpool(migracoes.preparar)
+    tarefas = [asyncio.create_task(modulo.executar_periodicamente()) for modulo in (expiracao, arquivamento) if modulo.INTERVALO > 0]
+    checkins.buffer.iniciar()
+    await run_in_threadpool(jobs.pool.reenfileirar)
+    yield
+    for tarefa in tarefas:
+        tarefa.cancel()
+    jobs.pool.encerrar()
+    await checkins.buffer.parar()
+    await fechar_engines()
+
+app = FastAPI(lifespan=lifespan)
+
+#Com RESPOSTA_RAPIDA=1 as listagens de membros e assinaturas leem só as colunas da resposta e as serializam
+#direto com orjson, sem o ciclo validar (response_model) e reencodar (jsonable_encoder). O response_model
+#das rotas continua documentando a resposta no OpenAPI
+RESPOSTA_RAPIDA = os.getenv("RESPOSTA_RAPIDA", "0") == "1"
+
+class RespostaRapida(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+#Sessões sem controle de admissão, para rotas baratas como as leituras de planos servidas do cache
+def get_sync_db_isento():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db_isento():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+#As demais rotas com sessão passam pelo controle de admissão de admissao.py: esperam uma vaga ou recebem 503.
+#O close devolve a conexão ao pool (com um rollback), por isso roda no threadpool
+#A rota (template do path) separa a latência de base de cada uma no controle
+def rota_admissao(request: Request):
+    rota = request.scope.get("route")
+    return rota.path if rota is not None else request.url.path
+
+async def get_sync_db(request: Request):
+    async with admissao.controle.admitir(rota_admissao(request)):
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+async def get_async_db(request: Request):
+    async with admissao.controle.admitir(rota_admissao(request)):
+        async with AsyncSessionLocal() as db:
+            yield db
+
+#As rotas sempre aguardam "dados": no modo assíncrono são as corrotinas de crud_async,
+#no modo síncrono são as funções de crud rodando no threadpool, sem travar o event loop
+get_db = get_async_db if ASYNC_DB else get_sync_db
+get_db_isento = get_async_db_isento if ASYNC_DB else get_sync_db_isento
+dados = crud_async if ASYNC_DB else crud_async.EmThreadpool(crud)
+
+
+#Latência, status e queries SQL por rota. A rota é o template do path ("/membros/{id_membro}"),
+#para que a cardinalidade dos rótulos não cresça com os IDs. O scope também fica disponível para
+#o log de consultas lentas saber qual rota disparou cada statement
+@app.middleware("http")
+async def medir_requisicao(request: Request, call_next):
+    consultas, token = metricas.inicio_requisicao()
+    token_requisicao = database.requisicao_atual.set(request.scope)
+    inicio = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        database.requisicao_atual.reset(token_requisicao)
+        rota = request.scope.get("route")
+        metricas.fim_requisicao(request.method, rota.path if rota is not None else "(sem rota)", status_code,
+                                time.perf_counter() - inicio, consultas, token)
+
+
+#GET e HEAD leem das réplicas, salvo se o cliente escreveu há menos de DB_JANELA_PRIMARIO segundos.
+#O cliente é o header X-Cliente-Id ou, sem ele, o IP. Uma escrita bem-sucedida também grava o cookie
+#le_primario, que leva a janela para os outros workers em clientes que guardam cookies. No SQLite local,
+#as "réplicas" são as conexões de leitura no mesmo arquivo, sem atraso, e não há janela
+TEM_REPLICAS = bool(database.REPLICA_URLS or database.ASYNC_REPLICA_URLS or database.SQLITE_LEITORES)
+
+@app.middleware("http")
+async def rotear_leituras(request: Request, call_next):
+    if not TEM_REPLICAS:
+        return await call_next(request)
+    cliente = request.headers.get("x-cliente-id") or (request.client.host if request.client else "")
+    leitura = request.method in ("GET", "HEAD")
+    replica = leitura and "le_primario" not in request.cookies and not database.janela_primario.ativa(cliente)
+    token = database.ler_da_replica.set(replica)
+    try:
+        response = await call_next(request)
+    finally:
+        database.ler_da_replica.reset(token)
+    if not leitura and response.status_code < 400 and database.JANELA_PRIMARIO > 0:
+        database.janela_primario.registrar(cliente)
+        response.set_cookie("le_primario", "1", max_age=max(1, int(database.JANELA_PRIMARIO)), httponly=True)
+    return response
+
+
+@app.get("/", tags=["Página Inicial"])
+async def projeto_descricao():
+    return {"message": "Bem-vindo ao projeto da academia. Este é um sistema de gerenciamento de membros, planos e assinaturas."}
+
+
+LIMITE_BULK = 50000
+
+def parse_expand(expand: Optional[str]):
+    nomes = {nome.strip() for nome in expand.split(",") if nome.strip()} if expand else set()
+    invalidos = nomes - crud.EXPANSOES_ASSINATURA.keys()
+    if invalidos:
+        raise HTTPException(status_code=422, detail=f"Valores de expand inválidos: {', '.join(sorted(invalidos))}")
+    return nomes
+
+def validar_bulk(itens: list):
+    if len(itens) > LIMITE_BULK:
+        raise HTTPException(status_code=413, detail=f"Envie no máximo {LIMITE_BULK} itens por requisição")
+
+def parse_ids(ids: str):
+    try:
+        valores = [int(valor) for valor in ids.split(",") if valor.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids deve ser uma lista de inteiros separados por vírgula")
+    if not valores:
+        raise HTTPException(status_code=422, detail="Informe ao menos um id")
+    validar_bulk(valores)
+    return valores
+
+#Campos presentes no body de um PATCH; obrigatorios são as colunas NOT NULL, que não aceitam null
+def campos_patch(patch, obrigatorios: tuple = ()):
+    campos = patch.model_dump(exclude_unset=True)
+    if not campos:
+        raise HTTPException(status_code=422, detail="Informe ao menos um campo para atualizar")
+    nulos = [nome for nome in obrigatorios if nome in campos and campos[nome] is None]
+    if nulos:
+        raise HTTPException(status_code=422, detail=f"Campos que não aceitam null: {', '.join(nulos)}")
+    return campos
+
+
+#ETags: de uma entidade, as versões da linha e das relações expandidas ("3", "3-1-2"); de uma página,
+#um hash dos pares (id, versões) e do cursor. Com If-None-Match, a versão é lida primeiro por uma consulta
+#só pela chave, e a resposta 304 sai sem carregar nem serializar as linhas
+def etag_entidade(versoes: tuple):
+    return '"' + '-'.join('0' if versao is None else str(versao) for versao in versoes) + '"'
+
+def etag_pagina(versoes: tuple):
+    return '"p' + hashlib.blake2b(repr(versoes).encode(), digest_size=10).hexdigest() + '"'
+
+def valor_item(item, campo: str):
+    return item[campo] if isinstance(item, dict) else getattr(item, campo)
+
+def versoes_item(item, campo_id: str, expand: set = frozenset()):
+    return ((valor_item(item, campo_id), valor_item(item, "versao"))
+            + tuple(getattr(valor_item(item, nome), "versao", None) for nome in sorted(expand)))
+
+def versoes_pagina(pagina: dict, campo_id: str, expand: set = frozenset()):
+    return [versoes_item(item, campo_id, expand) for item in pagina["items"]], pagina["next_cursor"]
+
+def etag_confere(cabecalho: Optional[str], etag: str):
+    if cabecalho is None:
+        return False
+    return any(valor.strip() in ("*", etag) or valor.strip().removeprefix("W/") == etag for valor in cabecalho.split(","))
+
+#Com If-None-Match, busca só as versões; devolve a resposta 304 se o ETag ainda é o mesmo, ou None para seguir
+async def nao_modificado(request: Request, buscar_versoes, gerar_etag):
+    cabecalho = request.headers.get("if-none-match")
+    if cabecalho is None:
+        return None
+    versoes = await buscar_versoes()
+    if versoes is None:
+        return None
+    etag = gerar_etag(versoes)
+    return Response(status_code=304, headers={"ETag": etag}) if etag_confere(cabecalho, etag) else None
+
+#Anexa o ETag à resposta já carregada, ou responde 304 se ele bate com o If-None-Match (sem serializar)
+def com_etag(request: Request, response: Response, resultado, etag: str):
+    if etag_confere(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    (resultado if isinstance(resultado, Response) else response).headers["ETag"] = etag
+    return resultado
+
+#Versão exigida pelo If-Match de uma atualização (o primeiro número do ETag da entidade), ou None sem o header.
+#If-Match: * não exige versão alguma; a entidade só precisa existir, o que a própria atualização já confere
+def versao_if_match(request: Request):
+    cabecalho = request.headers.get("if-match")
+    if cabecalho is None or cabecalho.strip() == "*":
+        return None
+    try:
+        return int(cabecalho.strip().removeprefix("W/").strip('"').split("-")[0])
+    except ValueError:
+        raise HTTPException(status_code=412, detail="If-Match inválido; envie o ETag retornado pelo GET da entidade")
+
+
+###############
+#MEMBROS
+###############
+
+@app.get("/membros/", response_model=schemas.Pagina[schemas.MembrosBase], status_code=200, tags=["Membros"], 
+         description="Retorna uma página de membros, com seus respectivos atributos, ordenada pelo ID")
+async def get_membros(request: Request, response: Response, limit: int = Query(crud.LIMITE_PADRAO, ge=1, description=f"Tamanho da página (máximo {crud.LIMITE_MAXIMO})"),
+                      after: Optional[int] = Query(None, description="Cursor retornado em next_cursor pela página anterior"),
+                      db : Session = Depends(get_db)):
+    resposta = await nao_modificado(request, lambda: dados.get_versoes_membros(db, limit=limit, after=after), etag_pagina)
+    if resposta is not None:
+        return resposta
+    if RESPOSTA_RAPIDA:
+        membros = await dados.get_membros_linhas(db, limit=limit, after=after)
+        return com_etag(request, response, RespostaRapida(membros), etag_pagina(versoes_pagina(membros, "id_membro")))
+    membros = await dados.get_membros(db, limit=limit, after=after)
+    return com_etag(request, response, membros, etag_pagina(versoes_pagina(membros, "id_membro")))
+
+@app.get("/membros/search", response_model=List[schemas.MembrosBase], status_code=200, tags=["Membros"],
+         description="Busca membros pelo celular exato e/ou por prefixo do nome e sobrenome, sem diferenciar maiúsculas nem acentos")
+async def search_membros(request: Request, response: Response, q: Optional[str] = Query(None, min_length=1, max_length=255, description="Prefixo do nome, ou 'nome sobrenome'"),
+                         celular: Optional[int] = Query(None, description="Celular exato, com DDD"),
+                         limit: int = Query(crud.LIMITE_PADRAO, ge=1, description=f"Máximo de resultados (até {crud.LIMITE_MAXIMO})"),
+                         db : Session = Depends(get_db)):
+    if q is None and celular is None:
+        raise HTTPException(status_code=422, detail="Informe q ou celular")
+    membros = await dados.search_membros(db, q=q, celular=celular, limit=limit)
+    return com_etag(request, response, membros, etag_pagina(([versoes_item(m, "id_membro") for m in membros], None)))
+
+@app.get("/membros/{id_membro}", response_model=schemas.MembrosBase, status_code=200, tags=["Membros"], 
+         description="Retorna um membro pelo seu ID")
+async def get_membro_id(request: Request, response: Response, id_membro: int = Path(..., title="ID do membro"),
+                        db : Session = Depends(get_db)):
+    resposta = await nao_modificado(request, lambda: dados.get_versoes_membro(db, id_membro=id_membro), etag_entidade)
+    if resposta is not None:
+        return resposta
+    db_membro = await dados.get_membro_id(db, id_membro=id_membro)
+    if db_membro is None:
+        raise HTTPException(status_code=422, detail="Membro não encontrado")
+    return com_etag(request, response, db_membro, etag_entidade((db_membro.versao,)))
+
+@app.post("/membros/create", response_model=schemas.MembrosBase, status_code=201, tags=["Membros"],
+          description="Adiciona mais um membro novo na base")
+async def create_membros(membro: schemas.MembrosCreate, db : Session = Depends(get_db)):
+    #Sem celular não há com quem conflitar (o índice único aceita vários NULL)
+    if membro.celular is not None and await dados.get_membro_celular(db, celular=membro.celular):
+        raise HTTPException(status_code=400, detail="Membro ja registrado")
+    return await dados.crate_membro(db=db, membro=membro)
+
+@app.post("/membros/bulk", response_model=schemas.ResultadoBulk, status_code=200, tags=["Membros"],
+          description="Adiciona vários membros de uma vez, informando o resultado de cada item")
+async def create_membros_bulk(membros: List[schemas.MembrosCreate], db : Session = Depends(get_db)):
+    validar_bulk(membros)
+    return await dados.create_membros_bulk(db, membros=membros)
+
+@app.put("/membros/update/{id_membro}", response_model=schemas.MembrosBase, status_code=200, tags=["Membros"],
+         description="Atualiza um membro existente na base")
+async def update_membros(id_membro: int, membro: schemas.MembrosBase, request: Request, response: Response,
+                         db : Session = Depends(get_db)):
+    membro.id_membro = id_membro
+    db_membro = await dados.update_membro(db, membro = membro, versao_esperada=versao_if_match(request))
+    if db_membro is None:
+        raise HTTPException(status_code=422, detail="Membro não encontrado")
+    response.headers["ETag"] = etag_entidade((db_membro.versao,))
+    return db_membro
+
+@app.patch("/membros/update", response_model=schemas.ResultadoPatch, status_code=200, tags=["Membros"],
+           description="Aplica os mesmos campos a vários membros em um único UPDATE")
+async def patch_membros_bulk(patch: schemas.MembrosPatchBulk, db : Session = Depends(get_db)):
+    validar_bulk(patch.ids)
+    campos = campos_patch(patch.valores, obrigatorios=("nome", "sobrenome"))
+    return {"atualizados": await dados.patch_membros_bulk(db, ids=patch.ids, campos=campos)}
+
+@app.patch("/membros/update/{id_membro}", status_code=200, tags=["Membros"],
+           description="Atualiza só os campos enviados de um membro, em um único UPDATE; retorna os campos aplicados")
+async def patch_membro(id_membro: int, patch: schemas.MembrosPatch, request: Request, response: Response,
+                       db : Session = Depends(get_db)):
+    campos = campos_patch(patch, obrigatorios=("nome", "sobrenome"))
+    versao = versao_if_match(request)
+    if not await dados.patch_membro(db, id_membro=id_membro, campos=campos, versao_esperada=versao):
+        raise HTTPException(status_code=422, detail="Membro não encontrado")
+    if versao is not None:
+        response.headers["ETag"] = etag_entidade((versao + 1,))
+    return {"id_membro": id_membro, **campos}
+
+DESCRICAO_CASCATA = ("O que fazer com as assinaturas dos membros: apagar, ou arquivar em assinaturas_arquivadas. "
+                     "Sem cascata, um membro com assinaturas não é apagado (409)")
+
+@app.delete("/membros/delete", response_model=schemas.ResultadoDelete, status_code=202, tags=["Membros"],
+            description="Deleta vários membros em uma transação, com DELETE ... WHERE id IN (...)")
+async def delete_membros_bulk(ids: str = Query(..., description="IDs separados por vírgula, ex.: 1,2,3"),
+                              cascata: Optional[schemas.ModoCascata] = Query(None, description=DESCRICAO_CASCATA),
+                              db : Session = Depends(get_db)):
+    apagados = await dados.delete_membros(db, ids=parse_ids(ids), cascata=cascata.value if cascata else None)
+    return {"apagados": apagados}
+
+@app.delete("/membros/delete/{id_membro}", status_code=202, tags=["Membros"],
+            description="Deleta um membro existente na base")
+async def delete_membros(id_membro : int, cascata: Optional[schemas.ModoCascata] = Query(None, description=DESCRICAO_CASCATA),
+                         db: Session = Depends(get_db) ):
+    if not await dados.delete_membro(db, id_membro=id_membro, cascata=cascata.value if cascata else None):
+        raise HTTPException(status_code=422, detail="Membro não encontrado")
+    return {"Deletado": {"id_membro": id_membro}}
+
+
+###############
+#PLANOS
+###############
+
+@app.get("/planos/", response_model=schemas.Pagina[schemas.PlanosBase], status_code=200, tags=["Planos"],
+         description="Retorna uma página de planos, com seus respectivos atributos, ordenada pelo ID")
+async def get_planos(request: Request, response: Response, limit: int = Query(crud.LIMITE_PADRAO, ge=1, description=f"Tamanho da página (máximo {crud.LIMITE_MAXIMO})"),
+                     after: Optional[int] = Query(None, description="Cursor retornado em next_cursor pela página anterior"),
+                     db : Session = Depends(get_db_isento)):
+    planos = await dados.get_planos(db, limit=limit, after=after)
+    return com_etag(request, response, planos, etag_pagina(versoes_pagina(planos, "id_plano")))
+
+@app.get("/planos/{id_plano}", response_model=schemas.PlanosBase, status_code=200, tags=["Planos"],
+         description="Retorna um plano pelo seu ID")
+async def get_plano_id(request: Request, response: Response, id_plano: int = Path(..., title="ID do plano"),
+                       db : Session = Depends(get_db_isento)):
+    #Os planos vêm do cache em memória, então o ETag é calculado sobre o plano já lido
+    db_plano = await dados.get_planos_id(db, id_plano=id_plano)
+    if db_plano is None:
+        raise HTTPException(status_code=422, detail="Plano não encontrado")
+    return com_etag(request, response, db_plano, etag_entidade((db_plano.versao,)))
+
+@app.post("/planos/create", response_model=schemas.PlanosCreate, status_code=201, tags=["Planos"],
+          description="Adiciona mais um plano novo na base")
+async def create_planos(plano: schemas.PlanosCreate, db: Session = Depends(get_db)):
+    db_plano = await dados.get_planos_nome(db, nome = plano.nome)
+    if db_plano:
+        raise HTTPException(status_code=400, detail="Plano ja registrado")    
+    return await dados.create_plano(db, plano=plano)
+
+@app.post("/planos/bulk", response_model=schemas.ResultadoBulk, status_code=200, tags=["Planos"],
+          description="Adiciona vários planos de uma vez, informando o resultado de cada item")
+async def create_planos_bulk(planos: List[schemas.PlanosCreate], db : Session = Depends(get_db)):
+    validar_bulk(planos)
+    return await dados.create_planos_bulk(db, planos=planos)
+
+@app.put("/planos/update/{id_plano}", response_model=schemas.PlanosBase, status_code=200, tags=["Planos"],
+         description="Atualiza um plano existente na base")
+async def update_planos(id_plano: int, plano : schemas.PlanosBase, request: Request, response: Response,
+                        db : Session = Depends(get_db)):
+    plano.id_plano = id_plano
+    db_plano = await dados.update_plano(db, plano=plano, versao_esperada=versao_if_match(request))
+    if db_plano is None:
+        raise HTTPException(status_code=422, detail="Plano não encontrado")
+    response.headers["ETag"] = etag_entidade((db_plano.versao,))
+    return db_plano
+
+@app.patch("/planos/update", response_model=schemas.ResultadoPatch, status_code=200, tags=["Planos"],
+           description="Aplica os mesmos campos a vários planos em um único UPDATE")
+async def patch_planos_bulk(patch: schemas.PlanosPatchBulk, db : Session = Depends(get_db)):
+    validar_bulk(patch.ids)
+    campos = campos_patch(patch.valores, obrigatorios=("nome", "preco"))
+    return {"atualizados": await dados.patch_planos_bulk(db, ids=patch.ids, campos=campos)}
+
+@app.patch("/planos/update/{id_plano}", status_code=200, tags=["Planos"],
+           description="Atualiza só os campos enviados de um plano, em um único UPDATE; retorna os campos aplicados")
+async def patch_plano(id_plano: int, patch: schemas.PlanosPatch, request: Request, response: Response,
+                      db : Session = Depends(get_db)):
+    campos = campos_patch(patch, obrigatorios=("nome", "preco"))
+    versao = versao_if_match(request)
+    if not await dados.patch_plano(db, id_plano=id_plano, campos=campos, versao_esperada=versao):
+        raise HTTPException(status_code=422, detail="Plano não encontrado")
+    if versao is not None:
+        response.headers["ETag"] = etag_entidade((versao + 1,))
+    return {"id_plano": id_plano, **campos}
+
+@app.delete("/planos/delete/{id_plano}", status_code=202, tags=["Planos"],
+            description="Deleta um plano existente na base")
+async def delete_planos(id_plano: int, db: Session = Depends(get_db)):
+    if not await dados.delete_plano(db , id_plano=id_plano):
+        raise HTTPException(status_code=422, detail="Plano não encontrado")
+    return {"Deletado": {"id_plano": id_plano}}
+
+
+###############
+#ASSINATURAS (MEMBRO-PLANO)
+###############
+
+@app.get("/assinaturas/", response_model=schemas.Pagina[schemas.AssinaturasExpandida], status_code=200, tags=["Assinaturas"],
+         description="Retorna uma página de assinaturas, com seus respectivos atributos, ordenada pelo ID")
+async def get_assinaturas(request: Request, response: Response, limit: int = Query(crud.LIMITE_PADRAO, ge=1, description=f"Tamanho da página (máximo {crud.LIMITE_MAXIMO})"),
+                          after: Optional[int] = Query(None, description="Cursor retornado em next_cursor pela página anterior"),
+                          expand: Optional[str] = Query(None, description="Relações a incluir, separadas por vírgula: membro,plano"),
+                          include_archived: bool = Query(False, description="Inclui as assinaturas movidas para o arquivo"),
+                          db : Session = Depends(get_db)):
+    expand = parse_expand(expand)
+    if include_archived:
+        #Linhas arquivadas não mudam mais e entram no ETag com versão null; ele é calculado sobre a página já lida
+        assinaturas = await dados.get_assinaturas_historico(db, limit=limit, after=after, expand=expand)
+        etag = etag_pagina(versoes_pagina(assinaturas, "id_assinatura", expand))
+        return com_etag(request, response, RespostaRapida(assinaturas) if RESPOSTA_RAPIDA and not expand else assinaturas, etag)
+    resposta = await nao_modificado(request, lambda: dados.get_versoes_assinaturas(db, limit=limit, after=after, expand=expand),
+                                    etag_pagina)
+    if resposta is not None:
+        return resposta
+    if RESPOSTA_RAPIDA and not expand:
+        assinaturas = await dados.get_assinaturas_linhas(db, limit=limit, after=after)
+        return com_etag(request, response, RespostaRapida(assinaturas), etag_pagina(versoes_pagina(assinaturas, "id_assinatura")))
+    assinaturas = await dados.get_assinaturas(db, limit=limit, after=after, expand=expand)
+    return com_etag(request, response, assinaturas, etag_pagina(versoes_pagina(assinaturas, "id_assinatura", expand)))
+
+
+@app.get("/assinaturas/export", status_code=200, tags=["Assinaturas"],
+         description="Exporta todas as assinaturas com os dados do membro e do plano, em NDJSON ou CSV, via streaming")
+async def export_assinaturas(request: Request, format: schemas.FormatoExport = Query(schemas.FormatoExport.ndjson, description="ndjson ou csv")):
+    #A sessão é aberta aqui e fechada pelo próprio gerador, que continua rodando depois que a rota retorna.
+    #Pelo mesmo motivo a vaga no controle de admissão é pedida aqui (o 503 sai antes do streaming começar).
+    #Gerador e vaga ficam na mesma pilha, fechada quando o streaming termina ou é interrompido pelo cliente
+    #(ou pela tarefa de fundo, se ele desconectar antes do início): o gerador fecha primeiro e devolve na hora
+    #a conexão do cursor no servidor, e depois a vaga é devolvida
+    recursos = AsyncExitStack()
+    await recursos.enter_async_context(admissao.controle.admitir(rota_admissao(request)))
+    if ASYNC_DB:
+        linhas = crud_async.exportar_assinaturas(AsyncSessionLocal(), format.value)
+        recursos.push_async_callback(linhas.aclose)
+    else:
+        gerador = crud.exportar_assinaturas(SessionLocal(), format.value)
+        recursos.push_async_callback(run_in_threadpool, gerador.close)
+        linhas = iterate_in_threadpool(gerador)
+
+    async def transmitir():
+        try:
+            async for pedaco in linhas:
+                yield pedaco
+        finally:
+            await recursos.aclose()
+
+    media_type = "text/csv" if format == schemas.FormatoExport.csv else "application/x-ndjson"
+    return StreamingResponse(transmitir(), media_type=media_type, background=BackgroundTask(recursos.aclose),
+                             headers={"Content-Disposition": f"attachment; filename=assinaturas.{format.value}"})
+
+@app.get("/assinaturas/{id_assinatura}", response_model=schemas.AssinaturasExpandida, status_code=200, tags=["Assinaturas"],
+         description="Retorna uma assinatura pelo seu ID")
+async def get_assinatura_id(request: Request, response: Response, id_assinatura: int = Path(..., title="ID da assinatura"),
+                            expand: Optional[str] = Query(None, description="Relações a incluir, separadas por vírgula: membro,plano"),
+                            include_archived: bool = Query(False, description="Procura também nas assinaturas movidas para o arquivo"),
+                            db : Session = Depends(get_db)):
+    expand = parse_expand(expand)
+    resposta = await nao_modificado(request, lambda: dados.get_versoes_assinatura(db, id_assinatura=id_assinatura, expand=expand),
+                                    etag_entidade)
+    if resposta is not None:
+        return resposta
+    db_assinatura = await dados.get_assinatura_id(db , id_assinatura=id_assinatura, expand=expand)
+    if db_assinatura is None and include_archived:
+        db_assinatura = await dados.get_assinatura_arquivada(db, id_assinatura=id_assinatura, expand=expand)
+    if db_assinatura is None:
+        raise HTTPException(status_code=422, detail="Assinatura não encontrada")
+    return com_etag(request, response, db_assinatura, etag_entidade(versoes_item(db_assinatura, "id_assinatura", expand)[1:]))
+
+@app.post("/assinaturas/create", response_model=schemas.Assinaturas, status_code=201, tags=["Assinaturas"],
+          description="Adiciona mais uma assinatura nova na base")
+async def create_assinaturas(assinatura: schemas.Assinaturas, db : Session = Depends(get_db)):
+    db_assinaturas = await dados.get_assinatura_id(db, id_assinatura=assinatura.id_assinatura)
+    if db_assinaturas:
+        raise HTTPException(status_code=400, detail="Assinatura ja registrado")
+    return await dados.create_assinatura(db, assinatura=assinatura)
+
+@app.post("/assinaturas/bulk", response_model=schemas.ResultadoBulk, status_code=200, tags=["Assinaturas"],
+          description="Adiciona várias assinaturas de uma vez, informando o resultado de cada item")
+async def create_assinaturas_bulk(assinaturas: List[schemas.Assinaturas], db : Session = Depends(get_db)):
+    validar_bulk(assinaturas)
+    return await dados.create_assinaturas_bulk(db, assinaturas=assinaturas)
+
+@app.put("/assinaturas/update/{id_assinatura}", response_model=schemas.Assinaturas, status_code=200, tags=["Assinaturas"],
+         description="Atualiza uma assinatura existente na base")
+async def update_assinatura(id_assinatura: int, assinatura: schemas.Assinaturas, request: Request, response: Response,
+                            db : Session = Depends(get_db)):
+    assinatura.id_assinatura = id_assinatura
+    db_assinaturas = await dados.update_assinatura(db, assinatura=assinatura, versao_esperada=versao_if_match(request))
+    if db_assinaturas is None:
+        raise HTTPException(status_code=422, detail="Assinatura não encontrada")
+    response.headers["ETag"] = etag_entidade((db_assinaturas.versao,))
+    return db_assinaturas
+
+@app.patch("/assinaturas/update", response_model=schemas.ResultadoPatch, status_code=200, tags=["Assinaturas"],
+           description="Aplica os mesmos campos às assinaturas selecionadas por ids e/ou id_plano_atual, em um único UPDATE")
+async def patch_assinaturas_bulk(patch: schemas.AssinaturasPatchBulk, db : Session = Depends(get_db)):
+    if patch.ids is None and patch.id_plano_atual is None:
+        raise HTTPException(status_code=422, detail="Informe ids ou id_plano_atual")
+    validar_bulk(patch.ids or [])
+    campos = campos_patch(patch.valores, obrigatorios=("ativo", "data_ativacao"))
+    atualizados = await dados.patch_assinaturas_bulk(db, campos=campos, ids=patch.ids, id_plano_atual=patch.id_plano_atual)
+    return {"atualizados": atualizados}
+
+@app.patch("/assinaturas/update/{id_assinatura}", status_code=200, tags=["Assinaturas"],
+           description="Atualiza só os campos enviados de uma assinatura, em um único UPDATE; retorna os campos aplicados")
+async def patch_assinatura(id_assinatura: int, patch: schemas.AssinaturasPatch, request: Request, response: Response,
+                           db : Session = Depends(get_db)):
+    campos = campos_patch(patch, obrigatorios=("ativo", "data_ativacao"))
+    versao = versao_if_match(request)
+    if not await dados.patch_assinatura(db, id_assinatura=id_assinatura, campos=campos, versao_esperada=versao):
+        raise HTTPException(status_code=422, detail="Assinatura não encontrada")
+    if versao is not None:
+        response.headers["ETag"] = etag_entidade((versao + 1,))
+    return {"id_assinatura": id_assinatura, **campos}
+
+
+@app.delete("/assinaturas/delete/{id_assinatura}", status_code=202, tags=["Assinaturas"],
+            description="Deleta uma assinatura existente na base")
+async def delete_assinatura(id_assinatura: int, db : Session = Depends(get_db)):
+    if not await dados.delete_assinaturas(db, id_assinatura=id_assinatura):
+        raise HTTPException(status_code=422, detail="Assinatura não encontrado")
+    return {"Deletado": {"id_assinatura": id_assinatura}}
+
+
+###############
+#CHECKINS
+###############
+
+@app.post("/checkins", response_model=schemas.Checkin, status_code=202, tags=["Checkins"],
+          description="Registra uma passagem pela catraca se o membro tem assinatura ativa. O evento é gravado em lote, "
+                      "em até alguns segundos; com a fila cheia a resposta é 503 com Retry-After")
+async def create_checkin(checkin: schemas.CheckinCreate, db : Session = Depends(get_db)):
+    id_assinatura = await dados.get_assinatura_ativa(db, id_membro=checkin.id_membro)
+    if id_assinatura is None:
+        raise HTTPException(status_code=403, detail="Membro sem assinatura ativa")
+    evento = {"id_membro": checkin.id_membro, "id_assinatura": id_assinatura,
+              "data_hora": checkin.data_hora or datetime.now()}
+    if not checkins.buffer.adicionar(evento):
+        raise HTTPException(status_code=503, detail="Fila de checkins cheia, tente novamente",
+                            headers={"Retry-After": str(max(1, int(checkins.buffer.intervalo)))})
+    return evento
+
+
+###############
+#RELATORIOS
+###############
+
+@app.get("/relatorios/ativos", response_model=schemas.RelatorioAtivos, status_code=200, tags=["Relatórios"],
+         description="Membros e assinaturas ativas por plano, agregados no banco")
+async def relatorio_ativos(db : Session = Depends(get_db)):
+    return await dados.relatorio_ativos(db)
+
+@app.get("/relatorios/receita", response_model=schemas.RelatorioReceita, status_code=200, tags=["Relatórios"],
+         description="Receita mensal recorrente das assinaturas ativas, por plano e total, agregada no banco")
+async def relatorio_receita(db : Session = Depends(get_db)):
+    return await dados.relatorio_receita(db)
+
+@app.get("/relatorios/coortes", response_model=schemas.RelatorioCoortes, status_code=200, tags=["Relatórios"],
+         description="Retenção por coorte de mês de ativação, churn por plano e matriz de trocas de plano, "
+                     "calculados sobre um snapshot em memória atualizado de forma incremental")
+async def relatorio_coortes(request: Request, meses: int = Query(12, ge=1, le=120, description="Meses de retenção por coorte")):
+    #Não usa get_db (o snapshot abre a própria sessão), mas a atualização dele lê do banco: passa pela admissão
+    async with admissao.controle.admitir(rota_admissao(request)):
+        return await run_in_threadpool(analitico.snapshot.relatorio, meses)
+
+
+###############
+#JOBS
+###############
+
+@app.post("/jobs/{relatorio}", response_model=schemas.Job, status_code=202, tags=["Jobs"],
+          description="Enfileira um relatório completo para rodar num processo separado dos workers da API e retorna o job; "
+                      "o progresso fica em /jobs/{id_job}. Com JOBS_MAX_ABERTOS jobs em aberto a resposta é 429 com Retry-After")
+async def create_job(response: Response, relatorio: schemas.RelatorioJob = Path(..., title="Relatório: assinaturas, membros ou coortes"),
+                     format: schemas.FormatoExport = Query(schemas.FormatoExport.ndjson, description="ndjson ou csv; coortes é sempre JSON"),
+                     meses: int = Query(12, ge=1, le=120, description="Meses de retenção por coorte, para o relatório coortes"),
+                     db : Session = Depends(get_db)):
+    if await dados.contar_jobs_abertos(db) >= jobs.MAX_ABERTOS:
+        await dados.expirar_jobs(db, antes_de=datetime.now() - timedelta(seconds=jobs.TIMEOUT))
+        if await dados.contar_jobs_abertos(db) >= jobs.MAX_ABERTOS:
+            raise HTTPException(status_code=429, detail="Muitos jobs em aberto, tente novamente mais tarde",
+                                headers={"Retry-After": str(jobs.ESPERA_LIMITE)})
+    db_job = await dados.create_job(db, relatorio=relatorio.value, parametros=jobs.parametros(relatorio.value, format.value, meses))
+    jobs.pool.enviar(db_job.id_job)
+    response.headers["Location"] = f"/jobs/{db_job.id_job}"
+    return jobs.descrever(db_job)
+
+@app.get("/jobs/{id_job}", response_model=schemas.Job, status_code=200, tags=["Jobs"],
+         description="Estado e progresso de um job; concluído, traz em resultado a URL do arquivo gerado")
+async def get_job(id_job: str = Path(..., title="ID do job"), db : Session = Depends(get_db)):
+    db_job = await dados.get_job(db, id_job=id_job)
+    if db_job is None:
+        raise HTTPException(status_code=422, detail="Job não encontrado")
+    return jobs.descrever(db_job)
+
+@app.get("/jobs/{id_job}/resultado", status_code=200, tags=["Jobs"],
+         description="Arquivo gerado por um job concluído (NDJSON, CSV ou JSON)")
+async def get_job_resultado(id_job: str = Path(..., title="ID do job"), db : Session = Depends(get_db)):
+    db_job = await dados.get_job(db, id_job=id_job)
+    if db_job is None:
+        raise HTTPException(status_code=422, detail="Job não encontrado")
+    if db_job.estado != 'concluido':
+        raise HTTPException(status_code=409, detail=f"Job ainda não concluído: {db_job.estado}")
+    caminho = jobs.caminho_resultado(db_job)
+    if not os.path.exists(caminho):
+        raise HTTPException(status_code=410, detail="O arquivo do resultado não existe mais")
+    formato = os.path.splitext(db_job.arquivo)[1][1:]
+    return FileResponse(caminho, media_type=jobs.MEDIA_TYPES[formato], filename=f"{db_job.relatorio}-{id_job}.{formato}")
+
+
+###############
+#ADMIN
+###############
+
+@app.get("/admin/cache", status_code=200, tags=["Admin"],
+         description="Estatísticas dos caches em memória deste worker (hits, misses, invalidações)")
+async def cache_estatisticas():
+    return [crud.cache_planos.estatisticas(), crud.cache_ativos.estatisticas()]
+
+@app.get("/admin/expiracao", response_model=Optional[schemas.ResultadoExpiracao], status_code=200, tags=["Admin"],
+         description="Resultado da última expiração de assinaturas rodada neste worker: linhas desativadas, lotes e duração")
+async def expiracao_ultima():
+    return expiracao.ultima_execucao
+
+@app.post("/admin/expiracao", response_model=schemas.ResultadoExpiracao, status_code=200, tags=["Admin"],
+          description="Roda a expiração de assinaturas agora, em lotes, e retorna quantas foram desativadas")
+async def expiracao_executar(request: Request):
+    async with admissao.controle.admitir(rota_admissao(request)):
+        return await run_in_threadpool(expiracao.expirar)
+
+@app.get("/admin/arquivo", response_model=Optional[schemas.ResultadoArquivamento], status_code=200, tags=["Admin"],
+         description="Resultado do último arquivamento de assinaturas rodado neste worker: linhas movidas, lotes e duração")
+async def arquivo_ultimo():
+    return arquivamento.ultima_execucao
+
+@app.post("/admin/arquivo", response_model=schemas.ResultadoArquivamento, status_code=200, tags=["Admin"],
+          description="Move agora para o arquivo as assinaturas inativas há mais de ARQUIVO_DIAS dias, em lotes")
+async def arquivo_executar(request: Request):
+    async with admissao.controle.admitir(rota_admissao(request)):
+        return await run_in_threadpool(arquivamento.arquivar)
+
+@app.get("/admin/consultas-lentas", status_code=200, tags=["Admin"],
+         description="Statements deste worker que passaram de DB_LENTA_MS, mais recentes primeiro, com parâmetros "
+                     "mascarados, a rota de origem e o EXPLAIN de cada forma de statement")
+async def consultas_lentas(limit: int = Query(50, ge=1, le=database.LENTAS_MAX)):
+    return database.consultas_lentas.listar(limit)
+
+@app.delete("/admin/consultas-lentas", status_code=204, tags=["Admin"],
+            description="Esvazia o log de consultas lentas e os planos capturados, para capturá-los de novo")
+async def limpar_consultas_lentas():
+    database.consultas_lentas.limpar()
+    return Response(status_code=204)
+
+@app.get("/admin/admissao", status_code=200, tags=["Admin"],
+         description="Estado do controle de admissão deste worker: limite atual, requisições em andamento e na fila, "
+                     "admitidas, enfileiradas e rejeitadas")
+async def admissao_estatisticas():
+    return admissao.controle.estatisticas()
+
+@app.get("/admin/jobs", status_code=200, tags=["Admin"],
+         description="Pool de processos de jobs deste worker: processos, jobs em andamento, enviados, concluídos e falhas")
+async def jobs_estatisticas():
+    return jobs.pool.estatisticas()
+
+@app.get("/admin/checkins", status_code=200, tags=["Admin"],
+         description="Estado do buffer de checkins deste worker: eventos pendentes, gravados, rejeitados e falhas de gravação")
+async def checkins_estatisticas():
+    return checkins.buffer.estatisticas()
+
+@app.get("/admin/pool", status_code=200, tags=["Admin"],
+         description="Estado do pool de conexões deste worker: conexões em uso, livres, overflow e espera por checkout")
+async def pool_estatisticas():
+    return estatisticas_pools()
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Admin"], include_in_schema=False)
+async def metrics():
+    pools = list(estatisticas_pools().items())
+    caches = [crud.cache_planos.estatisticas(), crud.cache_ativos.estatisticas()]
+    buffer = checkins.buffer.estatisticas()
+    controle = admissao.controle.estatisticas()
+    pool_jobs = jobs.pool.estatisticas()
+    extras = [
+        ('gauge', 'db_pool_conexoes_em_uso', [(f'engine="{nome}"', p['em_uso']) for nome, p in pools]),
+        ('gauge', 'db_pool_conexoes_livres', [(f'engine="{nome}"', p['livres']) for nome, p in pools]),
+        ('gauge', 'db_pool_overflow', [(f'engine="{nome}"', p['overflow']) for nome, p in pools]),
+        ('counter', 'db_pool_checkouts_total', [(f'engine="{nome}"', p['checkouts']) for nome, p in pools]),
+        ('counter', 'db_pool_timeouts_total', [(f'engine="{nome}"', p['timeouts']) for nome, p in pools]),
+        ('counter', 'db_pool_espera_segundos_total', [(f'engine="{nome}"', p['espera_total_s']) for nome, p in pools]),
+        ('counter', 'cache_hits_total', [(f'cache="{c["nome"]}"', c['hits']) for c in caches]),
+        ('counter', 'cache_misses_total', [(f'cache="{c["nome"]}"', c['misses']) for c in caches]),
+        ('gauge', 'checkins_pendentes', [('', buffer['pendentes'])]),
+        ('counter', 'checkins_gravados_total', [('', buffer['gravados'])]),
+        ('counter', 'checkins_rejeitados_total', [('', buffer['rejeitados'])]),
+        ('counter', 'checkins_falhas_flush_total', [('', buffer['falhas'])]),
+        ('gauge', 'admissao_limite', [('', controle['limite'])]),
+        ('gauge', 'admissao_em_andamento', [('', controle['em_andamento'])]),
+        ('gauge', 'admissao_na_fila', [('', controle['na_fila'])]),
+        ('counter', 'admissao_admitidas_total', [('', controle['admitidas'])]),
+        ('counter', 'admissao_enfileiradas_total', [('', controle['enfileiradas'])]),
+        ('counter', 'admissao_rejeitadas_total', [('motivo="fila_cheia"', controle['rejeitadas_fila_cheia']),
+                                                  ('motivo="espera"', controle['rejeitadas_espera'])]),
+        ('gauge', 'jobs_em_andamento', [('', pool_jobs['em_andamento'])]),
+        ('counter', 'jobs_concluidos_total', [('', pool_jobs['concluidos'])]),
+        ('counter', 'jobs_falhas_total', [('', pool_jobs['falhas'])]),
+    ]
+    return PlainTextResponse(metricas.texto(extras), media_type="text/plain; version=0.0.4")
+
+
+###############
+#EXCEPTIONS
+###############
+
+#Exception para quando o cliente manda um body preenchido de forma errada
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content=jsonable_encoder({"detail": exc.errors(), "body": exc.body}),
+    )
+
+#Exception para quando o If-Match não confere com a versão atual, ou outra escrita mudou a linha entre a leitura e o UPDATE
+@app.exception_handler(crud.ConflitoVersao)
+@app.exception_handler(StaleDataError)
+async def conflito_versao_exception_handler(request: Request, exc: Exception):
+    return JSONResponse(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        content={"detail": "A entidade foi alterada por outra requisição; busque a versão atual e tente de novo"},
+    )
+
+#Exception para quando uma escrita viola uma restrição do banco, como celular duplicado ou membro/plano inexistente
+@app.exception_handler(IntegrityError)
+async def integrity_exception_handler(request: Request, exc: IntegrityError):
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": "A alteração viola uma restrição do banco (valor duplicado ou referência inexistente)"},
+    )
@@ -0,0 +1,125 @@
+from contextvars import ContextVar
+from sqlalchemy import event
+import threading
+import time
+
+#Métricas em memória por worker, expostas em formato texto do Prometheus em GET /metrics.
+#Cada requisição guarda seus contadores de SQL num objeto apontado por uma ContextVar;
+#os eventos do engine incrementam esse objeto, inclusive quando o crud roda no threadpool
+#ou via run_sync, já que o contexto é copiado e o objeto é o mesmo.
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_QUERIES = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.contagens = [0] * len(buckets)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.soma += valor
+        self.total += 1
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.contagens[i] += 1
+
+    def linhas(self, nome, rotulos):
+        for limite, contagem in zip(self.buckets, self.contagens):
+            yield f'{nome}_bucket{{{rotulos},le="{limite}"}} {contagem}'
+        yield f'{nome}_bucket{{{rotulos},le="+Inf"}} {self.total}'
+        yield f'{nome}_sum{{{rotulos}}} {self.soma}'
+        yield f'{nome}_count{{{rotulos}}} {self.total}'
+
+
+class ConsultasRequisicao:
+    __slots__ = ('queries', 'tempo')
+
+    def __init__(self):
+        self.queries = 0
+        self.tempo = 0.0
+
+consultas_atuais = ContextVar('consultas_atuais', default=None)
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.em_andamento = 0
+        self.latencia = {}
+        self.queries = {}
+        self.tempo_db = {}
+        self.status = {}
+        self.queries_total = 0
+        self.tempo_db_total = 0.0
+
+    def inicio_requisicao(self):
+        with self._lock:
+            self.em_andamento += 1
+        consultas = ConsultasRequisicao()
+        return consultas, consultas_atuais.set(consultas)
+
+    def fim_requisicao(self, metodo, rota, status, duracao, consultas, token):
+        consultas_atuais.reset(token)
+        chave = (metodo, rota)
+        with self._lock:
+            self.em_andamento -= 1
+            self.latencia.setdefault(chave, Histograma(BUCKETS_LATENCIA)).observar(duracao)
+            self.queries.setdefault(chave, Histograma(BUCKETS_QUERIES)).observar(consultas.queries)
+            self.tempo_db[chave] = self.tempo_db.get(chave, 0.0) + consultas.tempo
+            chave_status = (metodo, rota, status)
+            self.status[chave_status] = self.status.get(chave_status, 0) + 1
+
+    def registrar_query(self, duracao):
+        consultas = consultas_atuais.get()
+        if consultas is not None:
+            consultas.queries += 1
+            consultas.tempo += duracao
+        with self._lock:
+            self.queries_total += 1
+            self.tempo_db_total += duracao
+
+    #Aceita um engine ou a própria classe Engine, que instrumenta todos os engines, inclusive os criados depois
+    def instrumentar_engine(self, engine):
+        @event.listens_for(engine, "before_cursor_execute")
+        def antes(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('inicio_query', []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def depois(conn, cursor, statement, parameters, context, executemany):
+            self.registrar_query(time.perf_counter() - conn.info['inicio_query'].pop())
+
+    def texto(self, extras=()):
+        with self._lock:
+            linhas = [
+                '# TYPE http_requisicoes_em_andamento gauge',
+                f'http_requisicoes_em_andamento {self.em_andamento}',
+                '# TYPE http_requisicoes_total counter',
+            ]
+            for (metodo, rota, status), total in sorted(self.status.items()):
+                linhas.append(f'http_requisicoes_total{{metodo="{metodo}",rota="{rota}",status="{status}"}} {total}')
+            linhas.append('# TYPE http_latencia_segundos histogram')
+            for (metodo, rota), histograma in sorted(self.latencia.items()):
+                linhas.extend(histograma.linhas('http_latencia_segundos', f'metodo="{metodo}",rota="{rota}"'))
+            linhas.append('# TYPE db_queries_por_requisicao histogram')
+            for (metodo, rota), histograma in sorted(self.queries.items()):
+                linhas.extend(histograma.linhas('db_queries_por_requisicao', f'metodo="{metodo}",rota="{rota}"'))
+            linhas.append('# TYPE db_tempo_segundos_total counter')
+            for (metodo, rota), tempo in sorted(self.tempo_db.items()):
+                linhas.append(f'db_tempo_segundos_total{{metodo="{metodo}",rota="{rota}"}} {tempo}')
+            linhas += [
+                '# TYPE db_queries_total counter',
+                f'db_queries_total {self.queries_total}',
+                '# TYPE db_tempo_total_segundos counter',
+                f'db_tempo_total_segundos {self.tempo_db_total}',
+            ]
+        for tipo, nome, valores in extras:
+            linhas.append(f'# TYPE {nome} {tipo}')
+            for rotulos, valor in valores:
+                linhas.append(f'{nome}{{{rotulos}}} {valor}' if rotulos else f'{nome} {valor}')
+        return '\n'.join(linhas) + '\n'
+
+
+metricas = Metricas()
@@ -0,0 +1,163 @@
+"""Preparação do schema: cria o banco e as tabelas que faltam e aplica as migrações.
+
+Roda uma vez por deploy (python migracoes.py), e não a cada worker que sobe; com
+DB_BOOTSTRAP=1 o lifespan de main.py roda o mesmo passo na inicialização.
+
+create_all só cria tabelas que não existem; colunas e índices novos em tabelas antigas
+são aplicados pelas migrações abaixo. Cada uma confere o estado atual antes de alterar qualquer coisa.
+"""
+from sqlalchemy import func, inspect, select, text, Numeric
+from sqlalchemy_utils import database_exists, create_database
+from datetime import datetime
+import os
+import time
+
+import crud
+import database
+import models
+from database import SessionLocal
+
+sql_script_path = 'assets/db_script.sql'
+
+
+#Os mesmos dados de exemplo do db_script.sql, para os bancos que não são criados por ele
+def inserir_exemplos(engine):
+    membros = [("Micah", "Zassim", 55554433), ("Flip", "Liporg", 6942314), ("Adin", "Samura", 119926183)]
+    planos = [("diario", 50, 1), ("mensal", 150, 30), ("semestral", 600, 180)]
+    assinaturas = [(1, 2, 1), (2, 1, 1), (3, 3, 0)]
+    with engine.begin() as con:
+        con.execute(models.Membros.__table__.insert(), [dict(nome=nome, sobrenome=sobrenome, celular=celular,
+                                                             **crud.campos_busca(nome, sobrenome))
+                                                        for nome, sobrenome, celular in membros])
+        con.execute(models.Planos.__table__.insert(), [dict(nome=nome, preco=preco, duracao_dias=duracao_dias)
+                                                       for nome, preco, duracao_dias in planos])
+        con.execute(models.Assinaturas.__table__.insert(), [dict(id_membro=id_membro, id_plano=id_plano, ativo=ativo,
+                                                                 data_ativacao=datetime(2001, 12, 12))
+                                                            for id_membro, id_plano, ativo in assinaturas])
+
+#No MySQL, um banco novo é criado pelo db_script.sql (com os dados de exemplo). Nos demais, como o SQLite
+#de DB_SQLITE, as tabelas vêm do create_all, que gera o DDL de cada dialeto a partir de models.py, e os
+#dados de exemplo de inserir_exemplos
+def criar_banco():
+    engine = database.get_engine()
+    criado = not database_exists(database.SQLALCHEMY_DATABASE_URL)
+    if criado and engine.dialect.name == "mysql":
+        create_database(database.SQLALCHEMY_DATABASE_URL)
+        with open(sql_script_path, 'r') as f:
+            sql_script = f.read()
+        with engine.connect() as con:
+            con.exec_driver_sql(sql_script)
+    elif criado and database.sqlite_em_arquivo(database.SQLALCHEMY_DATABASE_URL):
+        diretorio = os.path.dirname(os.path.abspath(engine.url.database))
+        os.makedirs(diretorio, exist_ok=True)
+    models.Base.metadata.create_all(bind=engine)
+    if criado and engine.dialect.name != "mysql":
+        inserir_exemplos(engine)
+    return criado
+
+def colunas_existentes(tabela):
+    return {coluna['name'] for coluna in inspect(database.get_engine()).get_columns(tabela)}
+
+def indices_existentes(tabela):
+    return {indice['name'] for indice in inspect(database.get_engine()).get_indexes(tabela)}
+
+def adicionar_colunas(modelo, nomes):
+    tabela = modelo.__table__
+    existentes = colunas_existentes(tabela.name)
+    adicionadas = []
+    engine = database.get_engine()
+    with engine.begin() as con:
+        for nome in nomes:
+            if nome in existentes:
+                continue
+            coluna = tabela.c[nome]
+            tipo = coluna.type.compile(dialect=engine.dialect)
+            nulo = "NULL" if coluna.nullable else "NOT NULL"
+            padrao = f" DEFAULT {coluna.server_default.arg}" if coluna.server_default is not None else ""
+            con.execute(text(f"ALTER TABLE {tabela.name} ADD COLUMN {nome} {tipo} {nulo}{padrao}"))
+            adicionadas.append(nome)
+    return adicionadas
+
+def criar_indices(modelo, ignorar=()):
+    existentes = indices_existentes(modelo.__tablename__)
+    criados = []
+    for indice in modelo.__table__.indexes:
+        if indice.name not in existentes and indice.name not in ignorar:
+            indice.create(bind=database.get_engine())
+            criados.append(indice.name)
+    return criados
+
+
+#O índice de celular é único; numa base antiga com celulares repetidos ele não poderia ser criado
+def celulares_duplicados():
+    celular = models.Membros.__table__.c.celular
+    consulta = select(celular).where(celular.isnot(None)).group_by(celular).having(func.count() > 1).order_by(celular)
+    with database.get_engine().connect() as con:
+        return con.execute(consulta).scalars().all()
+
+
+def busca_membros():
+    adicionadas = adicionar_colunas(models.Membros, ["nome_busca", "sobrenome_busca"])
+    #Com celulares repetidos o índice único fica de fora (e a migração segue) até que eles sejam corrigidos
+    #à mão; os repetidos saem no resultado, e a próxima execução cria o índice
+    duplicados = []
+    if "ix_membros_celular" not in indices_existentes(models.Membros.__tablename__):
+        duplicados = celulares_duplicados()
+    criados = criar_indices(models.Membros, ignorar={"ix_membros_celular"} if duplicados else ())
+    preenchidos = 0
+    if adicionadas:
+        db = SessionLocal()
+        try:
+            preenchidos = crud.preencher_busca_membros(db)
+        finally:
+            db.close()
+    return {"colunas": adicionadas, "indices": criados, "linhas": preenchidos, "celulares_duplicados": duplicados}
+
+
+#planos.preco era VARCHAR; passa a DECIMAL para que as somas dos relatórios rodem no banco sem conversão por linha
+def preco_numerico():
+    engine = database.get_engine()
+    tipo_atual = next(c['type'] for c in inspect(engine).get_columns('planos') if c['name'] == 'preco')
+    if isinstance(tipo_atual, Numeric):
+        return {"alterado": False}
+    if engine.dialect.name == "sqlite":
+        #SQLite não altera o tipo de uma coluna e já converte texto numérico nas agregações
+        return {"alterado": False}
+    novo_tipo = models.Planos.__table__.c.preco.type.compile(dialect=engine.dialect)
+    with engine.begin() as con:
+        con.execute(text(f"ALTER TABLE planos MODIFY COLUMN preco {novo_tipo} NOT NULL"))
+    return {"alterado": True, "tipo": novo_tipo}
+
+
+def duracao_planos():
+    return {"colunas": adicionar_colunas(models.Planos, ["duracao_dias"])}
+
+
+#A expiração seleciona os lotes por ativo e plano, na ordem de data_ativacao, pelo índice composto
+#(ativo, id_plano, data_ativacao); bancos criados sem ele, ou sem o de data_ativacao, os recebem aqui
+def indices_assinaturas():
+    return {"indices": criar_indices(models.Assinaturas)}
+
+
+#Coluna versao das tabelas principais, com DEFAULT 1 para as linhas que já existem
+def versionamento():
+    return {modelo.__tablename__: adicionar_colunas(modelo, ["versao"]) for modelo in (models.Membros, models.Planos, models.Assinaturas)}
+
+
+#versionamento vem primeiro: as demais migrações usam os modelos, que já esperam a coluna versao
+MIGRACOES = [versionamento, busca_membros, preco_numerico, duracao_planos, indices_assinaturas]
+
+def migrar():
+    return {migracao.__name__: migracao() for migracao in MIGRACOES}
+
+def preparar():
+    inicio = time.perf_counter()
+    resultado = {'banco_criado': criar_banco()}
+    resultado.update(migrar())
+    resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+if __name__ == "__main__":
+    for nome, resultado in preparar().items():
+        print(nome, resultado)
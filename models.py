@@ -1,37 +1,105 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, BigInteger
-from sqlalchemy.orm import relationship
-
-from database import Base
-
-
-class Membros(Base):
-    __tablename__ = "membros"
-
-    id_membro = Column(Integer, primary_key=True, index=True)
-    nome = Column(String(length=255), nullable=False)
-    sobrenome = Column(String(length=255), nullable=False)
-    celular = Column(BigInteger,nullable=True)
-
-    assinaturas = relationship("Assinaturas", back_populates="membro")
-
-class Planos(Base):
-    __tablename__ = "planos"
-
-    id_plano = Column(Integer, primary_key=True, index=True)
-    nome = Column(String(length=255), index=True, nullable=False)
-    preco = Column(String(length=255), index=True, nullable=False)
-
-    assinaturas = relationship("Assinaturas", back_populates="plano")
-    
-
-class Assinaturas(Base):
-    __tablename__ = "assinaturas"
-
-    id_assinatura = Column(Integer, primary_key=True, index=True)
-    data_ativacao = Column(DateTime, index=True, nullable=False)
-    ativo = Column(Integer, index=True, nullable=False)
-    id_membro = Column(Integer, ForeignKey("membros.id_membro"))
-    id_plano = Column(Integer, ForeignKey("planos.id_plano"))
-    
-    membro = relationship("Membros", back_populates="assinaturas")
-    plano = relationship("Planos", back_populates="assinaturas")
\ No newline at end of file
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, DateTime, BigInteger, Numeric, Float
+from sqlalchemy.orm import relationship
+
+from database import Base
+
+
+class Membros(Base):
+    __tablename__ = "membros"
+
+    id_membro = Column(Integer, primary_key=True, index=True)
+    nome = Column(String(length=255), nullable=False)
+    sobrenome = Column(String(length=255), nullable=False)
+    celular = Column(BigInteger, nullable=True, unique=True, index=True)
+    #nome e sobrenome normalizados (minúsculas, sem acento) para busca por prefixo indexada
+    nome_busca = Column(String(length=255), index=True, nullable=True)
+    sobrenome_busca = Column(String(length=255), index=True, nullable=True)
+    #Incrementada a cada alteração (pelo ORM via version_id_col e pelos UPDATEs de crud.atualizar); base do ETag
+    versao = Column(Integer, nullable=False, default=1, server_default="1")
+
+    assinaturas = relationship("Assinaturas", back_populates="membro")
+
+    __mapper_args__ = {"version_id_col": versao}
+
+class Planos(Base):
+    __tablename__ = "planos"
+
+    id_plano = Column(Integer, primary_key=True, index=True)
+    nome = Column(String(length=255), index=True, nullable=False)
+    preco = Column(Numeric(precision=10, scale=2), index=True, nullable=False)
+    #Dias de validade de uma assinatura a partir de data_ativacao; nulo para planos sem vencimento
+    duracao_dias = Column(Integer, nullable=True)
+    versao = Column(Integer, nullable=False, default=1, server_default="1")
+
+    assinaturas = relationship("Assinaturas", back_populates="plano")
+
+    __mapper_args__ = {"version_id_col": versao}
+    
+
+class Assinaturas(Base):
+    __tablename__ = "assinaturas"
+
+    id_assinatura = Column(Integer, primary_key=True, index=True)
+    data_ativacao = Column(DateTime, index=True, nullable=False)
+    ativo = Column(Integer, index=True, nullable=False)
+    id_membro = Column(Integer, ForeignKey("membros.id_membro"))
+    id_plano = Column(Integer, ForeignKey("planos.id_plano"))
+    versao = Column(Integer, nullable=False, default=1, server_default="1")
+    
+    membro = relationship("Membros", back_populates="assinaturas")
+    plano = relationship("Planos", back_populates="assinaturas")
+
+    __mapper_args__ = {"version_id_col": versao}
+    #O índice composto cobre o lote da expiração (ativo e plano fixos, em ordem de data_ativacao) sem ordenar.
+    #No SQLite, sem AUTOINCREMENT o id da última assinatura seria reaproveitado depois de ela ir para o arquivo
+    __table_args__ = (Index("ix_assinaturas_ativo_plano_data", "ativo", "id_plano", "data_ativacao"),
+                      {"sqlite_autoincrement": True})
+
+
+#Passagens pela catraca; gravadas em lote pelo buffer de checkins.py
+class Checkins(Base):
+    __tablename__ = "checkins"
+
+    id_checkin = Column(Integer, primary_key=True, index=True)
+    id_membro = Column(Integer, ForeignKey("membros.id_membro"), index=True, nullable=False)
+    id_assinatura = Column(Integer, nullable=True)
+    data_hora = Column(DateTime, index=True, nullable=False)
+
+
+#Assinaturas retiradas da tabela principal, por exemplo ao apagar um membro com cascata=arquivar.
+#Sem chaves estrangeiras, já que o membro ou o plano podem não existir mais
+class AssinaturasArquivadas(Base):
+    __tablename__ = "assinaturas_arquivadas"
+
+    id_assinatura = Column(Integer, primary_key=True, autoincrement=False)
+    data_ativacao = Column(DateTime, index=True, nullable=False)
+    ativo = Column(Integer, nullable=False)
+    id_membro = Column(Integer, index=True)
+    id_plano = Column(Integer, index=True)
+    arquivada_em = Column(DateTime, nullable=False)
+
+
+#Contadores de versão usados para invalidar os caches em memória de todos os workers
+class VersoesCache(Base):
+    __tablename__ = "versoes_cache"
+
+    nome = Column(String(length=64), primary_key=True)
+    versao = Column(Integer, nullable=False, default=0)
+
+
+#Relatórios pedidos em POST /jobs/{relatorio} e executados fora dos workers da API, pelo pool de processos de jobs.py.
+#estado: pendente, executando, concluido ou falhou; arquivo é o caminho do resultado, relativo a JOBS_DIR
+class Jobs(Base):
+    __tablename__ = "jobs"
+
+    id_job = Column(String(length=32), primary_key=True)
+    relatorio = Column(String(length=64), nullable=False)
+    parametros = Column(String(length=1024), nullable=False)
+    estado = Column(String(length=16), index=True, nullable=False)
+    progresso = Column(Float, nullable=False, default=0)
+    linhas = Column(Integer, nullable=False, default=0)
+    arquivo = Column(String(length=255), nullable=True)
+    erro = Column(String(length=1024), nullable=True)
+    criado_em = Column(DateTime, index=True, nullable=False)
+    iniciado_em = Column(DateTime, nullable=True)
+    concluido_em = Column(DateTime, nullable=True)
\ No newline at end of file
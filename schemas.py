@@ -1,6 +1,10 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Generic, TypeVar
+from enum import Enum
+from decimal import Decimal
+
+T = TypeVar("T")
 
 class MembrosBase(BaseModel):
     id_membro: int
@@ -18,6 +22,11 @@ class MembrosBase(BaseModel):
         title="Celular do membro com DDD de estado",
         example=11912345678
     )
+    versao: Optional[int] = Field(
+        default=None,
+        title="Versão da linha, incrementada a cada alteração; ignorada na criação e nas atualizações",
+        example=1
+    )
 
     class Config:
         orm_mode = True
@@ -25,6 +34,16 @@ class MembrosBase(BaseModel):
 class MembrosCreate(MembrosBase):
     pass
 
+#Atualização parcial: só os campos presentes no body são aplicados
+class MembrosPatch(BaseModel):
+    nome: Optional[str] = Field(default=None, title="Nome do membro", max_length=255, example="Joao")
+    sobrenome: Optional[str] = Field(default=None, title="Sobrenome do membro", max_length=255, example="Macedo")
+    celular: Optional[int] = Field(default=None, title="Celular do membro com DDD de estado", example=11912345678)
+
+class MembrosPatchBulk(BaseModel):
+    ids: List[int] = Field(title="IDs dos membros a atualizar", example=[1, 2, 3])
+    valores: MembrosPatch
+
 class PlanosBase(BaseModel):
     id_plano: int
     nome: str = Field(
@@ -36,6 +55,17 @@ class PlanosBase(BaseModel):
         title="Preco do plano por mês, em reais",
         example=50.99
     )
+    duracao_dias: Optional[int] = Field(
+        default=None,
+        title="Dias de validade da assinatura a partir da ativação; nulo para planos sem vencimento",
+        ge=1,
+        example=365
+    )
+    versao: Optional[int] = Field(
+        default=None,
+        title="Versão da linha, incrementada a cada alteração; ignorada na criação e nas atualizações",
+        example=1
+    )
 
     class Config:
         orm_mode = True
@@ -43,6 +73,15 @@ class PlanosBase(BaseModel):
 class PlanosCreate(PlanosBase):
     pass
 
+class PlanosPatch(BaseModel):
+    nome: Optional[str] = Field(default=None, title="Nome do plano", max_length=255, example="Plano 1 ano")
+    preco: Optional[float] = Field(default=None, title="Preco do plano por mês, em reais", example=50.99)
+    duracao_dias: Optional[int] = Field(default=None, title="Dias de validade da assinatura; null remove o vencimento", ge=1, example=365)
+
+class PlanosPatchBulk(BaseModel):
+    ids: List[int] = Field(title="IDs dos planos a atualizar", example=[1, 2])
+    valores: PlanosPatch
+
 class AssinaturasBase(BaseModel):
     id_assinatura: int
     ativo: bool = Field(
@@ -66,6 +105,172 @@ class Assinaturas(AssinaturasBase):
         title="Número correspondente ao plano da academia",
         example=1
     )
+    versao: Optional[int] = Field(
+        default=None,
+        title="Versão da linha, incrementada a cada alteração; ignorada na criação e nas atualizações",
+        example=1
+    )
 
     class Config:
         orm_mode = True
+
+class AssinaturasExpandida(Assinaturas):
+    membro: Optional[MembrosBase] = Field(
+        default=None,
+        title="Dados do membro, presente quando expand inclui 'membro'"
+    )
+    plano: Optional[PlanosBase] = Field(
+        default=None,
+        title="Dados do plano, presente quando expand inclui 'plano'"
+    )
+    arquivada_em: Optional[datetime] = Field(
+        default=None,
+        title="Quando a assinatura foi movida para o arquivo; null nas assinaturas da tabela principal"
+    )
+
+class AssinaturasPatch(BaseModel):
+    ativo: Optional[bool] = Field(default=None, title="Descreve se o membro tem o plano ativado ou não", example=True)
+    data_ativacao: Optional[datetime] = Field(default=None, title="Data de ativação do plano", example="2023-11-07T10:00:00")
+    id_membro: Optional[int] = Field(default=None, title="Número correspondente ao membro da academia", example=1)
+    id_plano: Optional[int] = Field(default=None, title="Número correspondente ao plano da academia", example=2)
+
+#Seleciona as assinaturas por ids e/ou pelo plano atual; com os dois, valem ambos os filtros
+class AssinaturasPatchBulk(BaseModel):
+    ids: Optional[List[int]] = Field(default=None, title="IDs das assinaturas a atualizar", example=[1, 2, 3])
+    id_plano_atual: Optional[int] = Field(
+        default=None,
+        title="Atualiza as assinaturas deste plano, por exemplo para mover todos os membros do plano X para o Y",
+        example=1
+    )
+    valores: AssinaturasPatch
+
+class ResultadoPatch(BaseModel):
+    atualizados: int = Field(title="Quantidade de linhas encontradas pelo filtro e atualizadas")
+
+class CheckinCreate(BaseModel):
+    id_membro: int = Field(title="Membro que passou pela catraca", example=1)
+    data_hora: Optional[datetime] = Field(
+        default=None,
+        title="Momento da passagem; quando omitido, o horário em que o servidor recebeu o evento",
+        example="2023-11-07T10:00:00"
+    )
+
+class Checkin(CheckinCreate):
+    id_assinatura: int = Field(title="Assinatura ativa que liberou a entrada", example=1)
+    data_hora: datetime
+
+class ResultadoExpiracao(BaseModel):
+    expiradas: int = Field(title="Assinaturas desativadas nesta execução")
+    lotes: int = Field(title="UPDATEs executados, cada um com seu commit")
+    planos: int = Field(title="Planos com duracao_dias verificados")
+    segundos: float
+    em: Optional[datetime] = None
+
+class ResultadoArquivamento(BaseModel):
+    arquivadas: int = Field(title="Assinaturas movidas para assinaturas_arquivadas nesta execução")
+    lotes: int = Field(title="Lotes movidos, cada um na sua transação")
+    segundos: float
+    em: Optional[datetime] = None
+
+class ResultadoDelete(BaseModel):
+    apagados: int = Field(title="Quantidade de linhas apagadas")
+
+#O que fazer com as assinaturas de um membro apagado: apagá-las ou movê-las para assinaturas_arquivadas
+class ModoCascata(str, Enum):
+    apagar = "apagar"
+    arquivar = "arquivar"
+
+class Pagina(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[int] = Field(
+        default=None,
+        title="Cursor da próxima página; passe como 'after' para continuar. Nulo na última página",
+        example=50
+    )
+
+class ResultadoItemBulk(BaseModel):
+    indice: int = Field(title="Posição do item no array enviado")
+    status: str = Field(
+        title="criado, duplicado, invalido ou erro",
+        example="criado"
+    )
+    detalhe: Optional[str] = None
+
+class ResultadoBulk(BaseModel):
+    criados: int
+    itens: List[ResultadoItemBulk]
+
+class FormatoExport(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+class AtivosPorPlano(BaseModel):
+    id_plano: int
+    nome: str
+    membros_ativos: int
+    assinaturas_ativas: int
+
+class RelatorioAtivos(BaseModel):
+    membros_ativos: int = Field(title="Membros distintos com pelo menos uma assinatura ativa")
+    planos: List[AtivosPorPlano]
+
+class ReceitaPorPlano(BaseModel):
+    id_plano: int
+    nome: str
+    preco: Decimal
+    assinaturas_ativas: int
+    receita_mensal: Decimal
+
+class RelatorioReceita(BaseModel):
+    receita_mensal: Decimal = Field(title="Receita mensal recorrente das assinaturas ativas, em reais")
+    planos: List[ReceitaPorPlano]
+
+class Coorte(BaseModel):
+    coorte: str = Field(title="Mês da primeira ativação dos membros da coorte", example="2023-01")
+    membros: int
+    ativos: int = Field(title="Membros da coorte com alguma assinatura ativa hoje")
+    retencao: List[float] = Field(title="Fração dos membros que ativaram uma assinatura k meses depois da coorte, k = 0, 1, ...")
+
+class ChurnPlano(BaseModel):
+    id_plano: int
+    assinaturas: int = Field(title="Assinaturas do plano, incluindo as arquivadas")
+    ativas: int
+    arquivadas: int
+    churn: float = Field(title="Fração das assinaturas do plano que não estão ativas")
+
+class TrocasDePlano(BaseModel):
+    planos: List[int]
+    matriz: List[List[int]] = Field(title="matriz[i][j]: assinaturas consecutivas de um membro que foram de planos[i] para planos[j]")
+
+class SnapshotAnalitico(BaseModel):
+    linhas: int
+    atualizado_em: Optional[datetime] = None
+    atualizacoes: int
+    linhas_lidas: int = Field(title="Linhas lidas do banco desde a subida do worker")
+    blocos_relidos: int = Field(title="Blocos de ids relidos por terem mudado no banco")
+    segundos_ultima_atualizacao: float
+
+class RelatorioCoortes(BaseModel):
+    coortes: List[Coorte]
+    churn: List[ChurnPlano]
+    trocas_de_plano: TrocasDePlano
+    snapshot: SnapshotAnalitico
+    segundos_calculo: float
+
+class RelatorioJob(str, Enum):
+    assinaturas = "assinaturas"
+    membros = "membros"
+    coortes = "coortes"
+
+class Job(BaseModel):
+    id_job: str
+    relatorio: RelatorioJob
+    parametros: dict
+    estado: str = Field(title="pendente, executando, concluido ou falhou", example="executando")
+    progresso: float = Field(title="Fração do relatório já gerada, entre 0 e 1")
+    linhas: int = Field(title="Linhas escritas no resultado até agora")
+    erro: Optional[str] = None
+    criado_em: datetime
+    iniciado_em: Optional[datetime] = None
+    concluido_em: Optional[datetime] = None
+    resultado: Optional[str] = Field(default=None, title="URL do arquivo gerado, quando o job está concluído")
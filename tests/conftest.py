@@ -0,0 +1,68 @@
+"""Os testes sobem o app no próprio processo, sobre um arquivo SQLite temporário preparado pelo
+lifespan (DB_BOOTSTRAP=1). As variáveis de ambiente são lidas na importação de database.py, por isso
+são definidas aqui antes de qualquer import do app."""
+import itertools
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASTA = tempfile.mkdtemp(prefix="gym-crud-testes-")
+ARQUIVO = os.path.join(PASTA, "testes.sqlite")
+
+for nome in ("DB_SQLITE", "ASYNC_DB", "DATABASE_REPLICA_URLS", "ASYNC_DATABASE_REPLICA_URLS", "RESPOSTA_RAPIDA",
+             "DB_LENTA_MS", "EXPIRACAO_INTERVALO", "ARQUIVO_INTERVALO", "DB_SQLITE_AJUSTES"):
+    os.environ.pop(nome, None)
+os.environ.update(DATABASE_URL=f"sqlite:///{ARQUIVO}", ASYNC_DATABASE_URL=f"sqlite+aiosqlite:///{ARQUIVO}",
+                  DB_BOOTSTRAP="1", JOBS_DIR=os.path.join(PASTA, "jobs"))
+sys.path.insert(0, RAIZ)
+os.chdir(RAIZ)
+
+import pytest
+from fastapi.testclient import TestClient
+
+_celulares = itertools.count(11_900_000_000)
+_nomes = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+@pytest.fixture
+def db(client):
+    from database import SessionLocal
+    db = SessionLocal()
+    yield db
+    db.close()
+
+@pytest.fixture
+def criar_membro(client):
+    def criar(nome="Teste", sobrenome="Silva"):
+        resposta = client.post("/membros/create", json={"id_membro": 0, "nome": nome, "sobrenome": sobrenome,
+                                                        "celular": next(_celulares)})
+        assert resposta.status_code == 201, resposta.text
+        return resposta.json()
+    return criar
+
+@pytest.fixture
+def criar_plano(client):
+    def criar(preco=100.0, duracao_dias=None):
+        resposta = client.post("/planos/create", json={"id_plano": 0, "nome": f"Plano teste {next(_nomes)}",
+                                                       "preco": preco, "duracao_dias": duracao_dias})
+        assert resposta.status_code == 201, resposta.text
+        return resposta.json()
+    return criar
+
+@pytest.fixture
+def criar_assinatura(client):
+    def criar(id_membro, id_plano, ativo=True, data_ativacao=None):
+        data_ativacao = (data_ativacao or datetime.now().replace(microsecond=0)).isoformat()
+        resposta = client.post("/assinaturas/create", json={"id_assinatura": 0, "id_membro": id_membro, "id_plano": id_plano,
+                                                            "ativo": ativo, "data_ativacao": data_ativacao})
+        assert resposta.status_code == 201, resposta.text
+        return resposta.json()
+    return criar
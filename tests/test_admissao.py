@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import admissao
+
+
+def test_limite_cheio_sem_fila_responde_503():
+    controle = admissao.ControleAdmissao(limite_maximo=1, limite_minimo=1, tamanho_fila=0, ativo=True)
+
+    async def fluxo():
+        async with controle.admitir("/rota"):
+            with pytest.raises(HTTPException) as erro:
+                async with controle.admitir("/rota"):
+                    pass
+        return erro.value
+
+    erro = asyncio.run(fluxo())
+    assert erro.status_code == 503
+    assert int(erro.headers["Retry-After"]) >= 1
+    assert controle.estatisticas()["rejeitadas_fila_cheia"] == 1
+    assert controle.em_andamento == 0
+
+
+def test_fila_recebe_a_vaga_de_quem_sai_ou_desiste_no_tempo_maximo():
+    controle = admissao.ControleAdmissao(limite_maximo=1, limite_minimo=1, tamanho_fila=5, espera_maxima=0.05, ativo=True)
+    ordem = []
+
+    async def requisicao(nome, duracao):
+        async with controle.admitir("/rota"):
+            ordem.append(nome)
+            await asyncio.sleep(duracao)
+
+    async def fluxo():
+        primeira = asyncio.create_task(requisicao("primeira", 0.01))
+        await asyncio.sleep(0)
+        await asyncio.gather(primeira, requisicao("segunda", 0))
+        longa = asyncio.create_task(requisicao("longa", 0.2))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException):
+            await requisicao("atrasada", 0)
+        await longa
+
+    asyncio.run(fluxo())
+    assert ordem == ["primeira", "segunda", "longa"]
+    estatisticas = controle.estatisticas()
+    assert (estatisticas["enfileiradas"], estatisticas["rejeitadas_espera"], estatisticas["na_fila"]) == (2, 1, 0)
+    assert controle.em_andamento == 0
+
+
+@pytest.fixture
+def lotado(client, monkeypatch):
+    controle = admissao.ControleAdmissao(limite_maximo=1, limite_minimo=1, tamanho_fila=0, ativo=True)
+    monkeypatch.setattr(admissao, "controle", controle)
+    vaga = controle.admitir("/teste")
+    client.portal.call(vaga.__aenter__)
+    yield controle
+    client.portal.call(vaga.__aexit__, None, None, None)
+
+
+@pytest.mark.parametrize("metodo,rota", [("GET", "/membros/"), ("GET", "/assinaturas/export"), ("GET", "/relatorios/coortes"),
+                                         ("POST", "/admin/expiracao"), ("POST", "/admin/arquivo")])
+def test_rotas_com_banco_respondem_503_com_o_limite_cheio(client, lotado, metodo, rota):
+    resposta = client.request(metodo, rota)
+    assert resposta.status_code == 503
+    assert "Retry-After" in resposta.headers
+
+
+def test_leitura_de_plano_do_cache_fica_fora_da_admissao(client, criar_plano, monkeypatch):
+    plano = criar_plano()
+    controle = admissao.ControleAdmissao(limite_maximo=1, limite_minimo=1, tamanho_fila=0, ativo=True)
+    monkeypatch.setattr(admissao, "controle", controle)
+    controle.em_andamento = 1
+    assert client.get(f"/planos/{plano['id_plano']}").status_code == 200
+
+
+def test_export_devolve_a_vaga_no_fim_do_streaming(client, monkeypatch):
+    controle = admissao.ControleAdmissao(limite_maximo=1, limite_minimo=1, tamanho_fila=0, ativo=True)
+    monkeypatch.setattr(admissao, "controle", controle)
+    assert client.get("/assinaturas/export").status_code == 200
+    assert client.get("/relatorios/coortes").status_code == 200
+    assert controle.em_andamento == 0
+    assert controle.estatisticas()["admitidas"] == 2
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import numpy as np
+
+import analitico
+import crud
+import models
+from database import SessionLocal
+
+
+def colunas(*linhas):
+    return analitico.para_colunas(list(linhas))
+
+
+def test_coortes_retencao_por_mes():
+    resultado = analitico.coortes(colunas(
+        (1, 1, 1, datetime(2023, 1, 5), 0, 1, 0),
+        (2, 1, 1, datetime(2023, 2, 5), 1, 1, 0),
+        (3, 2, 1, datetime(2023, 1, 20), 0, 1, 0),
+        (4, 3, 2, datetime(2023, 3, 1), 1, 1, 1),
+    ), meses=3)
+    assert resultado == [{'coorte': '2023-01', 'membros': 2, 'ativos': 1, 'retencao': [1.0, 0.5, 0.0]},
+                         {'coorte': '2023-03', 'membros': 1, 'ativos': 0, 'retencao': [1.0, 0.0, 0.0]}]
+
+
+def test_churn_e_trocas_de_plano():
+    dados = colunas(
+        (1, 1, 1, datetime(2023, 1, 1), 0, 1, 0),
+        (2, 1, 2, datetime(2023, 2, 1), 0, 1, 1),
+        (3, 1, 2, datetime(2023, 3, 1), 1, 1, 0),
+        (4, 2, 1, datetime(2023, 1, 1), 1, 1, 0),
+    )
+    assert analitico.churn_por_plano(dados) == [
+        {'id_plano': 1, 'assinaturas': 2, 'ativas': 1, 'arquivadas': 0, 'churn': 0.5},
+        {'id_plano': 2, 'assinaturas': 2, 'ativas': 1, 'arquivadas': 1, 'churn': 0.5},
+    ]
+    assert analitico.trocas_de_plano(dados) == {'planos': [1, 2], 'matriz': [[0, 1], [0, 1]]}
+
+
+def test_arquivada_com_ativo_nao_conta_como_ativa():
+    dados = colunas(
+        (1, 1, 1, datetime(2023, 1, 1), 1, 1, 1),
+        (2, 2, 1, datetime(2023, 1, 1), 1, 1, 0),
+    )
+    assert analitico.churn_por_plano(dados) == [{'id_plano': 1, 'assinaturas': 2, 'ativas': 1, 'arquivadas': 1, 'churn': 0.5}]
+    assert analitico.coortes(dados, 1)[0]['ativos'] == 1
+
+
+def test_snapshot_vazio():
+    vazias = analitico.vazias()
+    assert analitico.coortes(vazias, 12) == []
+    assert analitico.churn_por_plano(vazias) == []
+    assert analitico.trocas_de_plano(vazias) == {'planos': [], 'matriz': []}
+
+
+def contar_no_banco():
+    db = SessionLocal()
+    try:
+        return crud.contar(db, models.Assinaturas) + crud.contar(db, models.AssinaturasArquivadas)
+    finally:
+        db.close()
+
+
+def test_snapshot_le_novas_e_rele_os_blocos_alterados(client, criar_membro, criar_plano, criar_assinatura):
+    snapshot = analitico.SnapshotAssinaturas(ttl=0, reconciliar=0, bloco=4, tamanho_lote=3)
+    snapshot.atualizar()
+    assert snapshot.estatisticas()['linhas'] == contar_no_banco()
+    plano = criar_plano()
+    assinatura = criar_assinatura(criar_membro()["id_membro"], plano["id_plano"])
+    snapshot.atualizar()
+    assert snapshot.estatisticas()['linhas'] == contar_no_banco()
+    posicao = int(np.searchsorted(snapshot.colunas['id_assinatura'], assinatura["id_assinatura"]))
+    assert snapshot.colunas['ativo'][posicao]
+
+    client.patch(f"/assinaturas/update/{assinatura['id_assinatura']}", json={"ativo": False})
+    relidos = snapshot.blocos_relidos
+    snapshot.atualizar()
+    assert snapshot.blocos_relidos == relidos + 1
+    assert not snapshot.colunas['ativo'][posicao]
+    assert list(snapshot.colunas['id_assinatura']) == sorted(snapshot.colunas['id_assinatura'])
+
+
+def test_rota_de_coortes(client, criar_membro, criar_plano, criar_assinatura):
+    criar_assinatura(criar_membro()["id_membro"], criar_plano()["id_plano"])
+    resposta = client.get("/relatorios/coortes", params={"meses": 6})
+    assert resposta.status_code == 200, resposta.text
+    corpo = resposta.json()
+    assert corpo["coortes"] and all(len(c["retencao"]) <= 6 for c in corpo["coortes"])
+    assert corpo["snapshot"]["linhas"] > 0
+    assert client.get("/relatorios/coortes", params={"meses": 0}).status_code == 422
+
+
+#Uma assinatura ativa arquivada pela cascata de exclusão do membro deixa de contar entre as ativas
+def test_snapshot_nao_conta_ativa_arquivada(client, criar_membro, criar_plano, criar_assinatura):
+    plano = criar_plano()
+    membro = criar_membro()
+    criar_assinatura(membro["id_membro"], plano["id_plano"], ativo=True)
+    snapshot = analitico.SnapshotAssinaturas(ttl=0, reconciliar=0, bloco=4)
+    snapshot.atualizar()
+    churn = {linha['id_plano']: linha for linha in analitico.churn_por_plano(snapshot.colunas)}
+    assert churn[plano["id_plano"]]['ativas'] == 1
+
+    client.delete(f"/membros/delete/{membro['id_membro']}", params={"cascata": "arquivar"})
+    snapshot.atualizar()
+    churn = {linha['id_plano']: linha for linha in analitico.churn_por_plano(snapshot.colunas)}
+    assert (churn[plano["id_plano"]]['ativas'], churn[plano["id_plano"]]['arquivadas']) == (0, 1)
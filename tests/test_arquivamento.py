@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+import arquivamento
+
+
+def test_arquivamento_move_as_inativas_antigas(client, criar_membro, criar_plano, criar_assinatura):
+    plano = criar_plano()
+    antiga = datetime.now().replace(microsecond=0) - timedelta(days=90)
+    inativa = criar_assinatura(criar_membro()["id_membro"], plano["id_plano"], ativo=False, data_ativacao=antiga)
+    ativa = criar_assinatura(criar_membro()["id_membro"], plano["id_plano"], data_ativacao=antiga)
+    recente = criar_assinatura(criar_membro()["id_membro"], plano["id_plano"], ativo=False)
+    antes = datetime.now().replace(microsecond=0)
+    resposta = client.post("/admin/arquivo")
+    assert resposta.status_code == 200
+    assert resposta.json()["arquivadas"] >= 1
+    assert client.get("/admin/arquivo").json() == resposta.json()
+    assert client.get(f"/assinaturas/{inativa['id_assinatura']}").status_code == 422
+    assert client.get(f"/assinaturas/{ativa['id_assinatura']}").status_code == 200
+    assert client.get(f"/assinaturas/{recente['id_assinatura']}").status_code == 200
+
+    pagina = client.get("/assinaturas/", params={"include_archived": True, "after": inativa["id_assinatura"] - 1, "limit": 3}).json()
+    itens = {item["id_assinatura"]: item for item in pagina["items"]}
+    assert set(itens) == {inativa["id_assinatura"], ativa["id_assinatura"], recente["id_assinatura"]}
+    #arquivada_em no relógio local, e não em UTC
+    arquivada_em = datetime.fromisoformat(itens[inativa["id_assinatura"]]["arquivada_em"])
+    assert antes - timedelta(seconds=1) <= arquivada_em <= datetime.now()
+    assert itens[ativa["id_assinatura"]]["arquivada_em"] is None
+    pagina = client.get("/assinaturas/", params={"after": inativa["id_assinatura"] - 1, "limit": 3}).json()
+    assert inativa["id_assinatura"] not in {item["id_assinatura"] for item in pagina["items"]}
+
+
+def test_arquivamento_em_lotes(client, criar_membro, criar_plano, criar_assinatura):
+    arquivamento.arquivar()
+    plano = criar_plano()
+    antiga = datetime.now().replace(microsecond=0) - timedelta(days=90)
+    for _ in range(5):
+        criar_assinatura(criar_membro()["id_membro"], plano["id_plano"], ativo=False, data_ativacao=antiga)
+    resultado = arquivamento.arquivar(tamanho_lote=2)
+    assert (resultado["arquivadas"], resultado["lotes"]) == (5, 3)
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import PASTA, RAIZ
+
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+import rotas
+
+
+#Uma rodada mínima do benchmark num banco próprio: toda rota responde sem erros e com as medidas no JSON
+def test_benchmark_de_rotas():
+    saida = os.path.join(PASTA, "bench.json")
+    env = {nome: valor for nome, valor in os.environ.items() if nome not in ("DATABASE_URL", "ASYNC_DATABASE_URL")}
+    comando = [sys.executable, os.path.join(RAIZ, "benchmarks", "rotas.py"), "--url", "sqlite:///" + os.path.join(PASTA, "bench.sqlite"),
+               "--membros", "30", "--planos", "3", "--requisicoes", "10", "--concorrencia", "2", "--saida", saida]
+    resultado = subprocess.run(comando, cwd=RAIZ, env=env, capture_output=True, text=True, timeout=300)
+    assert resultado.returncode == 0, resultado.stderr
+    with open(saida) as f:
+        medidas = json.load(f)
+    assert medidas["resultados"]
+    for cenario in medidas["resultados"]:
+        assert cenario["erros"] == 0, cenario
+        assert cenario["req_por_segundo"] > 0
+
+
+def test_url_assincrona_aponta_para_o_mesmo_banco():
+    assert rotas.url_assincrona("sqlite:///bench.sqlite") == "sqlite+aiosqlite:///bench.sqlite"
+    assert rotas.url_assincrona("mysql+pymysql://u:s@localhost/academia") == "mysql+aiomysql://u:s@localhost/academia"
+    assert rotas.url_assincrona("mysql://u:s@localhost/academia") == "mysql+aiomysql://u:s@localhost/academia"
+
+
+def test_benchmark_recusa_banco_sem_driver_assincrono():
+    comando = [sys.executable, os.path.join(RAIZ, "benchmarks", "rotas.py"), "--url", "oracle://u:s@localhost/academia"]
+    resultado = subprocess.run(comando, cwd=RAIZ, capture_output=True, text=True, timeout=60)
+    assert resultado.returncode == 2
+    assert "oracle" in resultado.stderr
@@ -0,0 +1,58 @@
+import crud
+from database import SessionLocal
+
+
+#Sessão própria e fechada logo em seguida: com os ajustes do SQLite, o escritor tem uma única conexão
+def versao_planos():
+    db = SessionLocal()
+    try:
+        return db.execute(crud.select_versao_cache('planos')).scalar() or 0
+    finally:
+        db.close()
+
+
+def test_membros_bulk_marca_duplicados(client, criar_membro):
+    existente = criar_membro()
+    resposta = client.post("/membros/bulk", json=[
+        {"id_membro": 0, "nome": "Lote", "sobrenome": "Um", "celular": 11_800_000_001},
+        {"id_membro": 0, "nome": "Lote", "sobrenome": "Dois", "celular": existente["celular"]},
+        {"id_membro": 0, "nome": "Lote", "sobrenome": "Tres", "celular": 11_800_000_001},
+    ])
+    assert resposta.status_code == 200, resposta.text
+    corpo = resposta.json()
+    assert corpo["criados"] == 1
+    assert [item["status"] for item in corpo["itens"]] == ["criado", "duplicado", "duplicado"]
+
+
+def test_bulk_acima_do_limite_responde_413(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "LIMITE_BULK", 1)
+    resposta = client.post("/membros/bulk", json=[{"id_membro": 0, "nome": "Lote", "sobrenome": "Cheio", "celular": None}] * 2)
+    assert resposta.status_code == 413
+
+
+def test_assinaturas_bulk_valida_membro_e_plano(client, criar_membro, criar_plano):
+    membro, plano = criar_membro(), criar_plano()
+    base = {"id_assinatura": 0, "ativo": True, "data_ativacao": "2024-01-01T00:00:00"}
+    resposta = client.post("/assinaturas/bulk", json=[
+        {**base, "id_membro": membro["id_membro"], "id_plano": plano["id_plano"]},
+        {**base, "id_membro": 999_999_999, "id_plano": plano["id_plano"]},
+        {**base, "id_membro": membro["id_membro"], "id_plano": 999_999_999},
+    ])
+    assert resposta.status_code == 200, resposta.text
+    assert [item["status"] for item in resposta.json()["itens"]] == ["criado", "invalido", "invalido"]
+
+
+def test_planos_bulk_sobe_a_versao_do_cache_so_quando_cria(client, criar_plano):
+    existente = criar_plano()
+    antes = versao_planos()
+    resposta = client.post("/planos/bulk", json=[{"id_plano": 0, "nome": existente["nome"], "preco": 10.0}])
+    assert resposta.json()["criados"] == 0
+    assert versao_planos() == antes
+
+    resposta = client.post("/planos/bulk", json=[{"id_plano": 0, "nome": "Plano bulk A", "preco": 10.0},
+                                                 {"id_plano": 0, "nome": "Plano bulk B", "preco": 20.0, "duracao_dias": 30}])
+    assert resposta.json()["criados"] == 2
+    assert versao_planos() == antes + 1
+    nomes = {plano["nome"] for plano in client.get("/planos", params={"limit": 100, "after": existente["id_plano"]}).json()["items"]}
+    assert {"Plano bulk A", "Plano bulk B"} <= nomes
@@ -0,0 +1,60 @@
+def test_busca_por_prefixo_sem_acento_nem_maiusculas(client, criar_membro):
+    membro = criar_membro(nome="Ângela", sobrenome="Buscável")
+    ids = [m["id_membro"] for m in client.get("/membros/search", params={"q": "ANGE"}).json()]
+    assert membro["id_membro"] in ids
+    ids = [m["id_membro"] for m in client.get("/membros/search", params={"q": "angela buscav"}).json()]
+    assert ids == [membro["id_membro"]]
+
+
+def test_busca_por_prefixo_encontra_nomes_mais_longos(client, criar_membro):
+    membro = criar_membro(nome="Prefixando", sobrenome="Estendidoz")
+    for q in ["prefix", "prefixand", "estendido", "prefixando estend"]:
+        ids = [m["id_membro"] for m in client.get("/membros/search", params={"q": q}).json()]
+        assert membro["id_membro"] in ids
+
+
+def test_busca_trata_porcentagem_e_sublinhado_como_literais(client, criar_membro):
+    literal = criar_membro(nome="Cur%inga", sobrenome="Sub_linha")
+    outro = criar_membro(nome="Curxinga", sobrenome="Subxlinha")
+    for q in ["cur%", "sub_", "cur%inga sub_"]:
+        ids = [m["id_membro"] for m in client.get("/membros/search", params={"q": q}).json()]
+        assert literal["id_membro"] in ids
+        assert outro["id_membro"] not in ids
+    assert client.get("/membros/search", params={"q": "%"}).json() == []
+
+
+def test_busca_por_celular(client, criar_membro):
+    membro = criar_membro()
+    resposta = client.get("/membros/search", params={"celular": membro["celular"]})
+    assert [m["id_membro"] for m in resposta.json()] == [membro["id_membro"]]
+    assert "nome_busca" not in resposta.json()[0]
+
+
+def test_busca_por_termo_vazio_apos_normalizar_nao_devolve_ninguem(client, criar_membro):
+    criar_membro()
+    for q in [" ", "´", " ~ "]:
+        resposta = client.get("/membros/search", params={"q": q})
+        assert resposta.status_code == 200
+        assert resposta.json() == []
+
+
+def test_busca_sem_filtro_responde_422(client):
+    assert client.get("/membros/search").status_code == 422
+
+
+def test_membros_sem_celular_nao_conflitam(client):
+    for _ in range(2):
+        resposta = client.post("/membros/create", json={"id_membro": 0, "nome": "Sem", "sobrenome": "Celular", "celular": None})
+        assert resposta.status_code == 201
+        assert resposta.json()["celular"] is None
+
+
+def test_busca_com_if_none_match_responde_304(client, criar_membro):
+    membro = criar_membro(nome="Etagildo", sobrenome="Busca")
+    resposta = client.get("/membros/search", params={"q": "etagildo"})
+    etag = resposta.headers["ETag"]
+    assert client.get("/membros/search", params={"q": "etagildo"}, headers={"If-None-Match": etag}).status_code == 304
+    client.patch(f"/membros/update/{membro['id_membro']}", json={"sobrenome": "Mudou"})
+    resposta = client.get("/membros/search", params={"q": "etagildo"}, headers={"If-None-Match": etag})
+    assert resposta.status_code == 200
+    assert resposta.headers["ETag"] != etag
@@ -0,0 +1,57 @@
+import time
+
+import cache
+import crud
+import models
+from database import SessionLocal
+
+
+def estatisticas_planos(client):
+    return next(c for c in client.get("/admin/cache").json() if c["nome"] == "planos")
+
+
+def test_leitura_repetida_vem_do_cache(client, criar_plano):
+    plano = criar_plano()
+    client.get(f"/planos/{plano['id_plano']}")
+    antes = estatisticas_planos(client)
+    assert client.get(f"/planos/{plano['id_plano']}").json() == plano
+    depois = estatisticas_planos(client)
+    assert depois["hits"] == antes["hits"] + 1
+    assert depois["misses"] == antes["misses"]
+
+
+def test_escrita_invalida_o_cache(client, criar_plano):
+    plano = criar_plano()
+    client.get(f"/planos/{plano['id_plano']}")
+    client.put(f"/planos/update/{plano['id_plano']}", json={"id_plano": 0, "nome": "", "preco": 12.5, "duracao_dias": None})
+    assert client.get(f"/planos/{plano['id_plano']}").json()["preco"] == 12.5
+
+
+#Outro worker que escreve só sobe a versão no banco; este worker percebe na próxima checagem
+def test_versao_no_banco_invalida_o_cache_de_outro_worker(client, criar_plano, monkeypatch):
+    plano = criar_plano()
+    client.get(f"/planos/{plano['id_plano']}")
+    db = SessionLocal()
+    try:
+        db.execute(models.Planos.__table__.update().where(models.Planos.id_plano == plano["id_plano"])
+                   .values(preco=7.0))
+        crud.incrementar_versao_cache(db, 'planos')
+        db.commit()
+    finally:
+        db.close()
+    monkeypatch.setattr(crud.cache_planos, "intervalo_versao", 0)
+    antes = estatisticas_planos(client)["invalidacoes"]
+    assert client.get(f"/planos/{plano['id_plano']}").json()["preco"] == 7.0
+    assert estatisticas_planos(client)["invalidacoes"] == antes + 1
+
+
+def test_cache_ttl_expira_e_descarta_o_mais_antigo():
+    cache_teste = cache.CacheTTL('teste', ttl=0.05, maxsize=2, intervalo_versao=1)
+    cache_teste.put('a', 1)
+    cache_teste.put('b', 2)
+    cache_teste.get('a')
+    cache_teste.put('c', 3)
+    assert cache_teste.get('b') == (False, None)
+    assert cache_teste.get('a') == (True, 1)
+    time.sleep(0.06)
+    assert cache_teste.get('a') == (False, None)
@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import checkins
+import crud
+import models
+from database import SessionLocal
+
+
+def checkins_do_membro(id_membro):
+    db = SessionLocal()
+    try:
+        return db.query(models.Checkins).filter(models.Checkins.id_membro == id_membro).all()
+    finally:
+        db.close()
+
+
+def test_checkin_sem_assinatura_ativa_responde_403(client, criar_membro, criar_plano, criar_assinatura):
+    membro = criar_membro()
+    criar_assinatura(membro["id_membro"], criar_plano()["id_plano"], ativo=False)
+    resposta = client.post("/checkins", json={"id_membro": membro["id_membro"]})
+    assert resposta.status_code == 403
+
+
+def test_checkin_e_gravado_no_flush(client, criar_membro, criar_plano, criar_assinatura):
+    membro = criar_membro()
+    assinatura = criar_assinatura(membro["id_membro"], criar_plano()["id_plano"])
+    resposta = client.post("/checkins", json={"id_membro": membro["id_membro"], "data_hora": "2024-05-01T07:30:00"})
+    assert resposta.status_code == 202
+    assert resposta.json()["id_assinatura"] == assinatura["id_assinatura"]
+    client.portal.call(checkins.buffer.flush)
+    gravados = checkins_do_membro(membro["id_membro"])
+    assert [(c.id_assinatura, c.data_hora.isoformat()) for c in gravados] == [(assinatura["id_assinatura"], "2024-05-01T07:30:00")]
+
+
+def test_checkin_com_a_fila_cheia_responde_503(client, criar_membro, criar_plano, criar_assinatura, monkeypatch):
+    membro = criar_membro()
+    criar_assinatura(membro["id_membro"], criar_plano()["id_plano"])
+    monkeypatch.setattr(checkins.buffer, "capacidade", checkins.buffer.pendentes())
+    resposta = client.post("/checkins", json={"id_membro": membro["id_membro"]})
+    assert resposta.status_code == 503
+    assert int(resposta.headers["Retry-After"]) >= 1
+
+
+#Sessão que falha no segundo INSERT, como um SQLite travado no meio do flush
+class FalhaNoSegundoInsert:
+    def __init__(self, db):
+        self.db = db
+        self.inserts = 0
+
+    def execute(self, *args, **kwargs):
+        self.inserts += 1
+        if self.inserts == 2:
+            raise OperationalError("INSERT INTO checkins", {}, Exception("database is locked"))
+        return self.db.execute(*args, **kwargs)
+
+    def __getattr__(self, nome):
+        return getattr(self.db, nome)
+
+
+def test_falha_no_segundo_lote_nao_grava_o_primeiro_de_novo(client, criar_membro, criar_plano, criar_assinatura, monkeypatch):
+    membro = criar_membro()
+    criar_assinatura(membro["id_membro"], criar_plano()["id_plano"])
+    client.portal.call(checkins.buffer.flush)
+    for hora in ("07:00", "08:00", "09:00"):
+        assert client.post("/checkins", json={"id_membro": membro["id_membro"], "data_hora": f"2024-05-01T{hora}:00"}).status_code == 202
+    lotes = crud.lotes
+    monkeypatch.setattr(crud, "lotes", lambda itens: lotes(itens, 2))
+    monkeypatch.setattr(checkins, "SessionLocal", lambda: FalhaNoSegundoInsert(SessionLocal()))
+    with pytest.raises(crud.GravacaoParcial):
+        client.portal.call(checkins.buffer.flush)
+    assert checkins.buffer.pendentes() == 1
+    monkeypatch.undo()
+    client.portal.call(checkins.buffer.flush)
+    horas = sorted(c.data_hora.strftime("%H:%M") for c in checkins_do_membro(membro["id_membro"]))
+    assert horas == ["07:00", "08:00", "09:00"]
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+import database
+
+
+def test_forma_statement_junta_listas_de_placeholders():
+    assert database.forma_statement("SELECT *\n  FROM membros WHERE id IN (?, ?, ?)") == \
+        database.forma_statement("SELECT * FROM membros WHERE id IN (?,?)") == "SELECT * FROM membros WHERE id IN (?, ...)"
+
+
+def test_forma_statement_junta_inserts_de_varias_linhas():
+    duas = database.forma_statement("INSERT INTO checkins (id_membro, data_hora) VALUES (?, ?), (?, ?)")
+    tres = database.forma_statement("INSERT INTO checkins (id_membro, data_hora) VALUES (?, ?), (?, ?), (?, ?)")
+    assert duas == tres == "INSERT INTO checkins (id_membro, data_hora) VALUES (?, ...), ..."
+    assert database.forma_statement("INSERT INTO checkins (id_membro) VALUES (%(id_membro_m0)s), (%(id_membro_m1)s)") == \
+        "INSERT INTO checkins (id_membro) VALUES (%s), ..."
+
+
+def test_formas_guardadas_tem_limite():
+    lentas = database.ConsultasLentas(limite_ms=0, maximo=10, maximo_formas=2)
+    engine = create_engine("sqlite://")
+    lentas.instrumentar(engine)
+    with engine.connect() as con:
+        for tabela in ("a", "b", "c"):
+            con.execute(text(f"SELECT {tabela}"))
+        con.execute(text("SELECT b"))
+    engine.dispose()
+    assert sorted(f["sql"] for f in lentas.listar()["formas"]) == ["SELECT b", "SELECT c"]
+
+
+def test_mascarar_nao_expoe_valores():
+    assert database.mascarar({"nome": "Micah", "celular": 119926183, "ativo": True, "data": datetime(2024, 1, 1),
+                              "ids": [1, None]}) == \
+        {"nome": "<texto:5>", "celular": "<número>", "ativo": True, "data": "<data>", "ids": ["<número>", None]}
+
+
+def test_log_de_consultas_lentas(client, monkeypatch):
+    lentas = database.ConsultasLentas(limite_ms=0, maximo=10)
+    monkeypatch.setattr(database, "consultas_lentas", lentas)
+    engine = create_engine("sqlite://")
+    lentas.instrumentar(engine)
+    with engine.connect() as con:
+        con.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, nome TEXT)"))
+        for id in (1, 2):
+            con.execute(text("SELECT nome FROM t WHERE id = :id"), {"id": id})
+    engine.dispose()
+
+    corpo = client.get("/admin/consultas-lentas", params={"limit": 2}).json()
+    assert corpo["registradas"] == 3
+    assert [c["sql"] for c in corpo["consultas"]] == ["SELECT nome FROM t WHERE id = ?"] * 2
+    assert corpo["consultas"][0]["parametros"] == ["<número>"]
+    assert corpo["consultas"][0]["rota"] is None
+    forma = next(f for f in corpo["formas"] if f["sql"].startswith("SELECT"))
+    assert forma["ocorrencias"] == 2
+    assert forma["plano"] and "SEARCH" in str(forma["plano"])
+
+    assert client.delete("/admin/consultas-lentas").status_code == 204
+    assert client.get("/admin/consultas-lentas").json()["consultas"] == []
+
+
+#Uma consulta com stream_results ainda está sendo lida quando é registrada: fica sem EXPLAIN
+def test_consulta_com_stream_results_nao_roda_explain(monkeypatch):
+    lentas = database.ConsultasLentas(limite_ms=0, maximo=10)
+    explicadas = []
+    monkeypatch.setattr(lentas, "explicar", lambda conn, statement, parameters: explicadas.append(statement))
+    engine = create_engine("sqlite://")
+    lentas.instrumentar(engine)
+    with engine.connect() as con:
+        con.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, nome TEXT)"))
+        resultado = con.execution_options(stream_results=True).execute(text("SELECT nome FROM t WHERE id > :id"), {"id": 0})
+        resultado.fetchall()
+    engine.dispose()
+    forma = next(f for f in lentas.listar()["formas"] if f["sql"].startswith("SELECT"))
+    assert forma["plano"] is None
+    assert not any(statement.startswith("SELECT") for statement in explicadas)
@@ -0,0 +1,61 @@
+import asyncio
+
+import crud
+import crud_async
+import database
+import models
+import schemas
+from database import AsyncSessionLocal
+
+
+def rodar(corrotina):
+    async def com_sessao():
+        db = AsyncSessionLocal()
+        try:
+            return await corrotina(db)
+        finally:
+            await db.close()
+            await database.get_async_engine().dispose()
+    return asyncio.run(com_sessao())
+
+
+def test_crud_async_membros(client, criar_membro):
+    membro = criar_membro(nome="Assincrono")
+
+    async def fluxo(db):
+        nome = (await crud_async.get_membro_id(db, membro["id_membro"])).nome
+        alterado = await crud_async.update_membro(db, schemas.MembrosBase(id_membro=membro["id_membro"], nome="Alterado",
+                                                                          sobrenome="", celular=None))
+        pagina = await crud_async.get_membros(db, limit=1, after=membro["id_membro"] - 1)
+        return nome, alterado.nome, alterado.nome_busca, alterado.versao, [m.id_membro for m in pagina["items"]]
+
+    nome, alterado, busca, versao, ids = rodar(fluxo)
+    assert (nome, alterado, busca) == ("Assincrono", "Alterado", "alterado")
+    assert versao == 2
+    assert ids == [membro["id_membro"]]
+
+
+def test_crud_async_funcao_sem_versao_nativa_roda_via_run_sync(client, criar_membro):
+    criar_membro()
+    assert "contar" not in vars(crud_async)
+
+    async def fluxo(db):
+        return await crud_async.contar(db, models.Membros)
+
+    assert rodar(fluxo) >= 1
+
+
+def test_em_threadpool_expoe_crud_como_awaitable(db, criar_membro):
+    membro = criar_membro()
+    dados = crud_async.EmThreadpool(crud)
+    assert dados.LIMITE_MAXIMO == crud.LIMITE_MAXIMO
+    lido = asyncio.run(dados.get_membro_id(db, membro["id_membro"]))
+    assert lido.id_membro == membro["id_membro"]
+
+
+def test_crud_async_update_de_id_inexistente_devolve_none(client):
+    async def fluxo(db):
+        return (await crud_async.update_membro(db, schemas.MembrosBase(id_membro=999_999_999, nome="X", sobrenome="Y", celular=None)),
+                await crud_async.update_plano(db, schemas.PlanosBase(id_plano=999_999_999, nome="X", preco=1.0)))
+
+    assert rodar(fluxo) == (None, None)
@@ -0,0 +1,73 @@
+import pytest
+
+import checkins
+import models
+from database import SessionLocal
+
+
+def arquivada(id_assinatura):
+    db = SessionLocal()
+    try:
+        return db.get(models.AssinaturasArquivadas, id_assinatura)
+    finally:
+        db.close()
+
+
+def test_delete_em_lote(client, criar_membro):
+    membros = [criar_membro() for _ in range(3)]
+    ids = ",".join(str(m["id_membro"]) for m in membros[:2])
+    resposta = client.delete("/membros/delete", params={"ids": f"{ids},999999999"})
+    assert resposta.status_code == 202
+    assert resposta.json() == {"apagados": 2}
+    assert client.get(f"/membros/{membros[0]['id_membro']}").status_code == 422
+    assert client.get(f"/membros/{membros[2]['id_membro']}").status_code == 200
+
+
+def test_delete_em_lote_com_ids_invalidos_responde_422(client):
+    assert client.delete("/membros/delete", params={"ids": "1,a"}).status_code == 422
+    assert client.delete("/membros/delete", params={"ids": ","}).status_code == 422
+
+
+def test_delete_de_membro_com_assinaturas_sem_cascata_responde_409(client, criar_membro, criar_plano, criar_assinatura):
+    membro = criar_membro()
+    criar_assinatura(membro["id_membro"], criar_plano()["id_plano"])
+    assert client.delete(f"/membros/delete/{membro['id_membro']}").status_code == 409
+    assert client.get(f"/membros/{membro['id_membro']}").status_code == 200
+
+
+def test_delete_em_cascata_apaga_as_assinaturas(client, criar_membro, criar_plano, criar_assinatura):
+    membro = criar_membro()
+    assinatura = criar_assinatura(membro["id_membro"], criar_plano()["id_plano"])
+    resposta = client.delete(f"/membros/delete/{membro['id_membro']}", params={"cascata": "apagar"})
+    assert resposta.status_code == 202
+    assert client.get(f"/assinaturas/{assinatura['id_assinatura']}").status_code == 422
+    assert arquivada(assinatura["id_assinatura"]) is None
+
+
+def test_delete_em_cascata_arquiva_as_assinaturas(client, criar_membro, criar_plano, criar_assinatura):
+    membro = criar_membro()
+    assinatura = criar_assinatura(membro["id_membro"], criar_plano()["id_plano"])
+    resposta = client.delete(f"/membros/delete/{membro['id_membro']}", params={"cascata": "arquivar"})
+    assert resposta.status_code == 202
+    assert client.get(f"/assinaturas/{assinatura['id_assinatura']}").status_code == 422
+    assert arquivada(assinatura["id_assinatura"]).id_membro == membro["id_membro"]
+
+
+@pytest.mark.parametrize("cascata", ["apagar", "arquivar"])
+def test_delete_em_cascata_de_membro_com_checkins(client, criar_membro, criar_plano, criar_assinatura, cascata):
+    membro = criar_membro()
+    criar_assinatura(membro["id_membro"], criar_plano()["id_plano"])
+    assert client.post("/checkins", json={"id_membro": membro["id_membro"]}).status_code == 202
+    client.portal.call(checkins.buffer.flush)
+    resposta = client.delete(f"/membros/delete/{membro['id_membro']}", params={"cascata": cascata})
+    assert resposta.status_code == 202
+    assert client.get(f"/membros/{membro['id_membro']}").status_code == 422
+    db = SessionLocal()
+    try:
+        assert db.query(models.Checkins).filter(models.Checkins.id_membro == membro["id_membro"]).count() == 0
+    finally:
+        db.close()
+
+
+def test_delete_de_membro_inexistente_responde_422(client):
+    assert client.delete("/membros/delete/999999999").status_code == 422
@@ -0,0 +1,47 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def contar_queries(client, *args, **kwargs):
+    statements = []
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(Engine, "before_cursor_execute", contar)
+    try:
+        resposta = client.get(*args, **kwargs)
+    finally:
+        event.remove(Engine, "before_cursor_execute", contar)
+    assert resposta.status_code == 200, resposta.text
+    return resposta, len(statements)
+
+
+def test_expand_inclui_membro_e_plano(client, criar_membro, criar_plano, criar_assinatura):
+    membro, plano = criar_membro(nome="Expandido"), criar_plano()
+    assinatura = criar_assinatura(membro["id_membro"], plano["id_plano"])
+    resposta = client.get(f"/assinaturas/{assinatura['id_assinatura']}", params={"expand": "membro,plano"})
+    assert resposta.status_code == 200
+    corpo = resposta.json()
+    assert corpo["membro"]["nome"] == "Expandido"
+    assert corpo["plano"]["id_plano"] == plano["id_plano"]
+    corpo = client.get(f"/assinaturas/{assinatura['id_assinatura']}").json()
+    assert corpo.get("membro") is None and corpo.get("plano") is None
+
+
+def test_expand_invalido_responde_422(client):
+    resposta = client.get("/assinaturas", params={"expand": "membro,pagamentos"})
+    assert resposta.status_code == 422
+    assert "pagamentos" in resposta.json()["detail"]
+
+
+def test_expand_nao_faz_uma_query_por_linha(client, criar_membro, criar_plano, criar_assinatura):
+    plano = criar_plano()
+    primeira = None
+    for _ in range(10):
+        assinatura = criar_assinatura(criar_membro()["id_membro"], plano["id_plano"])
+        primeira = primeira or assinatura["id_assinatura"]
+    after = primeira - 1
+    pequena, queries_pequena = contar_queries(client, "/assinaturas", params={"limit": 2, "after": after, "expand": "membro,plano"})
+    grande, queries_grande = contar_queries(client, "/assinaturas", params={"limit": 10, "after": after, "expand": "membro,plano"})
+    assert len(pequena.json()["items"]) == 2 and len(grande.json()["items"]) == 10
+    assert all(item["membro"] and item["plano"] for item in grande.json()["items"])
+    assert queries_pequena == queries_grande
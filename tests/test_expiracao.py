@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+
+import database
+import expiracao
+import migracoes
+
+
+def ativo(client, assinatura):
+    return client.get(f"/assinaturas/{assinatura['id_assinatura']}").json()["ativo"]
+
+
+def test_expiracao_desativa_so_as_vencidas(client, criar_membro, criar_plano, criar_assinatura):
+    mensal, sem_vencimento = criar_plano(duracao_dias=30), criar_plano()
+    antiga = datetime.now().replace(microsecond=0) - timedelta(days=60)
+    vencida = criar_assinatura(criar_membro()["id_membro"], mensal["id_plano"], data_ativacao=antiga)
+    recente = criar_assinatura(criar_membro()["id_membro"], mensal["id_plano"])
+    eterna = criar_assinatura(criar_membro()["id_membro"], sem_vencimento["id_plano"], data_ativacao=antiga)
+    resposta = client.post("/admin/expiracao")
+    assert resposta.status_code == 200
+    assert resposta.json()["expiradas"] >= 1
+    assert (ativo(client, vencida), ativo(client, recente), ativo(client, eterna)) == (False, True, True)
+    assert client.get("/admin/expiracao").json() == resposta.json()
+
+
+def test_expiracao_em_lotes(client, criar_membro, criar_plano, criar_assinatura):
+    expiracao.expirar()
+    plano = criar_plano(duracao_dias=1)
+    antiga = datetime.now().replace(microsecond=0) - timedelta(days=5)
+    assinaturas = [criar_assinatura(criar_membro()["id_membro"], plano["id_plano"], data_ativacao=antiga) for _ in range(5)]
+    resultado = expiracao.expirar(tamanho_lote=2)
+    assert resultado["expiradas"] == 5
+    assert resultado["lotes"] == 3
+    assert not any(ativo(client, assinatura) for assinatura in assinaturas)
+
+
+def test_migracao_cria_o_indice_de_data_ativacao(client):
+    with database.get_engine().begin() as con:
+        con.execute(text("DROP INDEX ix_assinaturas_data_ativacao"))
+    assert migracoes.indices_assinaturas() == {"indices": ["ix_assinaturas_data_ativacao"]}
+    nomes = {indice["name"] for indice in inspect(database.get_engine()).get_indexes("assinaturas")}
+    assert "ix_assinaturas_data_ativacao" in nomes
+    assert migracoes.indices_assinaturas() == {"indices": []}
+
+
+def test_migracao_cria_o_indice_composto_da_expiracao(client):
+    with database.get_engine().begin() as con:
+        con.execute(text("DROP INDEX ix_assinaturas_ativo_plano_data"))
+    assert migracoes.indices_assinaturas() == {"indices": ["ix_assinaturas_ativo_plano_data"]}
+    with database.get_engine().connect() as con:
+        plano = con.execute(text("EXPLAIN QUERY PLAN SELECT id_assinatura FROM assinaturas "
+                                 "WHERE ativo = 1 AND id_plano = 1 AND data_ativacao < '2024-01-01' "
+                                 "ORDER BY data_ativacao LIMIT 10")).all()
+    detalhes = " ".join(linha[-1] for linha in plano)
+    assert "ix_assinaturas_ativo_plano_data" in detalhes
+    assert "TEMP B-TREE" not in detalhes
+
+
+def test_script_do_mysql_tem_os_indices_da_expiracao():
+    with open(migracoes.sql_script_path) as f:
+        script = f.read()
+    assert "INDEX ix_assinaturas_data_ativacao (data_ativacao)" in script
+    assert "INDEX ix_assinaturas_ativo_plano_data (ativo, id_plano, data_ativacao)" in script
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+
+from starlette.requests import Request
+
+import admissao
+import crud
+import database
+import main
+import schemas
+
+
+def test_export_ndjson(client, criar_membro, criar_plano, criar_assinatura):
+    membro, plano = criar_membro(nome="Exportado"), criar_plano(preco=89.9)
+    assinatura = criar_assinatura(membro["id_membro"], plano["id_plano"])
+    resposta = client.get("/assinaturas/export")
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"].startswith("application/x-ndjson")
+    assert resposta.headers["content-disposition"] == "attachment; filename=assinaturas.ndjson"
+    linhas = [json.loads(linha) for linha in resposta.text.splitlines()]
+    assert [linha["id_assinatura"] for linha in linhas] == sorted(linha["id_assinatura"] for linha in linhas)
+    exportada = next(linha for linha in linhas if linha["id_assinatura"] == assinatura["id_assinatura"])
+    assert exportada["nome_membro"] == "Exportado"
+    assert exportada["nome_plano"] == plano["nome"]
+    assert float(exportada["preco"]) == 89.9
+
+
+def test_export_csv_tem_cabecalho(client, criar_membro, criar_plano, criar_assinatura):
+    membro, plano = criar_membro(), criar_plano()
+    assinatura = criar_assinatura(membro["id_membro"], plano["id_plano"])
+    resposta = client.get("/assinaturas/export", params={"format": "csv"})
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"].startswith("text/csv")
+    linhas = list(csv.reader(io.StringIO(resposta.text)))
+    assert linhas[0] == [coluna.key for coluna in crud.COLUNAS_EXPORT]
+    assert str(assinatura["id_assinatura"]) in {linha[0] for linha in linhas[1:]}
+
+
+def test_export_formato_invalido_responde_422(client):
+    assert client.get("/assinaturas/export", params={"format": "xml"}).status_code == 422
+
+
+#Um cliente que desconecta no meio do streaming: o gerador é fechado na hora e devolve a conexão ao pool
+def test_export_interrompido_devolve_a_conexao(client, monkeypatch, criar_membro, criar_plano, criar_assinatura):
+    plano = criar_plano()
+    for _ in range(3):
+        criar_assinatura(criar_membro()["id_membro"], plano["id_plano"])
+    monkeypatch.setattr(crud, "TAMANHO_LOTE", 1)
+    request = Request({"type": "http", "method": "GET", "path": "/assinaturas/export", "headers": [], "query_string": b""})
+
+    async def interromper():
+        resposta = await main.export_assinaturas(request, schemas.FormatoExport.ndjson)
+        await resposta.body_iterator.__anext__()
+        em_uso = database.estatisticas_pools()["sync"]["em_uso"]
+        await resposta.body_iterator.aclose()
+        return em_uso, database.estatisticas_pools()["sync"]["em_uso"], admissao.controle.em_andamento
+
+    assert client.portal.call(interromper) == (1, 0, 0)
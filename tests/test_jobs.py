@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+import time
+
+import crud
+import jobs
+from database import SessionLocal
+
+
+def esperar(client, id_job, timeout=60):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        job = client.get(f"/jobs/{id_job}").json()
+        if job["estado"] in ("concluido", "falhou"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"job {id_job} não terminou: {job}")
+
+
+def test_job_de_relatorio_de_membros(client, criar_membro):
+    membro = criar_membro(nome="Relatorio")
+    resposta = client.post("/jobs/membros", params={"format": "csv"})
+    assert resposta.status_code == 202, resposta.text
+    job = resposta.json()
+    assert resposta.headers["Location"] == f"/jobs/{job['id_job']}"
+    assert (job["estado"], job["parametros"], job["resultado"]) == ("pendente", {"formato": "csv"}, None)
+
+    job = esperar(client, job["id_job"])
+    assert job["estado"] == "concluido", job["erro"]
+    assert job["progresso"] == 1
+    assert job["resultado"] == f"/jobs/{job['id_job']}/resultado"
+    arquivo = client.get(job["resultado"])
+    assert arquivo.status_code == 200
+    assert arquivo.headers["content-type"].startswith("text/csv")
+    linhas = list(csv.reader(io.StringIO(arquivo.text)))
+    assert linhas[0] == [coluna.key for coluna in crud.COLUNAS_RELATORIO_MEMBROS]
+    assert len(linhas) - 1 == job["linhas"]
+    assert str(membro["id_membro"]) in {linha[0] for linha in linhas[1:]}
+
+
+def test_job_de_coortes(client):
+    job = client.post("/jobs/coortes", params={"meses": 3}).json()
+    assert job["parametros"] == {"formato": "json", "meses": 3}
+    job = esperar(client, job["id_job"])
+    assert job["estado"] == "concluido", job["erro"]
+    resultado = json.loads(client.get(job["resultado"]).text)
+    assert {"coortes", "churn", "trocas_de_plano"} <= resultado.keys()
+
+
+def test_resultado_de_job_nao_concluido_responde_409(client):
+    db = SessionLocal()
+    try:
+        id_job = crud.create_job(db, relatorio="membros", parametros={"formato": "ndjson"}).id_job
+        assert client.get(f"/jobs/{id_job}/resultado").status_code == 409
+        crud.falhar_job(db, id_job, "cancelado pelo teste")
+    finally:
+        db.close()
+    assert client.get("/jobs/naoexiste").status_code == 422
+
+
+def test_limite_de_jobs_abertos_responde_429(client, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_ABERTOS", 0)
+    resposta = client.post("/jobs/assinaturas")
+    assert resposta.status_code == 429
+    assert resposta.headers["Retry-After"] == str(jobs.ESPERA_LIMITE)
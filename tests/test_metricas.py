@@ -0,0 +1,32 @@
+import metricas
+
+
+def queries_da_rota(metodo, rota):
+    histograma = metricas.metricas.queries[(metodo, rota)]
+    return histograma.soma, histograma.total
+
+
+#O BEGIN do SQLite ajustado não conta: a leitura de um membro é um único SELECT, e a criação é a checagem
+#do celular, o INSERT e o refresh
+def test_queries_por_requisicao(client, criar_membro):
+    membro = criar_membro()
+    client.get(f"/membros/{membro['id_membro']}")
+    soma, total = queries_da_rota("GET", "/membros/{id_membro}")
+    client.get(f"/membros/{membro['id_membro']}")
+    assert queries_da_rota("GET", "/membros/{id_membro}") == (soma + 1, total + 1)
+    soma, total = queries_da_rota("POST", "/membros/create")
+    criar_membro()
+    assert queries_da_rota("POST", "/membros/create") == (soma + 3, total + 1)
+
+
+def test_metrics_em_texto_do_prometheus(client, criar_membro):
+    membro = criar_membro()
+    client.get(f"/membros/{membro['id_membro']}")
+    resposta = client.get("/metrics")
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"].startswith("text/plain")
+    texto = resposta.text
+    assert 'http_requisicoes_total{metodo="GET",rota="/membros/{id_membro}",status="200"}' in texto
+    assert 'db_queries_por_requisicao_count{metodo="GET",rota="/membros/{id_membro}"}' in texto
+    assert "# TYPE http_latencia_segundos histogram" in texto
+    assert "# TYPE db_queries_total counter" in texto
@@ -0,0 +1,72 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import PASTA, RAIZ
+
+#O schema da primeira versão do projeto (assets/db_script.sql original), no dialeto do SQLite
+SCHEMA_ORIGINAL = """
+CREATE TABLE membros (id_membro INTEGER PRIMARY KEY, nome VARCHAR(30) NOT NULL, sobrenome VARCHAR(30) NOT NULL, celular BIGINT);
+CREATE TABLE planos (id_plano INTEGER PRIMARY KEY, nome VARCHAR(30) NOT NULL, preco VARCHAR(30) NOT NULL);
+CREATE TABLE assinaturas (id_assinatura INTEGER PRIMARY KEY, id_membro INT NOT NULL REFERENCES membros(id_membro),
+                          id_plano INT NOT NULL REFERENCES planos(id_plano), data_ativacao DATETIME NOT NULL, ativo TINYINT NOT NULL);
+INSERT INTO membros(nome, sobrenome, celular) VALUES ('Micah', 'Zassim', 55554433), ('Flip', 'Liporg', 6942314), ('Ádin', 'Samura', 119926183);
+INSERT INTO planos(nome, preco) VALUES ('diario', 50), ('mensal', 150), ('semestral', 600);
+INSERT INTO assinaturas(id_membro, id_plano, data_ativacao, ativo) VALUES (1, 2, '2001-12-12 00:00:00', 1), (2, 1, '2001-12-12 00:00:00', 1), (3, 3, '2001-12-12 00:00:00', 0);
+"""
+
+
+def preparar(arquivo):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{arquivo}", ASYNC_DATABASE_URL=f"sqlite+aiosqlite:///{arquivo}")
+    codigo = "import json, migracoes; print(json.dumps(migracoes.preparar(), default=str))"
+    resultado = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=env, capture_output=True, text=True, timeout=120)
+    assert resultado.returncode == 0, resultado.stderr
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+def test_migra_o_schema_original():
+    arquivo = os.path.join(PASTA, "original.sqlite")
+    with sqlite3.connect(arquivo) as con:
+        con.executescript(SCHEMA_ORIGINAL)
+    resultado = preparar(arquivo)
+    assert resultado["banco_criado"] is False
+    assert resultado["versionamento"] == {"membros": ["versao"], "planos": ["versao"], "assinaturas": ["versao"]}
+    assert resultado["busca_membros"]["linhas"] == 3
+    assert resultado["duracao_planos"] == {"colunas": ["duracao_dias"]}
+    assert "ix_assinaturas_data_ativacao" in resultado["indices_assinaturas"]["indices"]
+
+    con = sqlite3.connect(arquivo)
+    try:
+        membros = con.execute("SELECT nome_busca, sobrenome_busca, versao FROM membros ORDER BY id_membro").fetchall()
+        assert membros == [("micah", "zassim", 1), ("flip", "liporg", 1), ("adin", "samura", 1)]
+        assert con.execute("SELECT count(*) FROM assinaturas WHERE versao = 1").fetchone() == (3,)
+        tabelas = {nome for (nome,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {"checkins", "assinaturas_arquivadas", "versoes_cache", "jobs"} <= tabelas
+    finally:
+        con.close()
+
+    #Rodar de novo não altera nada
+    resultado = preparar(arquivo)
+    assert resultado["versionamento"] == {"membros": [], "planos": [], "assinaturas": []}
+    assert resultado["busca_membros"] == {"colunas": [], "indices": [], "linhas": 0, "celulares_duplicados": []}
+    assert resultado["indices_assinaturas"] == {"indices": []}
+
+
+#Celulares repetidos não derrubam a migração: o índice único fica de fora e os repetidos são reportados
+def test_migracao_com_celulares_duplicados():
+    arquivo = os.path.join(PASTA, "duplicados.sqlite")
+    with sqlite3.connect(arquivo) as con:
+        con.executescript(SCHEMA_ORIGINAL)
+        con.execute("INSERT INTO membros(nome, sobrenome, celular) VALUES ('Outro', 'Micah', 55554433), ('Sem', 'Celular', NULL), ('Sem', 'Celular', NULL)")
+    resultado = preparar(arquivo)
+    assert resultado["busca_membros"]["celulares_duplicados"] == [55554433]
+    assert "ix_membros_celular" not in resultado["busca_membros"]["indices"]
+    assert resultado["busca_membros"]["linhas"] == 6
+
+    #Corrigidos os repetidos, a próxima execução cria o índice
+    with sqlite3.connect(arquivo) as con:
+        con.execute("UPDATE membros SET celular = NULL WHERE nome = 'Outro'")
+    resultado = preparar(arquivo)
+    assert resultado["busca_membros"] == {"colunas": [], "indices": ["ix_membros_celular"], "linhas": 0, "celulares_duplicados": []}
@@ -0,0 +1,30 @@
+import crud
+
+
+def test_percorre_membros_por_cursor(client, criar_membro):
+    criados = [criar_membro()["id_membro"] for _ in range(5)]
+    after = criados[0] - 1
+    vistos = []
+    while True:
+        pagina = client.get(f"/membros/?limit=2&after={after}").json()
+        assert len(pagina["items"]) <= 2
+        vistos += [membro["id_membro"] for membro in pagina["items"]]
+        if pagina["next_cursor"] is None:
+            break
+        assert pagina["next_cursor"] == pagina["items"][-1]["id_membro"]
+        after = pagina["next_cursor"]
+    assert vistos == sorted(set(vistos))
+    assert vistos[:5] == criados
+
+
+def test_limit_e_limitado_pelo_servidor(client, criar_membro, monkeypatch):
+    for _ in range(3):
+        criar_membro()
+    monkeypatch.setattr(crud, "LIMITE_MAXIMO", 2)
+    pagina = client.get("/membros/?limit=50").json()
+    assert len(pagina["items"]) == 2
+    assert pagina["next_cursor"] is not None
+
+
+def test_limit_invalido(client):
+    assert client.get("/membros/?limit=0").status_code == 422
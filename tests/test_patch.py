@@ -0,0 +1,55 @@
+def test_patch_aplica_so_os_campos_enviados(client, criar_membro):
+    membro = criar_membro(nome="Parcial", sobrenome="Original")
+    resposta = client.patch(f"/membros/update/{membro['id_membro']}", json={"sobrenome": "Novo"})
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json() == {"id_membro": membro["id_membro"], "sobrenome": "Novo"}
+    lido = client.get(f"/membros/{membro['id_membro']}").json()
+    assert (lido["nome"], lido["sobrenome"], lido["celular"]) == ("Parcial", "Novo", membro["celular"])
+    assert lido["versao"] == membro["versao"] + 1
+
+
+def test_patch_atualiza_as_colunas_de_busca(client, criar_membro):
+    membro = criar_membro()
+    client.patch(f"/membros/update/{membro['id_membro']}", json={"nome": "Úrsula Patch"})
+    ids = [m["id_membro"] for m in client.get("/membros/search", params={"q": "ursula"}).json()]
+    assert membro["id_membro"] in ids
+
+
+def test_patch_invalido_responde_422(client, criar_plano):
+    plano = criar_plano()
+    assert client.patch(f"/planos/update/{plano['id_plano']}", json={}).status_code == 422
+    assert client.patch(f"/planos/update/{plano['id_plano']}", json={"preco": None}).status_code == 422
+    resposta = client.patch("/planos/update/999999999", json={"preco": 1.0})
+    assert resposta.status_code == 422
+    assert resposta.json()["detail"] == "Plano não encontrado"
+
+
+def test_patch_com_if_match(client, criar_plano):
+    plano = criar_plano()
+    resposta = client.patch(f"/planos/update/{plano['id_plano']}", json={"duracao_dias": 90},
+                            headers={"If-Match": f'"{plano["versao"]}"'})
+    assert resposta.status_code == 200
+    assert resposta.headers["ETag"] == f'"{plano["versao"] + 1}"'
+    resposta = client.patch(f"/planos/update/{plano['id_plano']}", json={"duracao_dias": 30},
+                            headers={"If-Match": f'"{plano["versao"]}"'})
+    assert resposta.status_code == 412
+
+
+def test_patch_bulk_de_assinaturas_por_plano(client, criar_membro, criar_plano, criar_assinatura):
+    antigo, novo = criar_plano(), criar_plano()
+    assinaturas = [criar_assinatura(criar_membro()["id_membro"], antigo["id_plano"]) for _ in range(3)]
+    resposta = client.patch("/assinaturas/update", json={"id_plano_atual": antigo["id_plano"],
+                                                         "valores": {"id_plano": novo["id_plano"]}})
+    assert resposta.json() == {"atualizados": 3}
+    for assinatura in assinaturas:
+        assert client.get(f"/assinaturas/{assinatura['id_assinatura']}").json()["id_plano"] == novo["id_plano"]
+    resposta = client.patch("/assinaturas/update", json={"valores": {"ativo": False}})
+    assert resposta.status_code == 422
+
+
+def test_patch_bulk_de_membros_por_ids(client, criar_membro):
+    membros = [criar_membro() for _ in range(2)]
+    resposta = client.patch("/membros/update", json={"ids": [m["id_membro"] for m in membros] + [999999999],
+                                                     "valores": {"sobrenome": "Emlote"}})
+    assert resposta.json() == {"atualizados": 2}
+    assert {client.get(f"/membros/{m['id_membro']}").json()["sobrenome"] for m in membros} == {"Emlote"}
@@ -0,0 +1,31 @@
+from database import SessionLocal
+
+
+def test_admin_pool_mostra_os_engines_criados(client, criar_membro):
+    criar_membro()
+    client.get("/membros/", params={"limit": 1})
+    pools = client.get("/admin/pool").json()
+    assert {"sync", "leitura"} <= pools.keys()
+    escritor = pools["sync"]
+    assert escritor["tamanho"] == 1
+    assert escritor["em_uso"] == 0
+    assert escritor["checkouts"] >= 1
+    assert set(escritor) == {"tamanho", "em_uso", "livres", "overflow", "checkouts", "timeouts",
+                             "espera_total_s", "espera_maxima_s"}
+
+
+def test_admin_pool_conta_conexoes_em_uso(client):
+    db = SessionLocal()
+    try:
+        db.connection()
+        assert client.get("/admin/pool").json()["sync"]["em_uso"] == 1
+    finally:
+        db.close()
+    assert client.get("/admin/pool").json()["sync"]["em_uso"] == 0
+
+
+def test_metrics_exporta_as_metricas_do_pool(client):
+    client.get("/membros/", params={"limit": 1})
+    texto = client.get("/metrics").text
+    assert "# TYPE db_pool_checkouts_total counter" in texto
+    assert 'db_pool_conexoes_em_uso{engine="sync"} 0' in texto
@@ -0,0 +1,31 @@
+from decimal import Decimal
+
+
+def plano_no_relatorio(client, rota, id_plano):
+    resposta = client.get(rota)
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json(), next(p for p in resposta.json()["planos"] if p["id_plano"] == id_plano)
+
+
+def test_relatorio_ativos_conta_so_as_assinaturas_ativas(client, criar_membro, criar_plano, criar_assinatura):
+    plano = criar_plano()
+    membro, outro = criar_membro(), criar_membro()
+    criar_assinatura(membro["id_membro"], plano["id_plano"])
+    criar_assinatura(membro["id_membro"], plano["id_plano"])
+    criar_assinatura(outro["id_membro"], plano["id_plano"], ativo=False)
+    relatorio, linha = plano_no_relatorio(client, "/relatorios/ativos", plano["id_plano"])
+    assert linha["membros_ativos"] == 1
+    assert linha["assinaturas_ativas"] == 2
+    assert relatorio["membros_ativos"] >= 1
+
+
+def test_relatorio_receita_soma_preco_das_ativas(client, criar_membro, criar_plano, criar_assinatura):
+    plano, vazio = criar_plano(preco=49.9), criar_plano(preco=10.0)
+    for ativo in (True, True, False):
+        criar_assinatura(criar_membro()["id_membro"], plano["id_plano"], ativo=ativo)
+    relatorio, linha = plano_no_relatorio(client, "/relatorios/receita", plano["id_plano"])
+    assert linha["assinaturas_ativas"] == 2
+    assert Decimal(str(linha["receita_mensal"])) == Decimal("99.80")
+    _, linha_vazio = plano_no_relatorio(client, "/relatorios/receita", vazio["id_plano"])
+    assert linha_vazio["assinaturas_ativas"] == 0
+    assert Decimal(str(relatorio["receita_mensal"])) == sum(Decimal(str(p["receita_mensal"])) for p in relatorio["planos"])
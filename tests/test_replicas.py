@@ -0,0 +1,49 @@
+import os
+import sqlite3
+
+import pytest
+
+import database
+from conftest import ARQUIVO, PASTA
+
+
+#A "réplica" é uma cópia do arquivo de testes: o que for escrito depois da cópia só existe no primário
+@pytest.fixture
+def replica(client, monkeypatch):
+    copia = os.path.join(PASTA, "replica.sqlite")
+    origem, destino = sqlite3.connect(ARQUIVO), sqlite3.connect(copia)
+    try:
+        origem.backup(destino)
+    finally:
+        origem.close()
+        destino.close()
+    monkeypatch.setattr(database, "REPLICA_URLS", [f"sqlite:///{copia}"])
+    monkeypatch.setattr(database, "JANELA_PRIMARIO", 60)
+    monkeypatch.setattr(database, "janela_primario", database.JanelaPrimario(60))
+    yield
+    client.cookies.clear()
+    with database._lock_engines:
+        engine = database._engines.pop("replica_0", None)
+    if engine is not None:
+        engine.dispose()
+    os.remove(copia)
+
+
+def test_leituras_vao_para_a_replica(client, criar_membro, replica):
+    membro = criar_membro()
+    client.cookies.clear()
+    assert client.get(f"/membros/{membro['id_membro']}", headers={"X-Cliente-Id": "outro"}).status_code == 422
+    assert "replica_0" in client.get("/admin/pool").json()
+
+
+def test_cliente_que_escreveu_le_do_primario(client, criar_membro, replica):
+    resposta = client.post("/membros/create", headers={"X-Cliente-Id": "escritor"},
+                           json={"id_membro": 0, "nome": "Janela", "sobrenome": "Primario", "celular": None})
+    assert resposta.status_code == 201
+    assert resposta.cookies.get("le_primario") == "1"
+    id_membro = resposta.json()["id_membro"]
+    client.cookies.clear()
+    assert client.get(f"/membros/{id_membro}", headers={"X-Cliente-Id": "escritor"}).status_code == 200
+    assert client.get(f"/membros/{id_membro}", headers={"X-Cliente-Id": "outro"}).status_code == 422
+    client.cookies.set("le_primario", "1")
+    assert client.get(f"/membros/{id_membro}", headers={"X-Cliente-Id": "outro"}).status_code == 200
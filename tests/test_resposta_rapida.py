@@ -0,0 +1,19 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("rota", ["/membros/", "/assinaturas/", "/assinaturas/?include_archived=true"])
+def test_resposta_rapida_tem_o_mesmo_corpo_e_etag(client, rota, monkeypatch, criar_membro, criar_plano, criar_assinatura):
+    membro, plano = criar_membro(), criar_plano()
+    criar_assinatura(membro["id_membro"], plano["id_plano"])
+    criar_assinatura(membro["id_membro"], plano["id_plano"], ativo=False)
+    params = {"limit": 5}
+    normal = client.get(rota, params=params)
+    monkeypatch.setattr(main, "RESPOSTA_RAPIDA", True)
+    rapida = client.get(rota, params=params)
+    assert rapida.status_code == normal.status_code == 200
+    assert rapida.json() == normal.json()
+    assert rapida.headers["ETag"] == normal.headers["ETag"]
+    assert rapida.headers["content-type"] == "application/json"
+    assert client.get(rota, params=params, headers={"If-None-Match": normal.headers["ETag"]}).status_code == 304
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import database
+from conftest import PASTA, RAIZ
+
+
+def pragma(engine, nome):
+    with engine.connect() as con:
+        return con.exec_driver_sql(f"PRAGMA {nome}").scalar()
+
+
+def test_escritor_com_os_ajustes(client):
+    escritor = database.get_engine()
+    assert pragma(escritor, "journal_mode") == "wal"
+    assert pragma(escritor, "foreign_keys") == 1
+    assert pragma(escritor, "synchronous") == 1
+    assert pragma(escritor, "busy_timeout") == database.SQLITE_BUSY_MS
+    assert pragma(escritor, "query_only") == 0
+    assert escritor.pool.size() == 1
+
+
+def test_leitor_e_somente_leitura(client):
+    leitor = database.get_engine_replica()
+    assert leitor is not database.get_engine()
+    assert pragma(leitor, "query_only") == 1
+    with pytest.raises(OperationalError):
+        with leitor.begin() as con:
+            con.execute(text("DELETE FROM membros WHERE id_membro = -1"))
+
+
+def test_chave_estrangeira_violada_responde_409(client, criar_membro, criar_plano, criar_assinatura):
+    assinatura = criar_assinatura(criar_membro()["id_membro"], criar_plano()["id_plano"])
+    resposta = client.patch(f"/assinaturas/update/{assinatura['id_assinatura']}", json={"id_membro": 999_999_999})
+    assert resposta.status_code == 409
+    assert client.get(f"/assinaturas/{assinatura['id_assinatura']}").json()["id_membro"] == assinatura["id_membro"]
+
+
+#Um arquivo novo em DB_SQLITE, numa pasta que ainda não existe, no modo assíncrono: o lifespan cria o banco
+#com os dados de exemplo (pelo engine síncrono das migrações), e as leituras vão para o engine de leitura assíncrono
+def test_bootstrap_de_um_arquivo_novo():
+    arquivo = os.path.join(PASTA, "novo", "academia.sqlite")
+    env = dict(os.environ, DB_SQLITE=arquivo, ASYNC_DB="1", DB_BOOTSTRAP="1")
+    env.pop("DATABASE_URL", None)
+    env.pop("ASYNC_DATABASE_URL", None)
+    codigo = "\n".join([
+        "from fastapi.testclient import TestClient",
+        "import main",
+        "with TestClient(main.app) as client:",
+        "    print(len(client.get('/membros/').json()['items']))",
+        "    print(client.post('/membros/create', json={'id_membro': 0, 'nome': 'Novo', 'sobrenome': 'Arquivo', 'celular': None}).status_code)",
+        "    print(len(client.get('/membros/').json()['items']))",
+        "    print(','.join(sorted(client.get('/admin/pool').json())))",
+    ])
+    resultado = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=env, capture_output=True, text=True, timeout=120)
+    assert resultado.returncode == 0, resultado.stderr
+    assert resultado.stdout.split() == ["3", "201", "4", "async,async_leitura,sync"]
@@ -0,0 +1,73 @@
+def test_put_membro_nao_expoe_as_colunas_de_busca(client, criar_membro):
+    membro = criar_membro()
+    resposta = client.put(f"/membros/update/{membro['id_membro']}",
+                          json={"id_membro": 0, "nome": "Renomeado", "sobrenome": "", "celular": None})
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json() == {**membro, "nome": "Renomeado", "versao": membro["versao"] + 1}
+    assert client.get("/membros/search", params={"q": "renomeado"}).json()[0]["id_membro"] == membro["id_membro"]
+
+
+def test_put_plano_responde_no_schema_do_plano(client, criar_plano):
+    plano = criar_plano()
+    resposta = client.put(f"/planos/update/{plano['id_plano']}",
+                          json={"id_plano": 0, "nome": "", "preco": 55.5, "duracao_dias": 30})
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json() == {**plano, "preco": 55.5, "duracao_dias": 30, "versao": plano["versao"] + 1}
+
+
+def test_put_assinatura_responde_no_schema_da_assinatura(client, criar_membro, criar_plano, criar_assinatura):
+    membro, plano = criar_membro(), criar_plano()
+    assinatura = criar_assinatura(membro["id_membro"], plano["id_plano"])
+    resposta = client.put(f"/assinaturas/update/{assinatura['id_assinatura']}", json={**assinatura, "ativo": False})
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json() == {**assinatura, "ativo": False, "versao": assinatura["versao"] + 1}
+
+
+def test_put_de_id_inexistente_responde_422(client):
+    membro = {"id_membro": 0, "nome": "X", "sobrenome": "Y", "celular": None}
+    plano = {"id_plano": 0, "nome": "X", "preco": 1.0, "duracao_dias": None}
+    assinatura = {"id_assinatura": 0, "id_membro": 1, "id_plano": 1, "ativo": True, "data_ativacao": "2024-01-01T00:00:00"}
+    for rota, corpo, detalhe in [("/membros/update/999999999", membro, "Membro não encontrado"),
+                                 ("/planos/update/999999999", plano, "Plano não encontrado"),
+                                 ("/assinaturas/update/999999999", assinatura, "Assinatura não encontrada")]:
+        resposta = client.put(rota, json=corpo)
+        assert resposta.status_code == 422, rota
+        assert resposta.json()["detail"] == detalhe
+
+
+def test_get_com_if_none_match_responde_304(client, criar_membro):
+    membro = criar_membro()
+    resposta = client.get(f"/membros/{membro['id_membro']}")
+    etag = resposta.headers["ETag"]
+    assert etag == f'"{membro["versao"]}"'
+    nao_modificado = client.get(f"/membros/{membro['id_membro']}", headers={"If-None-Match": etag})
+    assert nao_modificado.status_code == 304
+    assert nao_modificado.headers["ETag"] == etag
+    client.patch(f"/membros/update/{membro['id_membro']}", json={"nome": "Mudou"})
+    assert client.get(f"/membros/{membro['id_membro']}", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_put_com_if_match(client, criar_membro):
+    membro = criar_membro()
+    corpo = {"id_membro": 0, "nome": "Condicional", "sobrenome": "", "celular": None}
+    etag = client.get(f"/membros/{membro['id_membro']}").headers["ETag"]
+    resposta = client.put(f"/membros/update/{membro['id_membro']}", json=corpo, headers={"If-Match": etag})
+    assert resposta.status_code == 200
+    assert resposta.headers["ETag"] == f'"{membro["versao"] + 1}"'
+    assert client.put(f"/membros/update/{membro['id_membro']}", json=corpo, headers={"If-Match": etag}).status_code == 412
+    assert client.put(f"/membros/update/{membro['id_membro']}", json=corpo, headers={"If-Match": '"abc"'}).status_code == 412
+
+
+#If-Match: * só exige que a entidade exista
+def test_put_com_if_match_qualquer_versao(client, criar_membro):
+    membro = criar_membro()
+    corpo = {"id_membro": 0, "nome": "Qualquer", "sobrenome": "", "celular": None}
+    client.patch(f"/membros/update/{membro['id_membro']}", json={"nome": "Mudou"})
+    resposta = client.put(f"/membros/update/{membro['id_membro']}", json=corpo, headers={"If-Match": "*"})
+    assert resposta.status_code == 200
+    assert resposta.json()["nome"] == "Qualquer"
+    resposta = client.patch(f"/membros/update/{membro['id_membro']}", json={"nome": "De novo"}, headers={"If-Match": "*"})
+    assert resposta.status_code == 200
+    resposta = client.put("/membros/update/999999999", json=corpo, headers={"If-Match": "*"})
+    assert resposta.status_code == 422
+    assert resposta.json()["detail"] == "Membro não encontrado"